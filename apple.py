@@ -1,5 +1,13 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
+from expressions import evaluate_expressions
+from recode import lookup, parse_literal
+from outliers import segmented_rolling
+from robust_outliers import robust_outliers
+from edit_history import EditHistory
+from column_stats import StatsIndex
+from routine_dtypes import compact_routine_frame, format_memory_report
 import matplotlib.pyplot as plt
 import io
 import seaborn as sns
@@ -22,8 +30,8 @@ if 'saved_df' not in st.session_state:
 if 'dfs' not in st.session_state:
     st.session_state.dfs = []
 
-if 'history' not in st.session_state:
-    st.session_state.history = []
+if 'edit_history' not in st.session_state:
+    st.session_state.edit_history = EditHistory()
 
 # Function to save updated data to session state
 #def #save_data():
@@ -32,32 +40,42 @@ if 'history' not in st.session_state:
     #else:
         #st.warning("No data available to save.")
 
-# Function to save updated data to session state and keep history for undo
+# Function to save updated data to session state and record it for undo/redo
 def save_data():
     if st.session_state.df is not None:
-        if 'history' not in st.session_state:
-            st.session_state.history = []
-
-        # Save the current state before making any changes
-        st.session_state.history.append(st.session_state.df.copy())
-
-        # Limit the history to the last 5 changes
-        if len(st.session_state.history) > 5:
-            st.session_state.history.pop(0)
-
-        st.session_state.saved_df = st.session_state.df.copy()
+        # Record the edit as a delta against the previous version
+        st.session_state.edit_history.record(st.session_state.df)
+        st.session_state.saved_df = st.session_state.df.copy(deep=False)
     else:
         st.warning("No data available to save.")
 
 
 def undo_last_action():
-    """Undo the last action by reverting to the previous state."""
-    if st.session_state.history:
-        st.session_state.df = st.session_state.history.pop()
+    previous = st.session_state.edit_history.undo()
+    if previous is not None:
+        st.session_state.df = previous
+        st.session_state.saved_df = previous.copy(deep=False)
         st.success("Last action undone.")
     else:
         st.warning("No more actions to undo.")
 
+
+def redo_last_action():
+    following = st.session_state.edit_history.redo()
+    if following is not None:
+        st.session_state.df = following
+        st.session_state.saved_df = following.copy(deep=False)
+        st.success("Last action redone.")
+    else:
+        st.warning("No more actions to redo.")
+
+
+def column_stats():
+    """Column statistics of the current DataFrame, rebuilt only when its version changes."""
+    if 'column_stats' not in st.session_state:
+        st.session_state.column_stats = StatsIndex()
+    return st.session_state.column_stats.refresh(st.session_state.df, st.session_state.edit_history.version)
+
 # Function to check for column consistency
 def sanity_check(dfs):
     column_lengths = [len(df.columns) for df in dfs]
@@ -95,7 +113,7 @@ def correct_outliers(df, col, method):
 
     # Calculate the moving average including outliers
         window_size = st.slider("Select window size:", min_value=3, max_value=12, value=3)
-        df[f'{col}_Moving_Avg'] = df[col].rolling(window=window_size, min_periods=1, center=True).mean()
+        df[f'{col}_Moving_Avg'] = segmented_rolling(df[col], window=window_size, center=True)
 
     # Replace outliers with the moving average value
         df[f'{col}_corrected_Moving_Avg_Included_Outliers'] = df[col].where(
@@ -119,12 +137,9 @@ def correct_outliers(df, col, method):
 
         window_size = st.slider("Select window size:", min_value=3, max_value=12, value=3)
 
-        def calculate_moving_avg_excluding_outliers(series, window, lower_bound, upper_bound):
-            return series.rolling(window=window, min_periods=1, center=True).apply(
-                lambda x: np.mean(x[(x >= outlier_lower_bound) & (x <= outlier_upper_bound)])
-            )
-
-        df[f'{col}_Moving_Avg_Excluded_Outliers'] = calculate_moving_avg_excluding_outliers(df[col], window_size, lower_bound, upper_bound)
+        # Outliers are masked out of each centered window rather than filtered per window in Python
+        in_bounds = (df[col] >= outlier_lower_bound) & (df[col] <= outlier_upper_bound)
+        df[f'{col}_Moving_Avg_Excluded_Outliers'] = segmented_rolling(df[col], window=window_size, center=True, mask=in_bounds)
         df[f'{col}_corrected_Moving_Avg_Excluded_Outliers'] = np.where(
             (df[col] < outlier_lower_bound) | (df[col] > outlier_upper_bound),
             df[f'{col}_Moving_Avg_Excluded_Outliers'],
@@ -255,10 +270,7 @@ if data_management_option == "Import Dataset":
     if files:
         st.session_state.dfs = []
         for file in files:
-            if file.name.endswith(".csv"):
-                st.session_state.dfs.append(pd.read_csv(file))
-            else:
-                st.session_state.dfs.append(pd.read_excel(file))
+            st.session_state.dfs.append(load_upload(file))
         st.success("Datasets uploaded successfully!")
 
 elif data_management_option == "Sanity Checks":
@@ -291,18 +303,19 @@ elif data_management_option == "Data Cleaning":
             option = st.radio("Choose analysis type:", ["Summary Statistics", "Variable Info", "Null Values Chart"])
             if option == "Summary Statistics":
                 st.write("Summary Statistics:")
-                st.write(st.session_state.df.describe())
+                st.write(column_stats().describe())
             elif option == "Variable Info":
                 st.write("Variable Info:")
-                buffer = io.StringIO()
-                st.session_state.df.info(buf=buffer)
-                info_str = buffer.getvalue()
-                st.text(info_str)
+                stats = column_stats()
+                st.text(f"{len(st.session_state.df)} rows, {len(stats.columns)} columns, "
+                        f"{sum(s.nbytes for s in stats.columns.values()) / 1024 ** 2:,.1f} MB")
+                st.dataframe(stats.info())
             elif option == "Null Values Chart":
                 st.write("Null Values Chart:")
+                stats = column_stats()
                 for column in st.session_state.df.columns:
-                    null_count = st.session_state.df[column].isnull().sum()
-                    non_null_count = st.session_state.df[column].notnull().sum()
+                    null_count = stats[column].null_count
+                    non_null_count = stats[column].count
 
                     fig, ax = plt.subplots()
                     ax.bar(['Missing Values', 'Non-missing Values'], [null_count, non_null_count], color=['red', 'green'])
@@ -336,12 +349,13 @@ elif data_management_option == "Data Cleaning":
                 new_values = st.text_input(f"New values for {column} (comma-separated)", "")
 
                 if old_values and new_values:
-                    old_values_list = old_values.split(",")
-                    new_values_list = new_values.split(",")
+                    old_values_list = [value.strip() for value in old_values.split(",")]
+                    new_values_list = [parse_literal(value) for value in new_values.split(",")]
                     recode_map = dict(zip(old_values_list, new_values_list))
 
                     if st.button("Recode"):
-                        st.session_state.df[column] = st.session_state.df[column].replace(recode_map)
+                        # One lookup per distinct value instead of a row-wise replace
+                        st.session_state.df[column] = lookup(st.session_state.df[column], recode_map)
                         st.write("Recoded Data:")
                         st.dataframe(st.session_state.df)
                         save_data()
@@ -423,13 +437,35 @@ elif data_management_option == "Data Cleaning":
                         elif not new_col_name:
                             st.error(f"Please enter a name for the new column {i+1}.")
                         else:
-                            # Safely evaluate the expression
-                            st.session_state.df[new_col_name] = st.session_state.df.eval(expression)
+                            # Column names and types are checked before anything is computed
+                            results = evaluate_expressions(st.session_state.df, {new_col_name: expression})
+                            st.session_state.df[new_col_name] = results[new_col_name]
                             st.write(f"Computed variable {i+1}:")
                             st.dataframe(st.session_state.df)
                             save_data()
                     except Exception as e:
                         st.error(f"Error computing new variable {i+1}: {e}")
+
+            # Evaluate every filled-in variable together, sharing common subexpressions
+            if num_variables > 1 and st.button("Compute All Variables"):
+                definitions = []
+                for i in range(num_variables):
+                    name = st.session_state.get(f"new_col_name_{i}")
+                    expression = st.session_state.get(f"expression_{i}")
+                    if name and expression:
+                        definitions.append((name, expression))
+                if not definitions:
+                    st.error("Please enter a name and an expression for at least one variable.")
+                else:
+                    try:
+                        results = evaluate_expressions(st.session_state.df, definitions)
+                        for name, values in results.items():
+                            st.session_state.df[name] = values
+                        st.write(f"Computed {len(results)} variables: {', '.join(results)}")
+                        st.dataframe(st.session_state.df)
+                        save_data()
+                    except Exception as e:
+                        st.error(f"Error computing new variables: {e}")
         else:
             st.warning("No dataset available. Please import and merge datasets first.")
 
@@ -514,7 +550,7 @@ elif data_management_option == "Quality Control/Checks":
 
             if column:
                 st.write("Outlier Detection Methods:")
-                method = st.selectbox("Choose method:", ["","Z-Score", "IQR", "Boxplot", "Scatterplot with Q1=25th percentile and Q3=75th percentile Lines"])
+                method = st.selectbox("Choose method:", ["","Z-Score", "IQR", "Boxplot", "Scatterplot with Q1=25th percentile and Q3=75th percentile Lines", "Hampel Filter (rolling median and MAD per facility)", "Seasonal Residual (per facility, seasonality removed)"])
 
                 def detect_outliers_z_score(df, col):
                     return df[(df[col] - df[col].mean()) / df[col].std() > 3]
@@ -542,6 +578,20 @@ elif data_management_option == "Quality Control/Checks":
                     ax.set_title(f'Boxplot for {column}')
                     st.pyplot(fig)
 
+                elif method in ("Hampel Filter (rolling median and MAD per facility)", "Seasonal Residual (per facility, seasonality removed)"):
+                    # Every facility series is laid out in one facility x month matrix and checked at once,
+                    # so seasonal peaks are judged against the facility's own months rather than a pooled IQR
+                    missing = [c for c in ['hf_uid', 'year', 'month'] if c not in st.session_state.df.columns]
+                    if missing:
+                        st.error(f"These methods need the columns: {', '.join(missing)}")
+                    else:
+                        robust_method = 'hampel' if method.startswith("Hampel") else 'seasonal'
+                        k = st.slider("Flag values more than this many scaled MADs away:", min_value=2.0, max_value=8.0, value=3.0 if robust_method == 'hampel' else 3.5, step=0.5)
+                        flags = robust_outliers(st.session_state.df, column, robust_method, k=k)
+                        outliers = pd.concat([st.session_state.df, flags], axis=1)[flags[f'{column}_category'] == 'Outlier']
+                        st.write(f"{len(outliers)} outliers detected in {outliers['hf_uid'].nunique()} facilities:")
+                        st.dataframe(outliers)
+
                 elif method == "Scatterplot with Q1=25th percentile and Q3=75th percentile Lines":
                     st.write("Scatterplot with Q1=25th percentile and Q3=75th percentile Lines:")
                     Q1 = st.session_state.df[column].quantile(0.25)
@@ -588,6 +638,9 @@ if st.session_state.df is not None:
     if st.button("Undo Last Action"):
         undo_last_action()
         st.dataframe(st.session_state.df)
+    if st.button("Redo Last Action"):
+        redo_last_action()
+        st.dataframe(st.session_state.df)
 
 
 # Always show Save and Download buttons
@@ -616,6 +669,11 @@ import base64
 import dataframe_image as dfi
 from io import BytesIO
 from collections import OrderedDict
+from reporting import reporting_status, active_denominators, area_denominators
+from facility_activity import CLOSURE_MONTHS, GAP_MONTHS
+from completeness import completeness_cube
+from routine_io import load_upload_keyed
+from status_heatmap import render_status_heatmap
 
 
 st.title("Data Analysis Section")
@@ -630,221 +688,73 @@ def generate_download_link(file_name, file_type='image'):
     elif file_type == 'excel':
         return f'<a href="data:file/excel;base64,{b64}" download="{file_name}">Download {file_name}</a>'
 
-def process_data(df0):
-    # Processing steps as in the original code
-    cols = ['test', 'conf', 'maltreat']
-    df0.insert(len(df0.columns), 'key_variables', df0[cols].sum(axis=1, skipna=True, min_count=1))
-    df0['key_variables'] = df0['key_variables'].fillna(0)
-    df0.insert(len(df0.columns), 'reported', np.where(df0.key_variables == 0, 0, 1))
+def process_data(df0, gap_months=GAP_MONTHS, closure_months=CLOSURE_MONTHS):
+    # Reporting status of every facility-month from grouped transforms, no per-facility loop
+    df0, activity = reporting_status(df0, key_variables=['test', 'conf', 'maltreat'],
+                                     gap_months=gap_months, closure_months=closure_months)
 
-    d = {}
-    for hf in sorted(df0.hf_uid.unique()):
-        t = df0[df0.hf_uid == hf]
-        d[hf] = t[t.reported == 1].YM.min()
-
-    df0.insert(len(df0.columns), 'first_month_reported', df0.hf_uid.map(d))
-
-    # Create first month reported Excel file
+    # Create first month reported Excel file, with the gaps and closure of every facility
     cols = ['adm1', 'adm2', 'adm3', 'hf', 'hf_uid', 'first_month_reported']
     df = df0[cols].drop_duplicates(subset='hf_uid')
+    df = df.join(activity.drop(columns='first_month_reported'), on='hf_uid')
     output = BytesIO()
     df.to_excel(output, index=False)
     excel_data = output.getvalue()
     excel_file_name = 'First_month_reported.xlsx'
 
-    # Additional detailed columns
-    df0.insert(len(df0.columns), 'reported_detail', df0.apply(lambda x: 0.5 if ((x.reported == 0) & (x.YM > d[x.hf_uid])) else x.reported, axis=1))
-    df0.insert(len(df0.columns), 'hf_active', np.where(df0.reported_detail == 0, False, True))
-    df0.insert(len(df0.columns), 'hf_wards', df0.hf.apply(lambda x: 'Inpatient' if x.split()[-1] == 'Hospital' else 'Outpatient'))
-
-    reporting_monthly = {}
-    for i in ['Inpatient', 'Outpatient']:
-        t = df0[df0.hf_wards == i] if i == 'Inpatient' else df0.copy()
-        t = (t[['YM', 'hf_uid', 'hf_active']]
-             .groupby('YM')['hf_active'].sum()
-             .to_frame()
-             .reset_index()
-             .rename(columns={'hf_active': 'denominator'}))
-        reporting_monthly[i] = t
+    # Active facilities per month for Inpatient (hospitals) and Outpatient (all) in one grouped sum
+    reporting_monthly = active_denominators(df0)
 
     return df0, reporting_monthly, excel_data, excel_file_name
 
 def plot_heatmap(df, title):
-    cmap = ListedColormap(['lightcoral', 'gold', 'limegreen'])
-    fig, ax = plt.subplots(figsize=(30, 20))
-    sns.heatmap(ax=ax, data=df, cmap=cmap, cbar=None)
-    ax.set_xlabel('')
-    ax.set_xticks(ax.get_xticks())
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=90, ha='right')
-
-    yticklabels = [l.get_text()[0:-7] for l in ax.get_yticklabels()]
-    t = pd.DataFrame(yticklabels).reset_index()
-    t1 = t.groupby(0)['index'].mean().astype(int).reset_index()
-    t.insert(0, 'pos', t[0].map(dict(zip(t1[0], t1['index']))))
-    t = t[[0, 'pos', 'index']]
-    t[0] = np.where(t.pos == t['index'], t[0], '')
-    test = t[0].to_list()
-
-    ax.set_yticks(ax.get_yticks())
-    ax.set_yticklabels(test, size=15)
-    ax.set_ylabel('HEALTH FACILITY')
-    ylabel_mapping = OrderedDict()
-    for adm1, hf_uid in df.index:
-        ylabel_mapping.setdefault(adm1, [])
-        ylabel_mapping[adm1].append(hf_uid)
-    hline = []
-    new_ylabels = []
-    for adm1, hf_list in ylabel_mapping.items():
-        hf_list[0] = "{} - {}".format(adm1, hf_list[0])
-        new_ylabels.extend(hf_list)
-        if hline:
-            hline.append(len(hf_list) + hline[-1])
-        else:
-            hline.append(len(hf_list))
-    plt.hlines(hline, xmin=-10, xmax=0, color="grey", linewidth=2, clip_on=False)
-    fig.tight_layout()
-
-    # Save to BytesIO and return
-    buf = BytesIO()
-    fig.savefig(buf, format='png')
-    buf.seek(0)
-    img_data = buf.getvalue()
-    return img_data
+    # Whole status matrix as one raster image per page, districts separated and labelled from the index
+    return render_status_heatmap(df.to_numpy(dtype='float64', na_value=np.nan),
+                                 df.index.get_level_values('adm1'), df.columns,
+                                 levels=[0, 0.5, 1], colors=['lightcoral', 'gold', 'limegreen'], title=title)
 
 
 def create_adm3_uid(df0):
     # Create a unique identifier based on adm1, adm2, and adm3
-    df0['adm3_uid'] = df0.groupby(['adm1', 'adm2', 'adm3']).ngroup()
+    df0['adm3_uid'] = df0.groupby(['adm1', 'adm2', 'adm3'], observed=True).ngroup()
     return df0
 
 
-def process_data(df0):
-    # Processing steps as in the original code
-    cols = ['susp','test', 'conf', 'maltreat']
-    df0.insert(len(df0.columns), 'key_variables', df0[cols].sum(axis=1, skipna=True, min_count=1))
-    df0['key_variables'] = df0['key_variables'].fillna(0)
-    df0.insert(len(df0.columns), 'reported', np.where(df0.key_variables == 0, 0, 1))
-
-    d = {}
-    for hf in sorted(df0.hf_uid.unique()):
-        t = df0[df0.hf_uid == hf]
-        d[hf] = t[t.reported == 1].YM.min()
+def process_data(df0, gap_months=GAP_MONTHS, closure_months=CLOSURE_MONTHS):
+    # Reporting status of every facility-month from grouped transforms, no per-facility loop
+    df0, activity = reporting_status(df0, key_variables=['susp', 'test', 'conf', 'maltreat'],
+                                     gap_months=gap_months, closure_months=closure_months)
 
-    df0.insert(len(df0.columns), 'first_month_reported', df0.hf_uid.map(d))
-
-    # Create first month reported Excel file
+    # Create first month reported Excel file, with the gaps and closure of every facility
     cols = ['adm1', 'adm2', 'adm3', 'hf', 'hf_uid', 'first_month_reported']
     df = df0[cols].drop_duplicates(subset='hf_uid')
+    df = df.join(activity.drop(columns='first_month_reported'), on='hf_uid')
     output = BytesIO()
     df.to_excel(output, index=False)
     excel_data = output.getvalue()
     excel_file_name = 'First_month_reported.xlsx'
 
-    # Additional detailed columns
-    df0.insert(len(df0.columns), 'reported_detail', df0.apply(lambda x: 0.5 if ((x.reported == 0) & (x.YM > d[x.hf_uid])) else x.reported, axis=1))
-    df0.insert(len(df0.columns), 'hf_active', np.where(df0.reported_detail == 0, False, True))
-    df0.insert(len(df0.columns), 'hf_wards', df0.hf.apply(lambda x: 'Inpatient' if x.split()[-1] == 'Hospital' else 'Outpatient'))
-
-    reporting_monthly = {}
-    for i in ['Inpatient', 'Outpatient']:
-        t = df0[df0.hf_wards == i] if i == 'Inpatient' else df0.copy()
-        t = (t[['YM', 'hf_uid', 'hf_active']]
-             .groupby('YM')['hf_active'].sum()
-             .to_frame()
-             .reset_index()
-             .rename(columns={'hf_active': 'denominator'}))
-        reporting_monthly[i] = t
+    # Active facilities per month for Inpatient (hospitals) and Outpatient (all) in one grouped sum
+    reporting_monthly = active_denominators(df0)
 
     return df0, reporting_monthly, excel_data, excel_file_name
 
 
 
 def plot_heatmap(df, title):
-    cmap = ListedColormap(['lightcoral', 'gold', 'limegreen'])
-    fig, ax = plt.subplots(figsize=(30, 20))
-    sns.heatmap(ax=ax, data=df, cmap=cmap, cbar=None)
-    ax.set_xlabel('')
-    ax.set_xticks(ax.get_xticks())
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=90, ha='right')
-
-    yticklabels = [l.get_text()[0:-7] for l in ax.get_yticklabels()]
-    t = pd.DataFrame(yticklabels).reset_index()
-    t1 = t.groupby(0)['index'].mean().astype(int).reset_index()
-    t.insert(0, 'pos', t[0].map(dict(zip(t1[0], t1['index']))))
-    t = t[[0, 'pos', 'index']]
-    t[0] = np.where(t.pos == t['index'], t[0], '')
-    test = t[0].to_list()
-
-    ax.set_yticks(ax.get_yticks())
-    ax.set_yticklabels(test, size=15)
-    ax.set_ylabel('HEALTH FACILITY')
-    ylabel_mapping = OrderedDict()
-    for adm1, hf_uid in df.index:
-        ylabel_mapping.setdefault(adm1, [])
-        ylabel_mapping[adm1].append(hf_uid)
-    hline = []
-    new_ylabels = []
-    for adm1, hf_list in ylabel_mapping.items():
-        hf_list[0] = "{} - {}".format(adm1, hf_list[0])
-        new_ylabels.extend(hf_list)
-        if hline:
-            hline.append(len(hf_list) + hline[-1])
-        else:
-            hline.append(len(hf_list))
-    plt.hlines(hline, xmin=-10, xmax=0, color="grey", linewidth=2, clip_on=False)
-    fig.tight_layout()
-
-    # Save to BytesIO and return
-    buf = BytesIO()
-    fig.savefig(buf, format='png')
-    buf.seek(0)
-    img_data = buf.getvalue()
-    return img_data
+    # Whole status matrix as one raster image per page, districts separated and labelled from the index
+    return render_status_heatmap(df.to_numpy(dtype='float64', na_value=np.nan),
+                                 df.index.get_level_values('adm1'), df.columns,
+                                 levels=[0, 0.5, 1], colors=['lightcoral', 'gold', 'limegreen'], title=title)
 
 
 
 ###################################################
 def plot_heatmap(df1, title):
-    cmap = ListedColormap(['lightcoral', 'gold', 'limegreen'])
-    fig, ax = plt.subplots(figsize=(30, 20))
-    sns.heatmap(ax=ax, data=df1, cmap=cmap, cbar=None)
-    ax.set_xlabel('')
-    ax.set_xticks(ax.get_xticks())
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=90, ha='right')
-
-    yticklabels = [l.get_text()[0:-7] for l in ax.get_yticklabels()]
-    t = pd.DataFrame(yticklabels).reset_index()
-    t1 = t.groupby(0)['index'].mean().astype(int).reset_index()
-    t.insert(0, 'pos', t[0].map(dict(zip(t1[0], t1['index']))))
-    t = t[[0, 'pos', 'index']]
-    t[0] = np.where(t.pos == t['index'], t[0], '')
-    test = t[0].to_list()
-
-    ax.set_yticks(ax.get_yticks())
-    ax.set_yticklabels(test, size=15)
-    ax.set_ylabel('HEALTH FACILITY')
-    ylabel_mapping = OrderedDict()
-    for adm1, hf_uid in df.index:
-        ylabel_mapping.setdefault(adm1, [])
-        ylabel_mapping[adm1].append(hf_uid)
-    hline = []
-    new_ylabels = []
-    for adm1, hf_list in ylabel_mapping.items():
-        hf_list[0] = "{} - {}".format(adm1, hf_list[0])
-        new_ylabels.extend(hf_list)
-        if hline:
-            hline.append(len(hf_list) + hline[-1])
-        else:
-            hline.append(len(hf_list))
-    plt.hlines(hline, xmin=-10, xmax=0, color="grey", linewidth=2, clip_on=False)
-    fig.tight_layout()
-
-    # Save to BytesIO and return
-    buf = BytesIO()
-    fig.savefig(buf, format='png')
-    buf.seek(0)
-    img_data = buf.getvalue()
-    return img_data
+    # Whole status matrix as one raster image per page, districts separated and labelled from the index
+    return render_status_heatmap(df1.to_numpy(dtype='float64', na_value=np.nan),
+                                 df1.index.get_level_values('adm1'), df1.columns,
+                                 levels=[0, 0.5, 1], colors=['lightcoral', 'gold', 'limegreen'], title=title)
 
 
 
@@ -857,10 +767,11 @@ analysis_option = st.sidebar.radio("Select Analysis Option", ["None","Reporting
 if analysis_option == "Reporting Status by HF and Key variables":
     uploaded_file = st.file_uploader("Please upload your clean data management file", type=["csv", "xlsx"])
     if uploaded_file:
-        if uploaded_file.name.endswith('.csv'):
-            df0 = pd.read_csv(uploaded_file)
-        else:
-            df0 = pd.read_excel(uploaded_file)
+        df0, data_key = load_upload_keyed(uploaded_file)
+
+        # Compact dtypes: categorical ids, small nullable counts, period months
+        df0, memory_report = compact_routine_frame(df0)
+        st.caption(format_memory_report(memory_report))
 
         # Update DataFrame with adm3_uid
         df0 = create_adm3_uid(df0)
@@ -868,15 +779,19 @@ if analysis_option == "Reporting Status by HF and Key variables":
         # Save DataFrame to session state
         st.session_state.df0 = df0
 
+        # Facilities silent this long stop counting as active (temporary gap, or closure at the end)
+        gap_months = st.number_input("Silent months between reports counted as a gap:", min_value=1, value=GAP_MONTHS)
+        closure_months = st.number_input("Silent months at the end counted as a closure:", min_value=1, value=CLOSURE_MONTHS)
+
         # Process data
-        df0, reporting_monthly, excel_data, excel_file_name = process_data(df0)
+        df0, reporting_monthly, excel_data, excel_file_name = process_data(df0, int(gap_months), int(closure_months))
 
         # Generate and display heatmap
 
         # Step 1: Filter out HFs that have never reported
-        df_filtered = df0.groupby(['adm1', 'hf_uid']).filter(lambda x: x['reported_detail'].sum() > 0)
+        df_filtered = df0.groupby(['adm1', 'hf_uid'], observed=True).filter(lambda x: x['reported_detail'].sum() > 0)
 
-        df1=df0.groupby(['adm1', 'hf_uid']).filter(lambda x: x['reported_detail'].sum() >= 0)
+        df1=df0.groupby(['adm1', 'hf_uid'], observed=True).filter(lambda x: x['reported_detail'].sum() >= 0)
 
         # Step 2: Generate the heatmap
         df = (df_filtered.pivot(index=['adm1', 'hf_uid', 'first_month_reported'], columns='YM', values='reported_detail')
@@ -891,12 +806,12 @@ if analysis_option == "Reporting Status by HF and Key variables":
         df1 = df1.reset_index().drop(['first_month_reported'], axis=1).set_index(['adm1', 'hf_uid'])
 
         # Step 3: Plot and display the heatmap
-        img_data1 = plot_heatmap(df1, 'Reports Traffic Light Heatmap Sorted ADM1')
-        st.image(img_data1, caption='Reports Traffic Light Heatmap Sorted ADM1 including all HFs')
+        for img_data1 in plot_heatmap(df1, 'Reports Traffic Light Heatmap Sorted ADM1'):
+            st.image(img_data1, caption='Reports Traffic Light Heatmap Sorted ADM1 including all HFs')
 
 ########################################################################################################
-        img_data = plot_heatmap(df, 'Reports Traffic Light Heatmap Sorted ADM1')
-        st.image(img_data, caption='Reports Traffic Light Heatmap Sorted ADM1 including active HFs')
+        for img_data in plot_heatmap(df, 'Reports Traffic Light Heatmap Sorted ADM1'):
+            st.image(img_data, caption='Reports Traffic Light Heatmap Sorted ADM1 including active HFs')
 
 
 
@@ -905,18 +820,17 @@ if analysis_option == "Reporting Status by HF and Key variables":
         d = {'Outpatient': ['allout', 'test', 'conf', 'pres', 'maltreat'],
              'Inpatient': ['maladm', 'maldth']}
 
+        # One facility-month completeness table serves the national and hospital rates
+        cube = completeness_cube(df0, data_key,
+                                 gap_months=int(gap_months), closure_months=int(closure_months))
         for i, variables in d.items():
-            t = df0[df0.hf_wards == i] if i == 'Inpatient' else df0.copy()
-            for c in variables:
-                t[f'{c}_reported'] = np.where(t[c].isnull(), False, True)
-
-            cols = [f'{c}_reported' for c in variables]
-            t = t.groupby('YM')[cols].sum().reset_index()
-            t = t.merge(reporting_monthly[i], on='YM', how='outer', validate='1:1')
-            for c in cols:
-                t[f'{c[0:-9]}_RR'] = 100 * t[c].div(t['denominator'])
+            if i == 'Inpatient':
+                t = cube.rates(['hf_wards'], variables)
+                t = t[t.hf_wards == i]
+            else:
+                t = cube.rates([], variables)
 
-            cols = [f'{c[0:-9]}_RR' for c in cols]
+            cols = [f'{c}_RR' for c in variables]
             t = t[['YM'] + cols].set_index('YM').T
 
             h = 4 if i == 'Inpatient' else 4
@@ -938,39 +852,19 @@ if analysis_option == "Reporting Status by HF and Key variables":
 
      
 
-        # Calculating confirmed variable
-        reporting_monthly_adm3 = {}
-        for chiefdom in df0.adm3_uid.unique():
-            t = df0[df0.adm3_uid == chiefdom]
-            t = (t[['YM', 'hf_uid', 'hf_active']]
-                 .groupby(['YM'])['hf_active'].sum()
-                 .to_frame()
-                 .reset_index()
-                 .rename(columns={'hf_active': 'denominator'}))
-            reporting_monthly_adm3[chiefdom] = t
-
-        t = df0[['adm3_uid', 'hf_uid']].drop_duplicates()
-        t = t.groupby(['adm3_uid'])['hf_uid'].count().reset_index()
-        d_chiefdoms = dict(zip(t.adm3_uid, t.hf_uid))
+        # Active and all-facility denominators of every (chiefdom, month), computed once
+        denominators = area_denominators(df0, area='adm3_uid')
 
         for denominator in ['ActiveHFsDenominator']:
             df = df0.copy()
             df['conf_reported'] = np.where(df['conf'].isnull(), False, True)
 
-            df = df.groupby(['adm1', 'adm2', 'adm3', 'adm3_uid', 'YM'])['conf_reported'].sum().reset_index()
-            if denominator == 'AllHFsDenominator':
-                df.insert(0, 'denominator', df.adm3_uid.map(d_chiefdoms))
-            else:
-                def temp(x):
-                    t = reporting_monthly_adm3[x.adm3_uid]
-                    return t[t.YM == x.YM].denominator.values[0]
-
-                df.insert(0, 'denominator', df.apply(lambda x: temp(x), axis=1))
+            df = df.groupby(['adm1', 'adm2', 'adm3', 'adm3_uid', 'YM'], observed=True)['conf_reported'].sum().reset_index()
+            column = 'all' if denominator == 'AllHFsDenominator' else 'active'
+            df.insert(0, 'denominator', df.join(denominators[column], on=['adm3_uid', 'YM'])[column])
 
             df['conf_RR'] = 100 * df['conf_reported'].div(df['denominator'])
 
-            df['TPR']= 100 * df['conf'].div(df['test'])
-
             df = (df.pivot(index=['adm1', 'adm2', 'adm3', 'adm3_uid'], columns='YM', values='conf_RR')
                   .sort_values(by=['adm1', 'adm3_uid']))
 
@@ -1049,11 +943,11 @@ if analysis_option == "Geospatial Analysis":
     # Step 1: Upload Clean Excel File
     uploaded_file = st.file_uploader("Upload Clean Excel File", type=["xlsx"])
     if uploaded_file:
-        df = pd.read_excel(uploaded_file)
+        df = load_upload(uploaded_file)
         st.write("Uploaded Data:", df.head())
 
         # Step 2: Group by adm3 and Year, Create DataFrame for Each Year
-        grouped_df = df.groupby(['adm1', 'adm2', 'adm3', 'Year']).sum().reset_index()
+        grouped_df = df.groupby(['adm1', 'adm2', 'adm3', 'Year'], observed=True).sum().reset_index()
 
         # Step 3: Upload Chiefdom Data Excel
         uploaded_chiefdom_file = st.file_uploader("Upload Chiefdom Data (Chiefdom_data.xlsx)", type=["xlsx"])
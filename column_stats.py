@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+from edit_history import same_column, snapshot
+
+# Distinct value counts are kept for columns up to this many distinct values
+MAX_DISTINCT = 10_000
+
+# Quantiles of columns with more distinct values are estimated from a sample
+QUANTILE_SAMPLE = 100_000
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+def quantiles_from_counts(values, counts, qs=QUANTILES):
+    """Exact linear-interpolated quantiles from sorted distinct values and their counts."""
+    n = counts.sum()
+    ends = np.cumsum(counts)
+    out = []
+    for q in qs:
+        position = q * (n - 1)
+        low, high = int(np.floor(position)), int(np.ceil(position))
+        low_value = values[np.searchsorted(ends, low, side='right')]
+        high_value = values[np.searchsorted(ends, high, side='right')]
+        out.append(low_value + (high_value - low_value) * (position - low))
+    return out
+
+
+class ColumnStats:
+    """Statistics of one column, computed in a single pass over it."""
+
+    def __init__(self, series):
+        self.dtype = series.dtype
+        self.rows = len(series)
+        self.null_count = int(series.isna().sum())
+        self.count = self.rows - self.null_count
+        self.nbytes = int(series.memory_usage(deep=True, index=False))
+        self.numeric = pd.api.types.is_numeric_dtype(self.dtype) and not pd.api.types.is_bool_dtype(self.dtype)
+
+        value_counts = series.value_counts(dropna=True, sort=False)
+        value_counts = value_counts[value_counts > 0]
+        self.n_distinct = len(value_counts)
+        self.value_counts = value_counts if self.n_distinct <= MAX_DISTINCT else None
+
+        self.min = self.max = self.mean = self.std = None
+        self.quantiles = [None] * len(QUANTILES)
+        if self.numeric and self.count:
+            values = series.to_numpy(dtype='float64', na_value=np.nan)
+            values = values[~np.isnan(values)]
+            self.min, self.max = values.min(), values.max()
+            self.mean = values.mean()
+            self.std = values.std(ddof=1) if len(values) > 1 else np.nan
+            if self.value_counts is not None:
+                counts = self.value_counts.sort_index()
+                self.quantiles = quantiles_from_counts(counts.index.to_numpy(dtype='float64'), counts.to_numpy())
+            else:
+                if len(values) > QUANTILE_SAMPLE:
+                    values = np.random.default_rng(0).choice(values, QUANTILE_SAMPLE, replace=False)
+                self.quantiles = list(np.quantile(values, QUANTILES))
+
+    def distinct(self):
+        """Distinct non-null values in order of appearance, or None above MAX_DISTINCT."""
+        if self.value_counts is None:
+            return None
+        return list(self.value_counts.index)
+
+
+class StatsIndex:
+    """Column statistics for one version of the working DataFrame.
+
+    `refresh(df, version)` does nothing while the version is unchanged.
+    After an edit that keeps the rows, only columns whose data changed are
+    recomputed; renamed columns keep their statistics. A change of rows
+    rebuilds every column.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.frame = None
+        self.columns = {}
+
+    def refresh(self, df, version):
+        if (self.version == version and self.frame is not None
+                and len(self.frame) == len(df) and list(self.frame.columns) == list(df.columns)):
+            return self
+        reusable = {}
+        if self.frame is not None and self.frame.index.equals(df.index):
+            reusable = {name: self.frame[name] for name in self.frame.columns}
+        columns = {}
+        for name in df.columns:
+            series = df[name]
+            match = name if name in reusable and same_column(reusable[name], series) else None
+            if match is None:
+                match = next((old for old, values in reusable.items()
+                              if old not in df.columns and same_column(values, series)), None)
+            columns[name] = self.columns[match] if match is not None else ColumnStats(series)
+        self.columns = columns
+        self.frame = snapshot(df)
+        self.version = version
+        return self
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def describe(self):
+        """Equivalent of DataFrame.describe() for the numeric columns."""
+        numeric = {name: stats for name, stats in self.columns.items() if stats.numeric}
+        index = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+        return pd.DataFrame(
+            {name: [s.count, s.mean, s.std, s.min, *s.quantiles, s.max] for name, s in numeric.items()},
+            index=index, dtype='float64'
+        )
+
+    def info(self):
+        """Per-column dtype, non-null, null and distinct counts and memory use."""
+        return pd.DataFrame({
+            'Dtype': [str(s.dtype) for s in self.columns.values()],
+            'Non-Null Count': [s.count for s in self.columns.values()],
+            'Null Count': [s.null_count for s in self.columns.values()],
+            'Distinct Values': [s.n_distinct for s in self.columns.values()],
+            'Memory (KB)': [round(s.nbytes / 1024, 1) for s in self.columns.values()],
+        }, index=list(self.columns))
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import tempfile
+
+import pandas as pd
+
+from facility_activity import CLOSURE_MONTHS, GAP_MONTHS, FacilityActivity
+from periods import month_start_dates
+from reporting import KEY_VARIABLES, ward_types
+from routine_io import evict_cache
+
+# Completeness tables are kept here as parquet files, keyed by data fingerprint and options
+COMPLETENESS_DIR = os.environ.get('COMPLETENESS_DIR', os.path.join(tempfile.gettempdir(), 'completeness_cube'))
+COMPLETENESS_MAX_BYTES = int(os.environ.get('COMPLETENESS_MAX_BYTES', 256 * 1024 ** 2))
+
+# Variables whose reporting completeness is tracked
+REPORT_VARIABLES = ['allout', 'susp', 'test', 'conf', 'pres', 'maltreat', 'maladm', 'maldth']
+
+# Grouping keys of each admin level, from the whole country down to the facility
+LEVELS = {
+    'National': [],
+    'adm1': ['adm1'],
+    'adm2': ['adm1', 'adm2'],
+    'adm3': ['adm1', 'adm2', 'adm3'],
+    'Health facility': ['adm1', 'adm2', 'adm3', 'hf_uid'],
+}
+
+# A value counts as reported when it is present, or only when it is above zero
+REPORT_RULES = ['present', 'positive']
+
+
+def reported_flags(values, rule):
+    values = pd.to_numeric(values, errors='coerce')
+    flags = values.notna() if rule == 'present' else values.fillna(0) > 0
+    return flags.to_numpy(dtype='int8')
+
+
+class CompletenessCube:
+    """Reported and expected facility-months of every variable, at the facility-month grain.
+
+    The base table has one row per facility and month with `expected`
+    (1 when the facility is active in that month by FacilityActivity, run
+    on reports of the key variables) and `reported_<var>` (1 if the variable was
+    reported). Every level is a grouped sum of this one table, so national,
+    district, chiefdom and facility rates always add up.
+    """
+
+    def __init__(self, table, variables, period='YM'):
+        self.table = table
+        self.variables = list(variables)
+        self.period = period
+
+    @classmethod
+    def build(cls, df, variables=REPORT_VARIABLES, key_variables=KEY_VARIABLES, rule='present',
+              period='YM', facility='hf_uid', gap_months=GAP_MONTHS, closure_months=CLOSURE_MONTHS):
+        """One grouped pass over the raw rows; several rows of a facility-month count once."""
+        variables = [v for v in variables if v in df.columns]
+        if period not in df.columns:
+            df = df.assign(**{period: month_start_dates(df['year'], df['month']).dt.to_period('M')})
+        keys = [k for k in ['adm1', 'adm2', 'adm3', facility, 'hf'] if k in df.columns]
+        frame = pd.DataFrame({f'reported_{v}': reported_flags(df[v], rule) for v in variables}, index=df.index)
+        key_sum = df[[v for v in key_variables if v in df.columns]].apply(pd.to_numeric, errors='coerce')
+        frame['key_reported'] = (key_sum.sum(axis=1, min_count=1).fillna(0) != 0).to_numpy(dtype='int8')
+        table = frame.groupby([df[k] for k in keys + [period]], observed=True).max().reset_index()
+
+        # Facilities are expected while active: from their first key report on, outside long gaps and closure
+        activity = FacilityActivity.from_frame(table, table['key_reported'] == 1, facility, period,
+                                               gap_months=gap_months, closure_months=closure_months)
+        table['expected'] = (activity.row_states() == 'Active').astype('int8')
+        table = table.drop(columns='key_reported')
+        if 'hf' in table.columns:
+            table['hf_wards'] = ward_types(table['hf'])
+        for key in keys:
+            if not isinstance(table[key].dtype, pd.CategoricalDtype):
+                table[key] = table[key].astype('category')
+        return cls(table, variables, period)
+
+    def rates(self, by=(), variables=None):
+        """Reported, expected and rate (%) per month at the level `by`, e.g. LEVELS['adm3'].
+
+        `by` may also hold hf_wards to split hospitals from other facilities.
+        """
+        variables = self.variables if variables is None else list(variables)
+        counts = ['expected'] + [f'reported_{v}' for v in variables]
+        grouped = self.table.groupby(list(by) + [self.period], observed=True)[counts].sum()
+        out = grouped.astype('int32')
+        for v in variables:
+            out[f'{v}_RR'] = 100 * out[f'reported_{v}'] / out['expected'].where(out['expected'] > 0)
+        return out.reset_index()
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = self.table.copy()
+        table[self.period] = table[self.period].astype(str)
+        table.to_parquet(path, index=False)
+
+    @classmethod
+    def load(cls, path, period='YM'):
+        table = pd.read_parquet(path)
+        table[period] = pd.PeriodIndex(table[period], freq='M')
+        variables = [c[len('reported_'):] for c in table.columns if c.startswith('reported_')]
+        return cls(table, variables, period)
+
+
+def completeness_cube(df, data_key, rule='present', directory=COMPLETENESS_DIR, **options):
+    """The cube of df, read from disk when it was already built for the same data and rule.
+
+    Least recently used cubes are evicted beyond COMPLETENESS_MAX_BYTES.
+    """
+    digest = hashlib.blake2b(repr(sorted(options.items())).encode(), digest_size=8).hexdigest()
+    path = os.path.join(directory, f'{data_key}-{rule}-{digest}.parquet')
+    if os.path.exists(path):
+        os.utime(path)
+        return CompletenessCube.load(path, options.get('period', 'YM'))
+    cube = CompletenessCube.build(df, rule=rule, **options)
+    cube.save(path)
+    evict_cache(COMPLETENESS_MAX_BYTES, directory, suffix='.parquet')
+    return cube
@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+
+def copy_on_write():
+    """True when pandas copies shared column arrays on write (always from pandas 3)."""
+    return int(pd.__version__.split('.')[0]) >= 3 or pd.get_option('mode.copy_on_write') is True
+
+
+def snapshot(df):
+    """A copy of df that later in-place edits of df cannot reach.
+
+    With copy-on-write a shallow copy is enough and shares every column
+    array; otherwise the columns have to be copied.
+    """
+    return df.copy(deep=not copy_on_write())
+
+
+def same_column(a, b):
+    return a.dtype == b.dtype and a.equals(b)
+
+
+class Delta:
+    """The difference between two consecutive versions of a DataFrame.
+
+    Only changed columns (and removed rows for filters) are stored, so a
+    delta costs memory in proportion to the edit, not to the dataset.
+    """
+
+    def __init__(self, label, before, after):
+        self.label = label
+        self.before_columns = list(before.columns)
+        self.after_columns = list(after.columns)
+        self.snapshot = None
+        self.redo_snapshot = None
+        self.removed_rows = None
+        self.removed_positions = None
+        self.renamed = {}
+        self.old_values = {}
+        self.new_values = {}
+
+        if not before.index.equals(after.index):
+            kept = before.index.isin(after.index)
+            if (before.index.is_unique and after.index.is_unique and kept.sum() == len(after)
+                    and list(before.columns) == list(after.columns)
+                    and before.index[kept].equals(after.index)):
+                # Row filter: keep only the rows that were dropped
+                self.kept_positions = kept.nonzero()[0]
+                self.removed_positions = (~kept).nonzero()[0]
+                self.removed_rows = before.iloc[self.removed_positions]
+                before = before.iloc[self.kept_positions]
+            else:
+                # Reshaping edits (group by, merge) cannot be expressed per column
+                self.snapshot = before
+                return
+
+        added = [c for c in after.columns if c not in before.columns]
+        removed = [c for c in before.columns if c not in after.columns]
+        for old in removed:
+            match = next((new for new in added if same_column(before[old], after[new])), None)
+            if match is not None:
+                self.renamed[old] = match
+                added.remove(match)
+            else:
+                self.old_values[old] = before[old]
+        for new in added:
+            self.new_values[new] = after[new]
+        for column in after.columns:
+            if column in before.columns and not same_column(before[column], after[column]):
+                self.old_values[column] = before[column]
+                self.new_values[column] = after[column]
+
+    def is_empty(self):
+        return (self.snapshot is None and self.removed_rows is None and not self.renamed
+                and not self.old_values and not self.new_values
+                and self.before_columns == self.after_columns)
+
+    def undo(self, after):
+        """Rebuild the earlier version from the later one."""
+        if self.snapshot is not None:
+            self.redo_snapshot = after
+            return self.snapshot
+        df = after.drop(columns=[c for c in self.new_values if c not in self.old_values])
+        df = df.rename(columns={new: old for old, new in self.renamed.items()})
+        for column, values in self.old_values.items():
+            df[column] = values
+        df = df[self.before_columns]
+        if self.removed_rows is not None:
+            # Put the dropped rows back at their original positions
+            combined = pd.concat([df, self.removed_rows])
+            df = combined.iloc[np.argsort(np.concatenate([self.kept_positions, self.removed_positions]))]
+        return df
+
+    def redo(self, before):
+        """Reapply the edit to the earlier version."""
+        if self.snapshot is not None:
+            following, self.redo_snapshot = self.redo_snapshot, None
+            return following
+        df = before
+        if self.removed_rows is not None:
+            df = df.drop(index=self.removed_rows.index)
+        df = df.drop(columns=[c for c in self.old_values if c not in self.new_values])
+        df = df.rename(columns=self.renamed)
+        for column, values in self.new_values.items():
+            df[column] = values
+        return df[self.after_columns]
+
+    def nbytes(self):
+        frames = list(self.old_values.values()) + list(self.new_values.values())
+        if self.removed_rows is not None:
+            frames.append(self.removed_rows)
+        if self.snapshot is not None:
+            frames.append(self.snapshot)
+        if self.redo_snapshot is not None:
+            frames.append(self.redo_snapshot)
+        return int(sum(f.memory_usage(deep=True).sum() if isinstance(f, pd.DataFrame)
+                       else f.memory_usage(deep=True) for f in frames))
+
+
+class EditHistory:
+    """Undo/redo log of DataFrame edits stored as column-level deltas.
+
+    Call `record(df)` after each edit. The history keeps a snapshot of the
+    last recorded version (a shallow copy sharing its column arrays with
+    the live frame under copy-on-write, a deep copy on older pandas) and
+    turns each new version into a Delta against it. undo() and redo()
+    hand out snapshots too, so editing the returned frame in place never
+    reaches the history.
+    """
+
+    def __init__(self):
+        self.current = None
+        self.undo_stack = []
+        self.redo_stack = []
+        # Bumped whenever the current frame changes; caches keyed on it go stale
+        self.version = 0
+
+    def record(self, df, label="Edit"):
+        """Record `df` as the newest version. Returns False if nothing changed."""
+        if self.current is None:
+            self.current = snapshot(df)
+            self.version += 1
+            return False
+        following = snapshot(df)
+        delta = Delta(label, self.current, following)
+        if delta.is_empty():
+            return False
+        self.undo_stack.append(delta)
+        self.redo_stack = []
+        self.current = following
+        self.version += 1
+        return True
+
+    def undo(self):
+        """Return the previous version, or None if there is nothing to undo."""
+        if not self.undo_stack:
+            return None
+        delta = self.undo_stack.pop()
+        previous = delta.undo(self.current)
+        self.redo_stack.append(delta)
+        self.current = previous
+        self.version += 1
+        return snapshot(previous)
+
+    def redo(self):
+        """Return the next version, or None if there is nothing to redo."""
+        if not self.redo_stack:
+            return None
+        delta = self.redo_stack.pop()
+        following = delta.redo(self.current)
+        self.undo_stack.append(delta)
+        self.current = following
+        self.version += 1
+        return snapshot(following)
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def nbytes(self):
+        """Memory held by the recorded deltas."""
+        return sum(delta.nbytes() for delta in self.undo_stack + self.redo_stack)
@@ -0,0 +1,320 @@
+import ast
+import copy
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+BINARY_OPERATORS = {
+    ast.Add: ('+', np.add), ast.Sub: ('-', np.subtract), ast.Mult: ('*', np.multiply),
+    ast.Div: ('/', np.true_divide), ast.FloorDiv: (None, np.floor_divide), ast.Mod: ('%', np.mod),
+    ast.Pow: ('**', np.power), ast.BitAnd: ('&', np.logical_and), ast.BitOr: ('|', np.logical_or),
+}
+COMPARE_OPERATORS = {
+    ast.Eq: ('==', np.equal), ast.NotEq: ('!=', np.not_equal), ast.Lt: ('<', np.less),
+    ast.LtE: ('<=', np.less_equal), ast.Gt: ('>', np.greater), ast.GtE: ('>=', np.greater_equal),
+}
+# Functions allowed in expressions, with the numexpr name where numexpr has one
+FUNCTIONS = {
+    'abs': ('abs', np.abs), 'sqrt': ('sqrt', np.sqrt), 'log': ('log', np.log),
+    'log10': ('log10', np.log10), 'exp': ('exp', np.exp), 'where': ('where', np.where),
+    'round': (None, np.round), 'floor': (None, np.floor), 'ceil': (None, np.ceil),
+}
+
+# Nodes worth caching when they occur in more than one place
+COMPOUND_NODES = (ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.Call)
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def column_values(series):
+    """A column as a plain numpy array: nullable numbers become float64 with NaN."""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return series.to_numpy(dtype=bool, na_value=False)
+    if pd.api.types.is_numeric_dtype(dtype):
+        if isinstance(dtype, np.dtype):
+            return series.to_numpy()
+        return series.to_numpy(dtype='float64', na_value=np.nan)
+    return series.to_numpy(dtype=object)
+
+
+def function_name(node):
+    """'where' for where(...) and np.where(...); None for anything else."""
+    func = node.func
+    if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id in ('np', 'numpy'):
+        return func.attr
+    if isinstance(func, ast.Name):
+        return func.id
+    return None
+
+
+class ExpressionBatch:
+    """Compile several `name = expression` definitions and evaluate them together.
+
+    Expressions use DataFrame.eval syntax (column names, backticks for names
+    with spaces, arithmetic, comparisons, and/or/not, &, |) plus abs, sqrt,
+    log, log10, exp, where, round, floor and ceil. Every column reference is
+    checked before anything is computed. Definitions run in entry order, as
+    in DataFrame.eval: a name refers to the most recent earlier definition
+    of it, or to the df column when there is none, so a name may be
+    redefined. A subexpression appearing more than once with the same
+    bindings, such as (test - conf), is computed once. Subtrees are handed
+    to numexpr when it is installed; anything it cannot take runs on numpy.
+    """
+
+    def __init__(self, df, expressions):
+        self.df = df
+        # (name, expression) pairs in entry order; a dict or a list of pairs is accepted
+        self.definitions = list(expressions.items() if isinstance(expressions, dict) else expressions)
+        self.trees = {}
+        self.names = {}
+        self.memo = {}
+        self.keys = {}
+        self.shared = set()
+        self.current = None
+        # Per position, the position of the latest earlier definition of every name
+        self.scopes, latest = [], {}
+        for position, (name, _) in enumerate(self.definitions):
+            self.scopes.append(dict(latest))
+            latest[name] = position
+
+    def parse(self, name, expression):
+        aliases = {column: alias for alias, column in self.names.items()}
+
+        def quote(match):
+            # One alias per column, so repeated backticked subexpressions compare equal
+            column = match.group(1)
+            if column not in aliases:
+                aliases[column] = f"__column_{len(self.names)}"
+                self.names[aliases[column]] = column
+            return aliases[column]
+        text = re.sub(r'`([^`]+)`', quote, expression.strip())
+        try:
+            return ast.parse(text, mode='eval').body
+        except SyntaxError as e:
+            raise ExpressionError(f"Invalid expression for '{name}': {e.msg}") from e
+
+    def column(self, node):
+        return self.names.get(node.id, node.id)
+
+    def check(self):
+        """Parse and type-check every expression; return a list of error messages."""
+        errors = []
+        for position, (name, expression) in enumerate(self.definitions):
+            try:
+                self.trees[position] = self.parse(name, expression)
+            except ExpressionError as e:
+                errors.append(str(e))
+        for self.current, tree in self.trees.items():
+            errors += self.check_tree(self.definitions[self.current][0], tree, numeric=False)
+        return errors
+
+    def check_tree(self, name, node, numeric):
+        errors = []
+        if isinstance(node, ast.Name):
+            column = self.column(node)
+            if column in self.scopes[self.current]:
+                return errors
+            if column not in self.df.columns:
+                return [f"Unknown column '{column}' in the expression for '{name}'."]
+            dtype = self.df[column].dtype
+            if numeric and not (pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)):
+                errors.append(f"Column '{column}' ({dtype}) is not numeric but is used in arithmetic for '{name}'.")
+            return errors
+        if isinstance(node, ast.Constant):
+            return errors
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+            children, numeric = [node.left, node.right], True
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd, ast.Not, ast.Invert)):
+            children, numeric = [node.operand], isinstance(node.op, (ast.USub, ast.UAdd))
+        elif isinstance(node, ast.BoolOp):
+            children, numeric = node.values, False
+        elif isinstance(node, ast.Compare) and all(type(op) in COMPARE_OPERATORS for op in node.ops):
+            children, numeric = [node.left] + node.comparators, False
+        elif isinstance(node, ast.Call) and function_name(node) in FUNCTIONS and not node.keywords:
+            children = node.args
+            numeric = function_name(node) != 'where'
+        else:
+            return [f"Unsupported syntax '{ast.unparse(node)}' in the expression for '{name}'."]
+        for child in children:
+            errors += self.check_tree(name, child, numeric)
+        return errors
+
+    def binding(self, node):
+        """What a name refers to in the definition being evaluated: an earlier result or a df column."""
+        column = self.column(node)
+        position = self.scopes[self.current].get(column)
+        if position is not None:
+            return f'result:{position}'
+        return f'column:{column}'
+
+    def key(self, node):
+        """Memo key of a node: its structure with every name replaced by its binding.
+
+        `conf*2` in the first definition of conf reads the df column, while
+        after it the same text reads the new conf; the two keys differ, so
+        only subexpressions computing the same thing share a result.
+        """
+        key = self.keys.get(id(node))
+        if key is None:
+            resolved = copy.deepcopy(node)
+            for name in ast.walk(resolved):
+                if isinstance(name, ast.Name):
+                    name.id = self.binding(name)
+            key = self.keys[id(node)] = ast.dump(resolved)
+        return key
+
+    def find_shared(self):
+        counts = {}
+        for self.current, tree in self.trees.items():
+            for node in ast.walk(tree):
+                if isinstance(node, COMPOUND_NODES):
+                    key = self.key(node)
+                    counts[key] = counts.get(key, 0) + 1
+        self.shared = {key for key, count in counts.items() if count > 1}
+
+    def evaluate(self):
+        """Return {name: Series} for every name defined; a redefined name keeps its last value."""
+        errors = self.check()
+        if errors:
+            raise ExpressionError("\n".join(errors))
+        self.find_shared()
+        self.results = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for self.current, tree in self.trees.items():
+                self.results[self.current] = self.value(tree)
+        return {name: self.to_series(self.results[position])
+                for position, (name, _) in enumerate(self.definitions)}
+
+    def to_series(self, values):
+        if np.ndim(values) == 0:
+            values = np.full(len(self.df), values)
+        return pd.Series(values, index=self.df.index)
+
+    def value(self, node):
+        """Evaluate a node, reusing the result of an identical subexpression."""
+        key = self.key(node)
+        if key in self.memo:
+            return self.memo[key]
+        result = None
+        if numexpr is not None and isinstance(node, COMPOUND_NODES):
+            try:
+                inputs = {}
+                text = self.numexpr_text(node, inputs, top=True)
+                result = numexpr.evaluate(text, local_dict=inputs)
+            except Exception:
+                result = None
+        if result is None:
+            result = self.numpy_value(node)
+        if key in self.shared:
+            self.memo[key] = result
+        return result
+
+    def leaf(self, node):
+        if isinstance(node, ast.Constant):
+            return node.value
+        binding = self.binding(node)
+        if binding.startswith('result:'):
+            return self.results[int(binding[len('result:'):])]
+        return column_values(self.df[self.column(node)])
+
+    def numpy_value(self, node):
+        if isinstance(node, (ast.Name, ast.Constant)):
+            return self.leaf(node)
+        if isinstance(node, ast.BinOp):
+            return BINARY_OPERATORS[type(node.op)][1](self.value(node.left), self.value(node.right))
+        if isinstance(node, ast.UnaryOp):
+            operand = self.value(node.operand)
+            if isinstance(node.op, ast.USub):
+                return np.negative(operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            return np.logical_not(operand)
+        if isinstance(node, ast.BoolOp):
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            result = self.value(node.values[0])
+            for part in node.values[1:]:
+                result = combine(result, self.value(part))
+            return result
+        if isinstance(node, ast.Compare):
+            result, left = None, self.value(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.value(comparator)
+                part = COMPARE_OPERATORS[type(op)][1](left, right)
+                result = part if result is None else np.logical_and(result, part)
+                left = right
+            return result
+        # Call
+        return FUNCTIONS[function_name(node)][1](*(self.value(arg) for arg in node.args))
+
+    def numexpr_text(self, node, inputs, top=False):
+        """Render a subtree for numexpr; shared subexpressions and leaves become inputs."""
+        if not top and (self.key(node) in self.shared or isinstance(node, (ast.Name, ast.Constant))):
+            if isinstance(node, ast.Constant):
+                if isinstance(node.value, (bool, int, float)):
+                    return repr(node.value)
+                raise TypeError("numexpr only takes numbers")
+            values = self.value(node)
+            if getattr(values, 'dtype', None) == object:
+                raise TypeError("numexpr only takes numbers")
+            alias = f"v{len(inputs)}"
+            inputs[alias] = values
+            return alias
+        if isinstance(node, (ast.Name, ast.Constant)):
+            raise TypeError("nothing to compile")
+        if isinstance(node, ast.BinOp):
+            symbol = BINARY_OPERATORS[type(node.op)][0]
+            if symbol is None:
+                raise TypeError("unsupported by numexpr")
+            return f"({self.numexpr_text(node.left, inputs)} {symbol} {self.numexpr_text(node.right, inputs)})"
+        if isinstance(node, ast.UnaryOp):
+            symbol = {ast.USub: '-', ast.UAdd: '+', ast.Not: '~', ast.Invert: '~'}[type(node.op)]
+            return f"({symbol}{self.numexpr_text(node.operand, inputs)})"
+        if isinstance(node, ast.BoolOp):
+            symbol = ' & ' if isinstance(node.op, ast.And) else ' | '
+            return "(" + symbol.join(self.numexpr_text(v, inputs) for v in node.values) + ")"
+        if isinstance(node, ast.Compare):
+            parts, left = [], self.numexpr_text(node.left, inputs)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.numexpr_text(comparator, inputs)
+                parts.append(f"({left} {COMPARE_OPERATORS[type(op)][0]} {right})")
+                left = right
+            return "(" + " & ".join(parts) + ")"
+        name = FUNCTIONS[function_name(node)][0]
+        if name is None:
+            raise TypeError("unsupported by numexpr")
+        return f"{name}(" + ", ".join(self.numexpr_text(arg, inputs) for arg in node.args) + ")"
+
+
+def evaluate_expressions(df, expressions):
+    """Evaluate {name: expression} (or (name, expression) pairs) on df in one batch.
+
+    Returns {name: Series}.
+
+    Raises ExpressionError listing every problem found before evaluation.
+    """
+    return ExpressionBatch(df, expressions).evaluate()
+
+
+def parse_definitions(text):
+    """Parse 'name = expression' lines into (name, expression) pairs, skipping blank lines.
+
+    A name may appear more than once; later lines see the earlier values.
+    """
+    definitions = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        name, sep, expression = line.partition('=')
+        if not sep or not name.strip() or not expression.strip() or expression.startswith('='):
+            raise ExpressionError(f"Line {number} is not of the form 'name = expression'.")
+        definitions.append((name.strip(), expression.strip()))
+    return definitions
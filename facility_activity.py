@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+# Activity state of a facility in a month, in code order
+ACTIVITY_STATES = ['Not started', 'Active', 'Gap', 'Closed']
+NOT_STARTED, ACTIVE, GAP, CLOSED = range(len(ACTIVITY_STATES))
+
+# Silent months between two reports from which the facility counts as temporarily closed
+GAP_MONTHS = 6
+
+# Silent months up to the last month of the data from which the facility counts as closed
+CLOSURE_MONTHS = 12
+
+
+def run_lengths(matrix):
+    """(row, start, length, value) of every run of equal values along the rows of a matrix.
+
+    The matrix is scanned once as a flat array, with a forced break at the
+    start of every row.
+    """
+    width = matrix.shape[1]
+    flat = matrix.ravel()
+    if flat.size == 0:
+        empty = np.zeros(0, dtype='int64')
+        return empty, empty, empty, flat
+    change = np.empty(flat.size, dtype=bool)
+    change[0] = True
+    change[1:] = flat[1:] != flat[:-1]
+    change[::width] = True
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.r_[starts, flat.size])
+    return starts // width, starts % width, lengths, flat[starts]
+
+
+def run_states(starts, lengths, values, width, gap_months=GAP_MONTHS, closure_months=CLOSURE_MONTHS):
+    """Activity state of each run of a reported/not-reported matrix.
+
+    Reported runs are active. Silent runs before the first report are not
+    started; silent runs reaching the last month are closed from
+    closure_months on; silent runs between two reports are gaps from
+    gap_months on. Shorter silences stay active: the facility is expected
+    and did not report.
+    """
+    leading = starts == 0
+    trailing = starts + lengths == width
+    states = np.full(len(values), ACTIVE, dtype='int8')
+    silent = ~values.astype(bool)
+    states[silent & ~leading & ~trailing & (lengths >= gap_months)] = GAP
+    states[silent & ~leading & trailing & (lengths >= closure_months)] = CLOSED
+    states[silent & leading] = NOT_STARTED
+    return states
+
+
+class FacilityActivity:
+    """Run-length model of when every facility was active, over a (facility x month) grid.
+
+    The grid spans every calendar month from the first to the last month
+    of the data, so that months without any row count as not reported.
+    The runs of reported and silent months of all facilities are found in
+    one pass over the flattened grid; each run gets one state (see
+    run_states) and the states are painted back with one np.repeat.
+    """
+
+    def __init__(self, reported, facilities, months, cells=None,
+                 gap_months=GAP_MONTHS, closure_months=CLOSURE_MONTHS):
+        self.reported = reported
+        self.facilities = facilities
+        self.months = months
+        self.cells = cells
+        self.gap_months = gap_months
+        self.closure_months = closure_months
+        self.rows, self.starts, self.lengths, self.values = run_lengths(reported)
+        self.run_states = run_states(self.starts, self.lengths, self.values, reported.shape[1],
+                                     gap_months, closure_months)
+        self.status = np.repeat(self.run_states, self.lengths).reshape(reported.shape)
+
+    @classmethod
+    def from_frame(cls, df, reported, facility='hf_uid', period='YM', **thresholds):
+        """Lay the boolean `reported` flags of df's rows out on the facility x month grid.
+
+        A facility-month with several rows is reported when any of them is.
+        """
+        codes, facilities = pd.factorize(df[facility])
+        facilities = pd.Index(facilities, name=facility)
+        periods = pd.PeriodIndex(df[period], freq='M')
+        valid = (codes >= 0) & ~periods.isna()
+        ordinals = periods.asi8
+        first = ordinals[valid].min() if valid.any() else 0
+        width = int(ordinals[valid].max() - first + 1) if valid.any() else 0
+        cols = np.where(valid, ordinals - first, -1)
+        rows = np.where(valid, codes, -1)
+
+        grid = np.zeros((len(facilities), width), dtype=bool)
+        hit = valid & np.asarray(reported, dtype=bool)
+        grid[rows[hit], cols[hit]] = True
+        months = pd.period_range(pd.Period(ordinal=first, freq='M'), periods=width, freq='M')
+        return cls(grid, facilities, months, (rows, cols), **thresholds)
+
+    def row_states(self):
+        """Activity state (categorical) of every row of the frame the model was built from."""
+        rows, cols = self.cells
+        codes = np.full(len(rows), -1, dtype='int8')
+        placed = rows >= 0
+        codes[placed] = self.status[rows[placed], cols[placed]]
+        return pd.Categorical.from_codes(codes, ACTIVITY_STATES)
+
+    def summary(self):
+        """One row per facility: first and last report, long gaps and closure.
+
+        `long_gaps` counts the gaps the facility reopened from (every gap
+        ends in a report), `last_reopened` is the month of the latest such
+        report and `closed_from` the first month of a closure.
+        """
+        n = len(self.facilities)
+        reported_runs = self.values.astype(bool)
+        ends = self.starts + self.lengths
+        gaps = self.run_states == GAP
+        closed = self.run_states == CLOSED
+
+        first = np.full(n, self.reported.shape[1])
+        np.minimum.at(first, self.rows[reported_runs], self.starts[reported_runs])
+        first[first == self.reported.shape[1]] = -1
+        last = np.full(n, -1)
+        np.maximum.at(last, self.rows[reported_runs], ends[reported_runs] - 1)
+        reopened = np.full(n, -1)
+        np.maximum.at(reopened, self.rows[gaps], ends[gaps])
+        # A facility has at most one closing run, the last one
+        closed_from = np.full(n, -1)
+        closed_from[self.rows[closed]] = self.starts[closed]
+        longest = np.zeros(n, dtype='int64')
+        np.maximum.at(longest, self.rows[gaps], self.lengths[gaps])
+
+        return pd.DataFrame({
+            'first_month_reported': self.month_at(first),
+            'last_month_reported': self.month_at(last),
+            'long_gaps': np.bincount(self.rows[gaps], minlength=n),
+            'longest_gap': longest,
+            'last_reopened': self.month_at(reopened),
+            'closed': closed_from >= 0,
+            'closed_from': self.month_at(closed_from),
+            'active_months': (self.status == ACTIVE).sum(axis=1),
+        }, index=pd.Index(self.facilities))
+
+    def month_at(self, cols):
+        """Months of grid columns, NaT where the column is -1."""
+        months = pd.PeriodIndex(self.months, freq='M')
+        if not len(months):
+            return pd.PeriodIndex([pd.NaT] * len(cols), freq='M')
+        return months[np.clip(cols, 0, None)].where(cols >= 0)
+
+    def denominators(self, groups=None):
+        """Active facilities per month, for the whole country or per group of facilities.
+
+        `groups` labels every facility (in self.facilities order); the
+        counts of all groups come from one scatter-add over the grid.
+        Returns a frame of months x groups ('Active' without groups).
+        """
+        active = (self.status == ACTIVE).astype('int64')
+        if groups is None:
+            return pd.DataFrame({'Active': active.sum(axis=0)}, index=self.months)
+        codes, labels = pd.factorize(np.asarray(groups))
+        counts = np.zeros((len(labels), active.shape[1]), dtype='int64')
+        labelled = codes >= 0
+        np.add.at(counts, codes[labelled], active[labelled])
+        return pd.DataFrame(counts.T, index=self.months, columns=labels)
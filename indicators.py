@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+from edit_history import same_column
+
+
+def row_sum(*columns):
+    """Row-wise sum that is NaN only when every input is NaN (sum with min_count=1)."""
+    total = np.zeros_like(columns[0])
+    present = np.zeros(len(columns[0]), dtype=bool)
+    for values in columns:
+        missing = np.isnan(values)
+        total += np.where(missing, 0, values)
+        present |= ~missing
+    total[~present] = np.nan
+    return total
+
+
+def presumed(treated, confirmed):
+    """Treated minus confirmed cases, floored at zero; missing counts as zero."""
+    return np.maximum(np.nan_to_num(treated) - np.nan_to_num(confirmed), 0)
+
+
+class IndicatorGraph:
+    """Derived indicators declared as a dependency graph over count columns.
+
+    Each indicator has a list of inputs (source columns or other indicators)
+    and a function of their float64 arrays, row_sum by default. Evaluation
+    reads the source columns once into a contiguous matrix, computes each
+    indicator once in dependency order and reuses subtotals such as conf_hf
+    for both conf and pres_hf.
+    """
+
+    def __init__(self):
+        self.indicators = {}
+
+    def add(self, name, inputs, func=row_sum):
+        """Declare (or redefine) an indicator; inputs may be other indicators, in any order."""
+        self.indicators[name] = (list(inputs), func)
+        return self
+
+    def copy(self):
+        graph = IndicatorGraph()
+        graph.indicators = dict(self.indicators)
+        return graph
+
+    def sources(self):
+        """Columns read from the data: inputs that are not indicators themselves."""
+        columns = []
+        for inputs, _ in self.indicators.values():
+            columns += [c for c in inputs if c not in self.indicators and c not in columns]
+        return columns
+
+    def order(self):
+        """Indicators in dependency order."""
+        ordered, visiting = [], set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"Indicator '{name}' depends on itself.")
+            visiting.add(name)
+            for dependency in self.indicators[name][0]:
+                if dependency in self.indicators:
+                    visit(dependency)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in self.indicators:
+            visit(name)
+        return ordered
+
+    def affected(self, changed):
+        """Indicators that depend, directly or not, on any of the changed columns."""
+        affected = set()
+        for name in self.order():
+            if any(c in changed or c in affected for c in self.indicators[name][0]):
+                affected.add(name)
+        return affected
+
+    def evaluate(self, df, changed=None):
+        """Add every indicator to df and return it.
+
+        With `changed` (a collection of source column names), only the
+        indicators depending on those columns are recomputed; the others
+        must already be in df and are read back as inputs.
+        """
+        targets = self.order() if changed is None else [n for n in self.order() if n in self.affected(changed)]
+        needed = {c for name in targets for c in self.indicators[name][0]}
+        sources = [c for c in self.sources() if c in needed]
+        reused = [c for c in needed if c in self.indicators and c not in targets]
+        missing = [c for c in sources + reused if c not in df.columns]
+        if missing:
+            raise KeyError(f"Missing columns for indicators: {missing}")
+
+        # One contiguous float64 copy of the source counts; each column is a view into it
+        matrix = np.empty((len(df), len(sources)), dtype='float64', order='F')
+        for i, column in enumerate(sources):
+            matrix[:, i] = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        values = {column: matrix[:, i] for i, column in enumerate(sources)}
+        for column in reused:
+            values[column] = df[column].to_numpy(dtype='float64', na_value=np.nan)
+
+        results = {}
+        for name in targets:
+            inputs, func = self.indicators[name]
+            values[name] = results[name] = func(*(values[c] for c in inputs))
+        # Columns are added in declaration order, whatever order they were computed in
+        for name in self.indicators:
+            if name in results:
+                df[name] = results[name]
+        return df
+
+    def update(self, df, previous=None):
+        """Evaluate on df, reusing the indicators of `previous` where possible.
+
+        `previous` is an earlier evaluated version of the same rows. Only
+        the indicators fed by source columns that differ between the two
+        are recomputed; everything is computed when the rows differ. Returns
+        a new frame and leaves df untouched.
+        """
+        if (previous is None or not previous.index.equals(df.index)
+                or any(name not in previous.columns for name in self.indicators)):
+            return self.evaluate(df.copy(deep=False))
+        changed = [c for c in self.sources()
+                   if c not in df.columns or c not in previous.columns or not same_column(df[c], previous[c])]
+        # Unaffected indicators are carried over into a new frame; affected ones are overwritten there
+        carried = df.assign(**{name: previous[name] for name in self.indicators})
+        return self.evaluate(carried, changed)
+
+
+# Malaria routine indicators built from the short codes of read_plan.COLUMN_RENAME
+MALARIA_INDICATORS = (
+    IndicatorGraph()
+    .add('allout', ['allout_u5', 'allout_ov5'])
+    .add('susp', ['susp_u5_hf', 'susp_5_14_hf', 'susp_ov15_hf',
+                  'susp_u5_com', 'susp_5_14_com', 'susp_ov15_com'])
+    .add('test_hf', ['conf_hf', 'test_neg_mic_u5_hf', 'test_neg_mic_5_14_hf', 'test_neg_mic_ov15_hf',
+                     'tes_neg_rdt_u5_hf', 'tes_neg_rdt_5_14_hf', 'tes_neg_rdt_ov15_hf'])
+    .add('test_com', ['conf_com', 'tes_neg_rdt_u5_com', 'tes_neg_rdt_5_14_com', 'tes_neg_rdt_ov15_com'])
+    .add('test', ['test_hf', 'test_com'])
+    .add('conf_hf', ['test_pos_mic_u5_hf', 'test_pos_mic_5_14_hf', 'test_pos_mic_ov15_hf',
+                     'tes_pos_rdt_u5_hf', 'tes_pos_rdt_5_14_hf', 'tes_pos_rdt_ov15_hf'])
+    .add('conf_com', ['tes_pos_rdt_u5_com', 'tes_pos_rdt_5_14_com', 'tes_pos_rdt_ov15_com'])
+    .add('conf', ['conf_hf', 'conf_com'])
+    .add('maltreat_com', ['maltreat_u24_u5_com', 'maltreat_ov24_u5_com', 'maltreat_u24_5_14_com',
+                          'maltreat_ov24_5_14_com', 'maltreat_u24_ov15_com', 'maltreat_ov24_ov15_com'])
+    .add('maltreat_hf', ['maltreat_u24_u5_hf', 'maltreat_ov24_u5_hf', 'maltreat_u24_5_14_hf',
+                         'maltreat_ov24_5_14_hf', 'maltreat_u24_ov15_hf', 'maltreat_ov24_ov15_hf'])
+    .add('maltreat', ['maltreat_hf', 'maltreat_com'])
+    .add('pres_com', ['maltreat_com', 'conf_com'], presumed)
+    .add('pres_hf', ['maltreat_hf', 'conf_hf'], presumed)
+    .add('pres', ['pres_com', 'pres_hf'])
+    .add('maladm', ['maladm_u5', 'maladm_5_14', 'maladm_ov15'])
+    .add('maldth', ['maldth_u5', 'maldth_1_59m', 'maldth_10_14', 'maldth_5_9',
+                    'maldth_5_14', 'maldth_ov15', 'maldth_fem_ov15', 'maldth_mal_ov15'])
+)
@@ -0,0 +1,105 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from outliers import CORRECTION_OUTPUTS, correction_arrays, correction_frame, correction_input
+
+# Below this many rows the single-process pass is faster than starting workers
+PARALLEL_MIN_ROWS = 200_000
+
+# Shards per worker, so progress moves in small steps and slow shards balance out
+SHARDS_PER_WORKER = 4
+
+
+def shard_bounds(facilities, shards):
+    """Row ranges of about equal size that never split the rows of one facility.
+
+    `facilities` holds one code per row, with each facility's rows contiguous.
+    """
+    rows = len(facilities)
+    starts = np.flatnonzero(np.r_[True, facilities[1:] != facilities[:-1]])
+    targets = np.linspace(0, rows, shards + 1)[1:-1]
+    after = np.searchsorted(starts, targets)
+    cuts = np.unique(starts[after[after < len(starts)]])
+    edges = [0] + [int(cut) for cut in cuts if cut > 0] + [rows]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def shared_block(shape, dtype='float64'):
+    size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    return SharedMemory(create=True, size=size)
+
+
+def correct_shard(blocks, rows, width, start, stop, k, window):
+    """Worker: correct rows [start, stop) of the shared blocks in place."""
+    values_memory = SharedMemory(name=blocks['values'])
+    codes_memory = SharedMemory(name=blocks['codes'])
+    out_memory = SharedMemory(name=blocks['out'])
+    try:
+        values = np.ndarray((rows, width), dtype='float64', buffer=values_memory.buf, order='F')
+        codes = np.ndarray((rows,), dtype='int64', buffer=codes_memory.buf)
+        out = np.ndarray((len(CORRECTION_OUTPUTS), width, rows), dtype='float64', buffer=out_memory.buf)
+        out[:, :, start:stop] = correction_arrays(values[start:stop], codes[start:stop], k, window)
+        del values, codes, out
+    finally:
+        values_memory.close()
+        codes_memory.close()
+        out_memory.close()
+    return start, stop
+
+
+def correct_parallel(df, columns, by=('hf_uid', 'year'), k=1.5, window=3, workers=None, progress=None):
+    """outliers.correct_grouped spread over a process pool, sharded by facility.
+
+    The value block, the group codes and the result block live in shared
+    memory; each worker reads and writes only its own row range, so
+    nothing but a few names and numbers is pickled and the results are
+    already in the original group order when the pool finishes.
+    `progress(done, total)` is called as each shard completes. Small
+    frames, or a single worker, run in this process.
+    """
+    columns = [c for c in columns if c in df.columns]
+    df, codes, values = correction_input(df, columns, by)
+    workers = workers or os.cpu_count() or 1
+    rows, width = values.shape
+    if workers == 1 or rows < PARALLEL_MIN_ROWS:
+        arrays = correction_arrays(values, codes, k, window)
+        if progress is not None:
+            progress(1, 1)
+        return correction_frame(df, columns, arrays)
+
+    # Groups are (facility, ...) so whole facilities keep whole groups together
+    facilities = df.groupby(by[0], observed=True, sort=False).ngroup().to_numpy()
+    shards = shard_bounds(facilities, workers * SHARDS_PER_WORKER)
+    shape = (len(CORRECTION_OUTPUTS), width, rows)
+    memories = {}
+    try:
+        memories['values'] = shared_block((rows, width))
+        memories['codes'] = shared_block((rows,), 'int64')
+        memories['out'] = shared_block(shape)
+        shared_values = np.ndarray((rows, width), dtype='float64', buffer=memories['values'].buf, order='F')
+        shared_values[:] = values
+        shared_codes = np.ndarray((rows,), dtype='int64', buffer=memories['codes'].buf)
+        shared_codes[:] = codes
+        out = np.ndarray(shape, dtype='float64', buffer=memories['out'].buf)
+        blocks = {name: memory.name for name, memory in memories.items()}
+
+        # spawn rather than fork: the Streamlit server is multi-threaded
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+            futures = [pool.submit(correct_shard, blocks, rows, width, start, stop, k, window)
+                       for start, stop in shards]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                if progress is not None:
+                    progress(done, len(futures))
+        result = correction_frame(df, columns, out.copy())
+    finally:
+        # Views must go before the blocks can be closed
+        shared_values = shared_codes = out = None
+        for memory in memories.values():
+            memory.close()
+            memory.unlink()
+    return result
@@ -0,0 +1,206 @@
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from multiprocessing import get_context
+import os
+
+import matplotlib
+# Figures are only ever saved to PNG, here and in the worker processes
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from outliers import segmented_rolling
+
+# Figures rendered ahead of the one being written, per worker
+PENDING_PER_WORKER = 2
+
+# Facilities per Word document of the report; each part is saved and dropped when full
+FACILITIES_PER_DOCUMENT = 50
+
+
+# Function to detect outliers using Scatterplot with Q1 and Q3 lines
+def detect_outliers_scatterplot(df, col):
+    Q1 = df[col].quantile(0.25)
+    Q3 = df[col].quantile(0.75)
+    IQR = Q3 - Q1
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+    return df[(df[col] < lower_bound) | (df[col] > upper_bound)], lower_bound, upper_bound
+
+# Outlier correction methods
+def replace_outliers_with_mean(df, col):
+    Q1 = df[col].quantile(0.25)
+    Q3 = df[col].quantile(0.75)
+    IQR = Q3 - Q1
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+    mean_value = df[col].mean()
+    df[col] = df[col].where((df[col] >= lower_bound) & (df[col] <= upper_bound), mean_value)
+    return df
+
+def replace_outliers_with_mean_excluding(df, col):
+    Q1 = df[col].quantile(0.25)
+    Q3 = df[col].quantile(0.75)
+    IQR = Q3 - Q1
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+    mean_value = df[(df[col] >= lower_bound) & (df[col] <= upper_bound)][col].mean()
+    df[col] = df[col].where((df[col] >= lower_bound) & (df[col] <= upper_bound), mean_value)
+    return df
+
+def replace_outliers_with_median(df, col):
+    Q1 = df[col].quantile(0.25)
+    Q3 = df[col].quantile(0.75)
+    IQR = Q3 - Q1
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+    median_value = df[col].median()
+    df[col] = df[col].where((df[col] >= lower_bound) & (df[col] <= upper_bound), median_value)
+    return df
+
+def replace_outliers_with_median_excluding(df, col):
+    Q1 = df[col].quantile(0.25)
+    Q3 = df[col].quantile(0.75)
+    IQR = Q3 - Q1
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+    median_value = df[(df[col] >= lower_bound) & (df[col] <= upper_bound)][col].median()
+    df[col] = df[col].where((df[col] >= lower_bound) & (df[col] <= upper_bound), median_value)
+    return df
+
+def winsorize_column(df, col):
+    Q1 = df[col].quantile(0.25)
+    Q3 = df[col].quantile(0.75)
+    IQR = Q3 - Q1
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+    df[col] = df[col].clip(lower=lower_bound, upper=upper_bound)
+    return df
+
+# Function to calculate moving average
+def calculate_moving_avg(series, window):
+    return pd.Series(segmented_rolling(series, window=window), index=series.index)
+
+def calculate_moving_avg_excluding_outliers(series, window):
+    Q1 = series.quantile(0.25)
+    Q3 = series.quantile(0.75)
+    IQR = Q3 - Q1
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+    in_bounds = (series >= lower_bound) & (series <= upper_bound)
+    return pd.Series(segmented_rolling(series, window=window, mask=in_bounds), index=series.index)
+
+# Function to create a subplot for outlier detection and correction methods
+def create_subplot_for_outlier_detection_and_correction(filtered_df, numeric_column, adm1, adm3, Year, hf):
+    outliers, lower_bound, upper_bound = detect_outliers_scatterplot(filtered_df, numeric_column)
+
+    # Create subplots (4 rows, 2 columns)
+    fig, axs = plt.subplots(4, 2, figsize=(15, 15))
+    axs = axs.flatten()
+
+    # Scatter plot for original data with outlier bounds
+    axs[0].scatter(filtered_df['year_mon'], filtered_df[numeric_column], color='blue', label='Data Points')
+    if not outliers.empty:
+        axs[0].scatter(outliers['year_mon'], outliers[numeric_column], color='red', label='Outliers')
+    axs[0].axhline(lower_bound, color='blue', linestyle='--', label='Lower Bound')
+    axs[0].axhline(upper_bound, color='red', linestyle='--', label='Upper Bound')
+    axs[0].set_title(f'Outlier Detection for {numeric_column}')
+
+    # Replace outliers with mean including outliers
+    mean_incld_df = replace_outliers_with_mean(filtered_df.copy(), numeric_column)
+    axs[1].scatter(mean_incld_df['year_mon'], mean_incld_df[numeric_column], color='blue', label='Corrected Data')
+    axs[1].axhline(lower_bound, color='blue', linestyle='--', label='Lower Bound')
+    axs[1].axhline(upper_bound, color='red', linestyle='--', label='Upper Bound')
+    axs[1].set_title(f'Mean (Including Outliers) for {numeric_column}')
+
+    # Replace outliers with mean excluding outliers
+    mean_excld_df = replace_outliers_with_mean_excluding(filtered_df.copy(), numeric_column)
+    axs[2].scatter(mean_excld_df['year_mon'], mean_excld_df[numeric_column], color='blue', label='Corrected Data')
+    axs[2].axhline(lower_bound, color='blue', linestyle='--', label='Lower Bound')
+    axs[2].axhline(upper_bound, color='red', linestyle='--', label='Upper Bound')
+    axs[2].set_title(f'Mean (Excluding Outliers) for {numeric_column}')
+
+    # Replace outliers with median including outliers
+    median_incld_df = replace_outliers_with_median(filtered_df.copy(), numeric_column)
+    axs[3].scatter(median_incld_df['year_mon'], median_incld_df[numeric_column], color='blue', label='Corrected Data')
+    axs[3].axhline(lower_bound, color='blue', linestyle='--', label='Lower Bound')
+    axs[3].axhline(upper_bound, color='red', linestyle='--', label='Upper Bound')
+    axs[3].set_title(f'Median (Including Outliers) for {numeric_column}')
+
+    # Replace outliers with median excluding outliers
+    median_excld_df = replace_outliers_with_median_excluding(filtered_df.copy(), numeric_column)
+    axs[4].scatter(median_excld_df['year_mon'], median_excld_df[numeric_column], color='blue', label='Corrected Data')
+    axs[4].axhline(lower_bound, color='blue', linestyle='--', label='Lower Bound')
+    axs[4].axhline(upper_bound, color='red', linestyle='--', label='Upper Bound')
+    axs[4].set_title(f'Median (Excluding Outliers) for {numeric_column}')
+
+    # Winsorization
+    winsorized_df = winsorize_column(filtered_df.copy(), numeric_column)
+    axs[5].scatter(winsorized_df['year_mon'], winsorized_df[numeric_column], color='blue', label='Winsorized Data')
+    axs[5].axhline(lower_bound, color='blue', linestyle='--', label='Lower Bound')
+    axs[5].axhline(upper_bound, color='red', linestyle='--', label='Upper Bound')
+    axs[5].set_title(f'Winsorization for {numeric_column}')
+
+    # Moving average including all values
+    moving_avg_incld = calculate_moving_avg(filtered_df[numeric_column], window=3)
+    axs[6].scatter(filtered_df['year_mon'], moving_avg_incld, color='blue', label='Moving Average (Included)')
+    axs[6].axhline(lower_bound, color='blue', linestyle='--', label='Lower Bound')
+    axs[6].axhline(upper_bound, color='red', linestyle='--', label='Upper Bound')
+    axs[6].set_title(f'Moving Average (Including Outliers) for {numeric_column}')
+
+    # Moving average excluding outliers
+    moving_avg_excld = calculate_moving_avg_excluding_outliers(filtered_df[numeric_column], window=3)
+    axs[7].scatter(filtered_df['year_mon'], moving_avg_excld, color='blue', label='Moving Average (Excluded)')
+    axs[7].axhline(lower_bound, color='blue', linestyle='--', label='Lower Bound')
+    axs[7].axhline(upper_bound, color='red', linestyle='--', label='Upper Bound')
+    axs[7].set_title(f'Moving Average (Excluding Outliers) for {numeric_column}')
+
+    # Set labels for all subplots
+    for ax in axs:
+        ax.set_xlabel('Year-Month')
+        ax.set_ylabel(numeric_column)
+
+    # Set legend for the entire figure
+    handles, labels = axs[0].get_legend_handles_labels()
+    fig.legend(handles, labels, loc='upper left', bbox_to_anchor=(-0.1, 1.05), borderaxespad=0.)
+
+    plt.tight_layout()
+    fig.suptitle(f'Outlier Detection and Correction for adm1 = {adm1}, adm3 = {adm3}, Year = {Year}, hf = {hf}, Variable = {numeric_column}', y=1.02)
+    return fig
+
+
+def figure_png(df, numeric_column, adm1, adm3, Year, hf, dpi=100):
+    """Draw the 8-panel figure of one facility and return it as PNG bytes."""
+    fig = create_subplot_for_outlier_detection_and_correction(df, numeric_column, adm1, adm3, Year, hf)
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_figures(jobs, workers=None):
+    """Render figure_png for each job on a process pool and yield the PNGs in job order.
+
+    `jobs` is a list of figure_png argument tuples. Only a few figures per
+    worker are rendered ahead of the one being consumed, so the figures in
+    flight stay bounded whatever the number of facilities; what the
+    consumer keeps of each PNG is up to it. Closing the generator (or
+    an exception in the consumer, such as a Streamlit rerun) cancels the
+    figures not started yet.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for job in jobs:
+            yield figure_png(*job)
+        return
+    pending = {}
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+    try:
+        submitted = 0
+        for index in range(len(jobs)):
+            while submitted < len(jobs) and submitted < index + workers * PENDING_PER_WORKER:
+                pending[submitted] = pool.submit(figure_png, *jobs[submitted])
+                submitted += 1
+            yield pending.pop(index).result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,122 @@
+import json
+import os
+import re
+
+import pandas as pd
+
+from outliers import ID_COLUMNS, winsorize_grouped
+
+# Data kept by the app between runs; must survive restarts, unlike the temp directory
+APP_DATA_DIR = os.environ.get('ROUTINE_APP_DATA_DIR', os.path.join(os.path.expanduser('~'), '.routine_app'))
+
+# Saved outlier states, one sub-directory per state name
+STATE_DIR = os.environ.get('OUTLIER_STATE_DIR', os.path.join(APP_DATA_DIR, 'outlier_state'))
+
+# State names become directory names, so only letters, digits, '_' and '-' are allowed
+STATE_NAME = re.compile(r'[\w-]+')
+
+
+def state_path(name, directory=STATE_DIR):
+    """Directory of the state called `name`; raises ValueError for names that are not plain words."""
+    if not isinstance(name, str) or not STATE_NAME.fullmatch(name):
+        raise ValueError(f"Invalid state name '{name}': use letters, digits, '_' and '-' only.")
+    return os.path.join(directory, name)
+
+
+def group_fingerprints(df, columns, by=('hf_uid', 'year'), id_columns=ID_COLUMNS):
+    """One 64-bit fingerprint and row count per group of the rows that feed its outlier results.
+
+    Each row is hashed together with its position in the group, and the
+    row hashes are summed per group, so any added, removed, reordered or
+    edited row changes the fingerprint of its group only.
+    """
+    by = list(by)
+    hashed = [c for c in id_columns if c in df.columns and c not in by] + list(columns)
+    frame = df[by + hashed].copy()
+    frame['_position'] = frame.groupby(by, observed=True, sort=False).cumcount()
+    row_hashes = pd.util.hash_pandas_object(frame, index=False)
+    grouped = row_hashes.groupby([df[key] for key in by], observed=True, sort=True)
+    return pd.DataFrame({'fingerprint': grouped.sum().astype('uint64'), 'rows': grouped.size()})
+
+
+class OutlierState:
+    """Results of winsorize_grouped with the fingerprint and bounds of every group.
+
+    update() compares the fingerprints of a new version of the data with
+    the stored ones, reruns the detection for the groups that are new or
+    changed only, and merges them with the stored results of the others.
+    """
+
+    def __init__(self, results, groups, columns, by=('hf_uid', 'year'), k=1.5):
+        self.results = results
+        self.groups = groups
+        self.columns = list(columns)
+        self.by = list(by)
+        self.k = k
+
+    @classmethod
+    def build(cls, df, columns, by=('hf_uid', 'year'), k=1.5):
+        """Full detection on df."""
+        results = winsorize_grouped(df, columns, by, k).reset_index(drop=True)
+        return cls(results, cls.group_table(df, results, columns, by), columns, by, k)
+
+    @staticmethod
+    def group_table(df, results, columns, by):
+        """Fingerprints of df's groups next to the bounds stored in the results."""
+        bounds = [f'{c}_{side}_bound' for c in columns for side in ('lower', 'upper')]
+        first = results.groupby(list(by), observed=True, sort=True)[bounds].first()
+        return group_fingerprints(df, columns, by).join(first)
+
+    def matches(self, columns, by, k):
+        return self.columns == list(columns) and self.by == list(by) and self.k == k
+
+    def update(self, df, columns=None, by=None, k=None):
+        """Return (new state, number of groups recomputed) for a new version of the data.
+
+        Falls back to a full run when the columns, keys or multiplier differ.
+        """
+        columns = self.columns if columns is None else list(columns)
+        by = self.by if by is None else list(by)
+        k = self.k if k is None else k
+        if not self.matches(columns, by, k):
+            state = OutlierState.build(df, columns, by, k)
+            return state, len(state.groups)
+
+        fingerprints = group_fingerprints(df, columns, by)
+        known = fingerprints.index.isin(self.groups.index)
+        previous = self.groups['fingerprint'].reindex(fingerprints.index, fill_value=0)
+        changed = fingerprints.index[~known | (fingerprints['fingerprint'].to_numpy() != previous.to_numpy())]
+        unchanged = fingerprints.index.difference(changed)
+
+        rows = pd.MultiIndex.from_frame(df[by])
+        fresh = winsorize_grouped(df[rows.isin(changed)], columns, by, k)
+        kept = self.results[pd.MultiIndex.from_frame(self.results[by]).isin(unchanged)]
+        results = pd.concat([kept, fresh], ignore_index=True)
+        # Each group comes whole from one part, so a stable sort restores the full-run order
+        results = results.sort_values(by, kind='stable').reset_index(drop=True)
+
+        groups = self.groups.reindex(unchanged)
+        if len(changed):
+            groups = pd.concat([groups, OutlierState.group_table(df[rows.isin(changed)], fresh, columns, by)])
+        groups[['fingerprint', 'rows']] = fingerprints[['fingerprint', 'rows']]
+        return OutlierState(results, groups.sort_index(), columns, by, k), len(changed)
+
+    def save(self, name, directory=STATE_DIR):
+        path = state_path(name, directory)
+        os.makedirs(path, exist_ok=True)
+        self.results.to_parquet(os.path.join(path, 'results.parquet'), index=False)
+        self.groups.reset_index().to_parquet(os.path.join(path, 'groups.parquet'), index=False)
+        with open(os.path.join(path, 'state.json'), 'w') as f:
+            json.dump({'columns': self.columns, 'by': self.by, 'k': self.k}, f)
+
+    @classmethod
+    def load(cls, name, directory=STATE_DIR):
+        """The saved state called `name`, or None if there is none."""
+        path = state_path(name, directory)
+        if not os.path.exists(os.path.join(path, 'state.json')):
+            return None
+        with open(os.path.join(path, 'state.json')) as f:
+            meta = json.load(f)
+        results = pd.read_parquet(os.path.join(path, 'results.parquet'))
+        groups = pd.read_parquet(os.path.join(path, 'groups.parquet')).set_index(meta['by'])
+        return cls(results, groups, meta['columns'], meta['by'], meta['k'])
@@ -0,0 +1,258 @@
+import numpy as np
+import pandas as pd
+
+# Key malaria variables checked for outliers
+OUTLIER_COLUMNS = ['allout', 'susp', 'test', 'conf', 'maltreat', 'pres', 'maladm', 'maldth']
+
+# Identifier columns carried into the outlier exports, when present
+ID_COLUMNS = ['adm1', 'adm2', 'adm3', 'hf', 'hf_uid', 'year', 'month', 'date']
+
+OUTLIER_LABELS = ['Non-Outlier', 'Outlier']
+
+
+def grouped_iqr_bounds(df, columns, by=('hf_uid', 'year'), k=1.5):
+    """IQR fences of several columns per group, broadcast back to the rows.
+
+    One grouped quantile call computes Q1 and Q3 for every column and group;
+    the bounds are then spread to the rows through the group numbers.
+    Rows with a missing group key get NaN bounds. Returns (lower, upper)
+    as float64 arrays of shape (rows, columns).
+    """
+    values = df[list(columns)].apply(pd.to_numeric, errors='coerce').astype('float64')
+    if len(values) == 0:
+        return np.empty((0, len(columns))), np.empty((0, len(columns)))
+    grouped = values.groupby([df[key] for key in by], observed=True, sort=True)
+    quartiles = grouped.quantile([0.25, 0.75])
+    q1 = quartiles.xs(0.25, level=-1).to_numpy()
+    q3 = quartiles.xs(0.75, level=-1).to_numpy()
+    iqr = q3 - q1
+    lower = np.vstack([q1 - k * iqr, np.full((1, len(columns)), np.nan)])
+    upper = np.vstack([q3 + k * iqr, np.full((1, len(columns)), np.nan)])
+    # ngroup() is -1 for missing keys, which picks the trailing NaN row
+    codes = grouped.ngroup().to_numpy()
+    return lower[codes], upper[codes]
+
+
+def winsorize_grouped(df, columns=OUTLIER_COLUMNS, by=('hf_uid', 'year'), k=1.5, id_columns=ID_COLUMNS):
+    """Flag and winsorize IQR outliers of all columns per group in one frame.
+
+    For each column the result has `<col>`, `<col>_category`
+    ('Outlier'/'Non-Outlier'), `<col>_lower_bound`, `<col>_upper_bound`
+    and `<col>_winsorized` (values clipped to the bounds). Rows come out
+    ordered by group, as the per-group loop used to produce them, and rows
+    with a missing group key are dropped.
+    """
+    columns = [c for c in columns if c in df.columns]
+    df = df.dropna(subset=list(by)).sort_values(list(by), kind='stable')
+    lower, upper = grouped_iqr_bounds(df, columns, by, k)
+
+    out = {c: df[c] for c in id_columns if c in df.columns}
+    for i, column in enumerate(columns):
+        values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        low, high = lower[:, i], upper[:, i]
+        outlier = (values < low) | (values > high)
+        out[column] = df[column]
+        out[f'{column}_category'] = pd.Categorical.from_codes(outlier.astype('int8'), OUTLIER_LABELS)
+        out[f'{column}_lower_bound'] = low
+        out[f'{column}_upper_bound'] = high
+        out[f'{column}_winsorized'] = np.where(values < low, low, np.where(values > high, high, values))
+    return pd.DataFrame(out, index=df.index)
+
+
+def segment_bounds(groups, n):
+    """First and last row of the run of equal group codes each row belongs to."""
+    if groups is None:
+        return np.zeros(n, dtype='int64'), np.full(n, n - 1, dtype='int64')
+    groups = np.asarray(groups)
+    rows = np.arange(n)
+    change = np.ones(n, dtype=bool)
+    change[1:] = groups[1:] != groups[:-1]
+    first = np.maximum.accumulate(np.where(change, rows, 0))
+    last_change = np.ones(n, dtype=bool)
+    last_change[:-1] = change[1:]
+    last = np.minimum.accumulate(np.where(last_change, rows, n - 1)[::-1])[::-1]
+    return first, last
+
+
+def segmented_rolling(values, groups=None, window=3, center=False, mask=None, stat='mean', min_periods=1):
+    """Rolling mean or median of every group at once, without a Python call per window.
+
+    `values` are ordered by group (and time within a group); `groups` holds
+    one code per row and a window never crosses a change of code. Windows
+    follow pandas: trailing windows end at the row, centered ones cover
+    window // 2 rows before it. Values that are NaN or infinite, or where
+    `mask` is False, are left out of the statistic, and rows whose window
+    holds fewer than `min_periods` usable values get NaN. (An infinite value
+    kept in the one running sum would turn every later window into NaN,
+    across groups.)
+    """
+    if isinstance(values, pd.Series):
+        values = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    usable = np.isfinite(values)
+    if mask is not None:
+        if isinstance(mask, pd.Series):
+            mask = mask.to_numpy(dtype=bool, na_value=False)
+        usable &= np.asarray(mask, dtype=bool)
+    after = (window - 1) // 2 if center else 0
+    before = window - 1 - after
+    first, last = segment_bounds(groups, n)
+    rows = np.arange(n)
+    start = np.maximum(rows - before, first)
+    stop = np.minimum(rows + after, last) + 1
+
+    counts = np.concatenate([[0], np.cumsum(usable)])
+    count = counts[stop] - counts[start]
+    if stat == 'mean':
+        sums = np.concatenate([[0.0], np.cumsum(np.where(usable, values, 0.0))])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (sums[stop] - sums[start]) / count
+    elif stat == 'median':
+        # One (rows x window) gather; slots outside the row's window become NaN
+        positions = rows[:, None] + np.arange(-before, after + 1)
+        inside = (positions >= start[:, None]) & (positions < stop[:, None])
+        taken = np.where(usable, values, np.nan)[np.clip(positions, 0, max(n - 1, 0))]
+        taken[~inside] = np.nan
+        result = np.full(n, np.nan)
+        some = count > 0
+        result[some] = np.nanmedian(taken[some], axis=1)
+    else:
+        raise ValueError(f"Unknown rolling statistic '{stat}'.")
+    return np.where(count >= max(min_periods, 1), result, np.nan)
+
+
+# Per-column outputs of the all-methods correction, in column order
+CORRECTION_OUTPUTS = ['lower_bound', 'upper_bound', 'category',
+                      'corrected_mean_include', 'corrected_mean_exclude',
+                      'corrected_median_include', 'corrected_median_exclude',
+                      'corrected_moving_avg_include', 'corrected_moving_avg_exclude',
+                      'corrected_winsorized']
+
+
+def correction_input(df, columns, by=('hf_uid', 'year')):
+    """Rows ordered by group, their group codes and a float64 (rows x columns) block of the values."""
+    df = df.dropna(subset=list(by)).sort_values(list(by), kind='stable').reset_index(drop=True)
+    codes = df.groupby(list(by), observed=True, sort=False).ngroup().to_numpy()
+    values = np.empty((len(df), len(columns)), dtype='float64', order='F')
+    for i, column in enumerate(columns):
+        values[:, i] = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    return df, codes, values
+
+
+def correction_arrays(values, groups, k=1.5, window=3):
+    """All-methods correction of a (rows x columns) block ordered by group.
+
+    Returns a float64 array of shape (len(CORRECTION_OUTPUTS), columns, rows);
+    the category is 1 for outliers and 0 otherwise. Only the boundaries
+    between runs of equal group codes matter, so any contiguous slice of
+    whole groups can be corrected on its own.
+    """
+    rows, width = values.shape
+    if rows == 0:
+        return np.empty((len(CORRECTION_OUTPUTS), width, 0), dtype='float64')
+    change = np.ones(rows, dtype=bool)
+    change[1:] = groups[1:] != groups[:-1]
+    local = np.cumsum(change) - 1
+    frame = pd.DataFrame(values)
+    quartiles = frame.groupby(local).quantile([0.25, 0.75])
+    q1 = quartiles.xs(0.25, level=-1).to_numpy()[local]
+    q3 = quartiles.xs(0.75, level=-1).to_numpy()[local]
+
+    out = np.empty((len(CORRECTION_OUTPUTS), width, rows), dtype='float64')
+    for i in range(width):
+        series = frame[i]
+        column = values[:, i]
+        low, high = q1[:, i] - k * (q3[:, i] - q1[:, i]), q3[:, i] + k * (q3[:, i] - q1[:, i])
+        outlier = (column < low) | (column > high)
+        clean = (column >= low) & (column <= high)
+        grouped = series.groupby(local)
+        kept = series.where(clean).groupby(local)
+        filled = grouped.bfill().groupby(local).ffill().to_numpy()
+
+        out[0, i], out[1, i], out[2, i] = low, high, outlier
+        out[3, i] = np.where(outlier, grouped.transform('mean'), column)
+        out[4, i] = np.where(outlier, kept.transform('mean'), column)
+        out[5, i] = np.where(outlier, grouped.transform('median'), column)
+        out[6, i] = np.where(outlier, kept.transform('median'), column)
+        out[7, i] = np.where(np.isnan(column), np.nan, segmented_rolling(filled, local, window))
+        # The window runs over the non-outlier values only, skipping the rows in between
+        out[8, i] = np.nan
+        out[8, i, clean] = segmented_rolling(column[clean], local[clean], window)
+        out[9, i] = np.where(column < low, low, np.where(column > high, high, column))
+    return out
+
+
+def correction_frame(df, columns, arrays):
+    """The rows of df followed by the CORRECTION_OUTPUTS columns of every column."""
+    out = {}
+    for i, column in enumerate(columns):
+        for j, name in enumerate(CORRECTION_OUTPUTS):
+            if name == 'category':
+                out[f'{column}_category'] = pd.Categorical.from_codes(arrays[j, i].astype('int8'), OUTLIER_LABELS)
+            else:
+                out[f'{column}_{name}'] = arrays[j, i]
+    return pd.concat([df, pd.DataFrame(out, index=df.index)], axis=1)
+
+
+def correct_grouped(df, columns, by=('hf_uid', 'year'), k=1.5, window=3):
+    """Every outlier correction of several columns per group, in one pass.
+
+    Adds, for each column, the IQR bounds, the category and the values
+    corrected with the group mean and median (including or excluding
+    outliers), a trailing moving average over the gap-filled series, a
+    trailing moving average over the non-outlier values only (NaN where
+    the value is an outlier or missing) and the winsorized values. Rows
+    come out ordered by group and rows with a missing group key are dropped.
+    """
+    columns = [c for c in columns if c in df.columns]
+    df, codes, values = correction_input(df, columns, by)
+    return correction_frame(df, columns, correction_arrays(values, codes, k, window))
+
+
+class OutlierPlotIndex:
+    """Row positions and IQR bounds of each (hf_uid, year) group of a winsorized frame.
+
+    Built once per dataset from the output of winsorize_grouped: the group
+    index maps each key to its row positions, the bounds of the original
+    columns are read from the `<col>_lower_bound`/`<col>_upper_bound`
+    columns the detection step stored (or computed when they are absent),
+    and the bounds of the `<col>_winsorized` columns are computed for every
+    group in one grouped quantile call.
+    """
+
+    def __init__(self, df, by=('hf_uid', 'year'), k=1.5):
+        self.df = df
+        self.by = list(by)
+        self.columns = [c[:-len('_winsorized')] for c in df.columns
+                        if c.endswith('_winsorized') and c[:-len('_winsorized')] in df.columns]
+        self.positions = df.groupby(self.by, observed=True, sort=False).indices
+        winsorized = [f'{c}_winsorized' for c in self.columns]
+        self.bounds = {}
+        if self.columns:
+            stored = [c for c in self.columns if f'{c}_lower_bound' in df.columns and f'{c}_upper_bound' in df.columns]
+            missing = [c for c in self.columns if c not in stored]
+            if missing:
+                lower, upper = grouped_iqr_bounds(df, missing, by, k)
+                for i, column in enumerate(missing):
+                    self.bounds[column] = (lower[:, i], upper[:, i])
+            for column in stored:
+                self.bounds[column] = tuple(pd.to_numeric(df[f'{column}_{side}_bound'], errors='coerce')
+                                            .to_numpy(dtype='float64', na_value=np.nan) for side in ('lower', 'upper'))
+            lower, upper = grouped_iqr_bounds(df, winsorized, by, k)
+            for i, column in enumerate(winsorized):
+                self.bounds[column] = (lower[:, i], upper[:, i])
+
+    def rows(self, hf_uid, year):
+        """Row positions of one facility-year; empty when the group does not exist."""
+        return self.positions.get((hf_uid, year), np.array([], dtype='int64'))
+
+    def group(self, column, hf_uid, year):
+        """(x, values, lower, upper) of `column` for one facility-year, or None if it has no rows."""
+        rows = self.rows(hf_uid, year)
+        if len(rows) == 0:
+            return None
+        x = self.df['month'].to_numpy()[rows] if 'month' in self.df.columns else np.arange(len(rows))
+        values = pd.to_numeric(self.df[column].iloc[rows], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        lower, upper = self.bounds[column]
+        return x, values, lower[rows[0]], upper[rows[0]]
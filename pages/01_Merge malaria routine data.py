@@ -1,16 +1,14 @@
+import os
+import shutil
+import tempfile
 import streamlit as st
 import pandas as pd
+from periods import add_period_columns
+from routine_io import load_upload, check_schemas, merge_routine_files, parquet_to_csv, preview_parquet
 
 def read_file(file):
-    file_type = file.name.split('.')[-1].lower()
     try:
-        if file_type == 'csv':
-            return pd.read_csv(file)
-        elif file_type in ['xlsx', 'xls']:
-            return pd.read_excel(file, engine='openpyxl' if file_type == 'xlsx' else 'xlrd')
-        else:
-            st.error(f"Unsupported file type: {file_type}")
-            return None
+        return load_upload(file)
     except Exception as e:
         st.error(f"Error reading file {file.name}: {str(e)}")
         return None
@@ -19,6 +17,18 @@ def validate_and_combine_files(files):
     if not files:
         return None
 
+    # Compare headers before parsing anything so a bad file fails fast
+    try:
+        _, mismatches = check_schemas(files)
+    except Exception as e:
+        st.error(f"Error reading file headers: {str(e)}")
+        return None
+    for name, col_diff in mismatches.items():
+        st.error(f"Column mismatch in {name}")
+        st.write("Mismatched columns:", col_diff)
+    if mismatches:
+        return None
+
     dfs = []
     reference_df = read_file(files[0])
     
@@ -44,27 +54,75 @@ def validate_and_combine_files(files):
     combined_df = pd.concat(dfs, ignore_index=True)
     
     # Process date immediately after combining
-    month_map = {
-        'January': '01', 'February': '02', 'March': '03', 'April': '04',
-        'May': '05', 'June': '06', 'July': '07', 'August': '08',
-        'September': '09', 'October': '10', 'November': '11', 'December': '12'
-    }
-
-    combined_df[['month', 'year']] = combined_df['periodname'].str.split(' ', expand=True)
-    combined_df['month'] = combined_df['month'].map(month_map)
-    combined_df['year'] = pd.to_numeric(combined_df['year'])
-    combined_df['Date'] = combined_df['year'].astype(str) + '-' + combined_df['month']
-    combined_df = combined_df.drop(columns=['periodname', 'orgunitlevel5'])
+    combined_df = add_period_columns(combined_df, 'periodname')
+    combined_df = combined_df.drop(columns=['periodname', 'orgunitlevel5', 'period'])
     
     return combined_df
 
+def stream_merge_files(files):
+    progress_bar = st.progress(0.0)
+
+    def report(done, total, name):
+        progress_bar.progress(done / total, text=f"Parsed {name} ({done}/{total})")
+
+    out_dir = tempfile.mkdtemp(prefix='merged_routine_')
+    parquet_path = os.path.join(out_dir, 'merge_routine_data_processed.parquet')
+    try:
+        rows = merge_routine_files(files, parquet_path, progress=report)
+    except ValueError as e:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        st.error(str(e))
+        return None, 0
+    return parquet_path, rows
+
 if 'combined_df' not in st.session_state:
     st.session_state.combined_df = None
+if 'merged_parquet' not in st.session_state:
+    st.session_state.merged_parquet = None
 
 st.title("Malaria Data Processor")
 uploaded_files = st.file_uploader("Upload Excel or CSV files", type=['xlsx', 'xls', 'csv'], accept_multiple_files=True)
+streaming = st.checkbox(
+    "Streaming merge for large exports",
+    help="Checks headers first, parses files in parallel and writes the result to disk chunk by chunk."
+)
+
+if uploaded_files and streaming:
+    file_key = tuple((f.name, f.size) for f in uploaded_files)
+    if st.session_state.merged_parquet is None or st.session_state.merged_parquet[0] != file_key:
+        # The merge of the previous file set is no longer reachable; free its disk space
+        if st.session_state.merged_parquet is not None:
+            shutil.rmtree(os.path.dirname(st.session_state.merged_parquet[1]), ignore_errors=True)
+            st.session_state.merged_parquet = None
+        parquet_path, rows = stream_merge_files(uploaded_files)
+        st.session_state.merged_parquet = (file_key, parquet_path, rows) if parquet_path else None
+
+    if st.session_state.merged_parquet is not None:
+        _, parquet_path, rows = st.session_state.merged_parquet
+        st.success(f"Files processed successfully! {rows:,} rows merged.")
+        with st.expander("View Processed Data (first 1,000 rows)"):
+            st.dataframe(preview_parquet(parquet_path))
+
+        with open(parquet_path, 'rb') as f:
+            st.download_button(
+                "Download Processed Data (Parquet)",
+                f,
+                "merge_routine_data_processed.parquet",
+                "application/octet-stream"
+            )
+
+        csv_path = parquet_path.replace('.parquet', '.csv')
+        if not os.path.exists(csv_path):
+            parquet_to_csv(parquet_path, csv_path)
+        with open(csv_path, 'rb') as f:
+            st.download_button(
+                "Download Processed Data",
+                f,
+                "merge_routine_data_processed.csv",
+                "text/csv"
+            )
 
-if uploaded_files:
+elif uploaded_files:
     combined_df = validate_and_combine_files(uploaded_files)
     
     if combined_df is not None:
@@ -1,32 +1,21 @@
 import streamlit as st
 from io import BytesIO
 import pandas as pd
+from routine_io import load_upload_keyed
+from outliers import OutlierPlotIndex
 import numpy as np
 import matplotlib.pyplot as plt
 
-# Function to detect outliers using IQR method
-def detect_outliers_iqr(series):
-    Q1 = series.quantile(0.25)
-    Q3 = series.quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    return lower_bound, upper_bound
-
-# Function to generate scatter plot for original and winsorized columns
-def generate_scatter_plot(df, column, hf_uid, year):
-    # Filter the data for the selected hf_uid and year
-    filtered_df = df[(df['hf_uid'] == hf_uid) & (df['year'] == year)]
-
-    if filtered_df.empty:
-        st.write("No data to preview.")
-        return
-
-    # Calculate outlier bounds for the original column
-    original_lower, original_upper = detect_outliers_iqr(filtered_df[column])
-
-    # Calculate outlier bounds for the winsorized column
-    winsorized_lower, winsorized_upper = detect_outliers_iqr(filtered_df[f'{column}_winsorized'])
+# Function to generate scatter plot for original and winsorized columns.
+# Figures are cached as PNG by (dataset version, hf_uid, year, column); the
+# index is passed with a leading underscore so Streamlit does not hash it.
+@st.cache_data(max_entries=500, show_spinner=False)
+def scatter_plot_png(version, hf_uid, year, column, _index):
+    original = _index.group(column, hf_uid, year)
+    if original is None:
+        return None
+    months, values, original_lower, original_upper = original
+    _, winsorized, winsorized_lower, winsorized_upper = _index.group(f'{column}_winsorized', hf_uid, year)
 
     # Create scatter plot
     fig, axes = plt.subplots(1, 2, figsize=(15, 6), sharey=True)
@@ -36,13 +25,9 @@ def generate_scatter_plot(df, column, hf_uid, year):
 
     # Scatter plot for the original column
     axes[0].scatter(
-        filtered_df['month'],
-        filtered_df[column],
-        c=np.where(
-            (filtered_df[column] < original_lower) | (filtered_df[column] > original_upper),
-            'red',
-            'blue'
-        ),
+        months,
+        values,
+        c=np.where((values < original_lower) | (values > original_upper), 'red', 'blue'),
         alpha=0.7
     )
     axes[0].axhline(original_lower, color='green', linestyle='--')
@@ -53,14 +38,9 @@ def generate_scatter_plot(df, column, hf_uid, year):
 
     # Scatter plot for the winsorized column
     axes[1].scatter(
-        filtered_df['month'],
-        filtered_df[f'{column}_winsorized'],
-        c=np.where(
-            (filtered_df[f'{column}_winsorized'] < winsorized_lower) |
-            (filtered_df[f'{column}_winsorized'] > winsorized_upper),
-            'red',
-            'blue'
-        ),
+        months,
+        winsorized,
+        c=np.where((winsorized < winsorized_lower) | (winsorized > winsorized_upper), 'red', 'blue'),
         alpha=0.7
     )
     axes[1].axhline(winsorized_lower, color='green', linestyle='--')
@@ -79,7 +59,17 @@ def generate_scatter_plot(df, column, hf_uid, year):
     fig.legend(handles=handles, loc='center left', bbox_to_anchor=(0.85, 0.5), fontsize=10)
 
     plt.tight_layout(rect=[0, 0, 0.85, 1])
-    st.pyplot(fig)
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png')
+    plt.close(fig)
+    return buffer.getvalue()
+
+def generate_scatter_plot(index, version, column, hf_uid, year):
+    png = scatter_plot_png(version, hf_uid, year, column, index)
+    if png is None:
+        st.write("No data to preview.")
+        return
+    st.image(png)
 
 # Streamlit app setup
 st.title("Scatter Plot for Original and Winsorized Columns")
@@ -87,10 +77,7 @@ st.title("Scatter Plot for Original and Winsorized Columns")
 uploaded_file = st.file_uploader("Upload your dataset (CSV or Excel):", type=["csv", "xlsx"])
 
 if uploaded_file:
-    if uploaded_file.name.endswith(".csv"):
-        df = pd.read_csv(uploaded_file)
-    else:
-        df = pd.read_excel(uploaded_file)
+    df, version = load_upload_keyed(uploaded_file)
 
     if df.empty:
         st.write("No data to preview.")
@@ -98,6 +85,12 @@ if uploaded_file:
         st.write("### Preview of the uploaded dataset:")
         st.write(df.head())
 
+        # Group positions and bounds are indexed once per uploaded file
+        if st.session_state.get('outlier_plot_index_key') != version:
+            st.session_state.outlier_plot_index = OutlierPlotIndex(df)
+            st.session_state.outlier_plot_index_key = version
+        index = st.session_state.outlier_plot_index
+
         # Allow user to select hf_uid, year, and column for visualization
         unique_hf_uids = df['hf_uid'].unique()
         unique_years = df['year'].unique()
@@ -105,12 +98,8 @@ if uploaded_file:
         selected_hf_uid = st.selectbox("Select hf_uid:", unique_hf_uids)
         selected_year = st.selectbox("Select year:", unique_years)
 
-        # Assume the dataset contains original columns and their corresponding winsorized columns
-        numeric_columns = [col for col in df.columns if col.endswith('_winsorized')]
-        original_columns = [col.replace('_winsorized', '') for col in numeric_columns]
-        column_mapping = dict(zip(original_columns, numeric_columns))
-
-        selected_column = st.selectbox("Select column to visualize:", original_columns)
+        # Original columns that have a corresponding winsorized column
+        selected_column = st.selectbox("Select column to visualize:", index.columns)
 
         if st.button("Generate Scatter Plot"):
-            generate_scatter_plot(df, selected_column, selected_hf_uid, selected_year)
+            generate_scatter_plot(index, version, selected_column, selected_hf_uid, selected_year)
@@ -1,6 +1,7 @@
 import streamlit as st
 from io import BytesIO
 import pandas as pd
+from routine_io import load_upload
 import matplotlib.pyplot as plt
 
 # Function to generate box plot for original and winsorized columns
@@ -45,10 +46,7 @@ st.title("Box Plot for Original and Winsorized Columns")
 uploaded_file = st.file_uploader("Upload your dataset (CSV or Excel):", type=["csv", "xlsx"])
 
 if uploaded_file:
-    if uploaded_file.name.endswith(".csv"):
-        df = pd.read_csv(uploaded_file)
-    else:
-        df = pd.read_excel(uploaded_file)
+    df = load_upload(uploaded_file)
 
     if df.empty:
         st.write("No data to preview.")
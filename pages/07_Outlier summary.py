@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
 import matplotlib.pyplot as plt
 
 def generate_outlier_charts(df, column, chart_type):
@@ -82,7 +83,7 @@ def main():
     
     if uploaded_file:
         try:
-            df = pd.read_csv(uploaded_file) if uploaded_file.name.endswith(".csv") else pd.read_excel(uploaded_file)
+            df = load_upload(uploaded_file)
             
             if not df.empty:
                 st.write("### Preview of the dataset:")
@@ -1,64 +1,32 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib.colors import ListedColormap
-from matplotlib.patches import Patch
+from routine_io import load_upload
+from routine_dtypes import compact_routine_frame, format_memory_report
+from status_heatmap import render_status_heatmap
 
 def generate_heatmaps(df, selected_variables):
-    df['Status'] = df[selected_variables].sum(axis=1).apply(lambda x: 1 if x > 1 else 0).astype(int)
-    
-    custom_cmap = ListedColormap(['pink', 'lightblue'])
-    adm1_groups = df['adm1'].unique()
-    
-    n_rows, n_cols = 4, 4
-    fig, axes = plt.subplots(n_rows, n_cols, figsize=(20, 20))
-    axes = axes.flatten()
-    
-    for i, adm1 in enumerate(adm1_groups):
-        subset = df[df['adm1'] == adm1]
-        
-        hf_order = subset.groupby('hf_uid')['Status'].sum().sort_values(ascending=False).index
-        subset['hf_uid'] = pd.Categorical(subset['hf_uid'], categories=hf_order, ordered=True)
-        subset = subset.sort_values('hf_uid')
-        
-        heatmap_data = subset.pivot(index='hf_uid', columns='Date', values='Status')
-        heatmap_data.fillna(0, inplace=True)
-        
-        sns.heatmap(
-            heatmap_data,
-            cmap=custom_cmap,
-            linewidths=0,
-            cbar=False,
-            yticklabels=False,
-            annot=False,
-            ax=axes[i]
-        )
-        axes[i].set_title(f'{adm1}', fontsize=14)
-        axes[i].set_xlabel('Date', fontsize=10)
-        axes[i].tick_params(axis='x', labelrotation=90)
-    
-    for j in range(len(adm1_groups), len(axes)):
-        axes[j].axis('off')
-    
-    legend_labels = ['Do not report', 'Report']
-    legend_colors = [custom_cmap(0), custom_cmap(1)]
-    legend_patches = [Patch(color=color, label=label) 
-                     for color, label in zip(legend_colors, legend_labels)]
-    
-    fig.legend(
-        handles=legend_patches,
-        loc='upper center',
-        bbox_to_anchor=(0.5, 0.95),
-        ncol=2,
-        title='Reporting status',
-        fontsize=12,
-        title_fontsize=14
+    df['Status'] = (df[selected_variables].sum(axis=1) > 1).astype(int)
+
+    # Facilities grouped by adm1 (in order of appearance), most months reported first
+    adm1_order = {adm1: i for i, adm1 in enumerate(df['adm1'].unique())}
+    totals = df.groupby(['adm1', 'hf_uid'], observed=True)['Status'].sum().reset_index()
+    totals['adm1_order'] = totals['adm1'].map(adm1_order).astype(int)
+    totals = totals.sort_values(['adm1_order', 'Status'], ascending=[True, False], kind='stable')
+
+    # One pivot for the whole country; facility-months without a row do not report
+    heatmap_data = (df.pivot(index=['adm1', 'hf_uid'], columns='Date', values='Status')
+                    .reindex(pd.MultiIndex.from_frame(totals[['adm1', 'hf_uid']]))
+                    .fillna(0))
+
+    return render_status_heatmap(
+        heatmap_data.to_numpy(dtype='float64'),
+        heatmap_data.index.get_level_values('adm1'),
+        heatmap_data.columns,
+        levels=[0, 1],
+        colors=['pink', 'lightblue'],
+        labels=['Do not report', 'Report'],
+        title='Health Facility Reporting Status by ADM1'
     )
-    
-    plt.suptitle('Health Facility Reporting Status by ADM1', fontsize=18, y=0.98)
-    plt.tight_layout(rect=[0, 0, 1, 0.92])
-    return fig
 
 def main():
     st.title("Health Facility Reporting Status Analysis")
@@ -66,18 +34,16 @@ def main():
     uploaded_file = st.file_uploader("Upload dataset:", type=["xlsx", "xls", "csv"])
     if uploaded_file:
         try:
-            if uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-            else:
-                df = pd.read_excel(uploaded_file)
+            df, memory_report = compact_routine_frame(load_upload(uploaded_file))
+            st.caption(format_memory_report(memory_report))
             
-            numeric_cols = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
+            numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
             selected_vars = st.multiselect("Select variables for analysis:", numeric_cols)
             
             if selected_vars:
                 st.write("### Reporting Status Heatmap")
-                fig = generate_heatmaps(df, selected_vars)
-                st.pyplot(fig)
+                for image in generate_heatmaps(df, selected_vars):
+                    st.image(image)
             else:
                 st.warning("Please select variables for analysis.")
                 
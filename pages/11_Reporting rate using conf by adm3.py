@@ -1,35 +1,29 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload_keyed
+from routine_dtypes import compact_routine_frame, format_memory_report
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+from completeness import LEVELS, completeness_cube
+from facility_activity import CLOSURE_MONTHS, GAP_MONTHS
 
-def analyze_reporting(df):
-   df['report'] = df[['allout', 'susp', 'test', 'conf', 'maltreat']].sum(axis=1, min_count=1)
-   df['conf'] = pd.to_numeric(df['conf'], errors='coerce')
-   df['report_conf'] = np.where(df['conf'] > 0, 1, 0)
-   
-   df['date'] = pd.to_datetime(df['year'].astype(str) + '-' + 
-                              df['month'].astype(str).str.zfill(2))
-   
-   df['First_month_hf_reported'] = df.groupby('hf_uid')['date'].transform('min')
-   df['do_hf_expected_to_report_per_month'] = np.where(
-       df['date'] >= df['First_month_hf_reported'], 1, 0)
-
-   hf_metrics = df.groupby(['adm3', 'date']).agg(
-       num_hf_reporting_conf=('report_conf', 'sum'),
-       num_hf_expected_to_report=('do_hf_expected_to_report_per_month', 'sum')
-   ).reset_index()
-
-   hf_metrics['reporting_rate'] = (hf_metrics['num_hf_reporting_conf'] / 
-                                 hf_metrics['num_hf_expected_to_report'] * 100).round(2)
+def analyze_reporting(cube, level='adm3', variable='conf'):
+   # Facilities are expected while active (see FacilityActivity); a month counts when the value is above zero
+   rates = cube.rates(LEVELS[level], [variable])
+   hf_metrics = rates.rename(columns={
+       'YM': 'date',
+       f'reported_{variable}': f'num_hf_reporting_{variable}',
+       'expected': 'num_hf_expected_to_report',
+       f'{variable}_RR': 'reporting_rate',
+   })
+   hf_metrics['reporting_rate'] = hf_metrics['reporting_rate'].round(2)
+   hf_metrics['date'] = hf_metrics['date'].dt.strftime('%Y-%m')
 
-   heatmap_data = hf_metrics.pivot(
-       index='adm3',
-       columns='date',
-       values='reporting_rate'
-   )
-   heatmap_data.columns = pd.to_datetime(heatmap_data.columns).strftime('%Y-%m')
+   if LEVELS[level]:
+       heatmap_data = hf_metrics.pivot_table(index=LEVELS[level], columns='date', values='reporting_rate', observed=True)
+   else:
+       heatmap_data = hf_metrics.set_index('date')[['reporting_rate']].T.rename(index={'reporting_rate': 'National'})
 
    return hf_metrics, heatmap_data
 
@@ -40,12 +34,17 @@ def main():
    
    if uploaded_file:
        try:
-           if uploaded_file.name.endswith('.csv'):
-               df = pd.read_csv(uploaded_file)
-           else:
-               df = pd.read_excel(uploaded_file)
+           df, data_key = load_upload_keyed(uploaded_file)
+           df, memory_report = compact_routine_frame(df)
+           st.caption(format_memory_report(memory_report))
 
-           metrics, heatmap = analyze_reporting(df)
+           level = st.selectbox("Level:", list(LEVELS), index=list(LEVELS).index('adm3'))
+           variable = st.selectbox("Variable:", ['conf', 'allout', 'susp', 'test', 'maltreat', 'pres', 'maladm', 'maldth'])
+           gap_months = st.number_input("Silent months between reports counted as a gap:", min_value=1, value=GAP_MONTHS)
+           closure_months = st.number_input("Silent months at the end counted as a closure:", min_value=1, value=CLOSURE_MONTHS)
+           cube = completeness_cube(df, data_key, rule='positive',
+                                    gap_months=int(gap_months), closure_months=int(closure_months))
+           metrics, heatmap = analyze_reporting(cube, level, variable)
            
            st.write("### Reporting Metrics")
            st.dataframe(metrics.head())
@@ -60,9 +59,9 @@ def main():
                       cbar_kws={'label': 'Reporting Rate (%)'},
                       yticklabels=False)
            
-           plt.title('Monthly Reporting Rate by ADM3')
+           plt.title(f'Monthly {variable} Reporting Rate by {level}')
            plt.xlabel('Date')
-           plt.ylabel('ADM3')
+           plt.ylabel(level)
            plt.xticks(rotation=90)
            plt.tight_layout()
            
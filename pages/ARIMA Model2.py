@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
 import numpy as np
 from pmdarima import auto_arima
 from statsmodels.tsa.statespace.sarimax import SARIMAX
@@ -53,10 +54,7 @@ elif section == "SARIMAX Illustration":
     if uploaded_file is not None:
         # Load the dataset based on file type
         try:
-            if uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-            elif uploaded_file.name.endswith('.xlsx'):
-                df = pd.read_excel(uploaded_file)
+            df = load_upload(uploaded_file)
                 
             st.write("Here is a preview of your data:")
             st.write(df.head())
@@ -1,6 +1,7 @@
 import streamlit as st
 import geopandas as gpd
 import pandas as pd
+from routine_io import load_upload
 import matplotlib.pyplot as plt
 from matplotlib.patches import Patch
 from matplotlib.colors import ListedColormap, to_hex
@@ -15,7 +16,7 @@ uploaded_file = st.file_uploader("Upload an Excel file", type=["xlsx"])
 # Check if the file has been uploaded
 if uploaded_file is not None:
     # Load the uploaded Excel file
-    df = pd.read_excel(uploaded_file)
+    df = load_upload(uploaded_file)
 
     # Load shapefile data
     gdf = gpd.read_file("https://raw.githubusercontent.com/mohamedsillahkanu/si/2b7f982174b609f9647933147dec2a59a33e736a/Chiefdom%202021.shp")
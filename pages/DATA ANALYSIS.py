@@ -2,6 +2,7 @@ import streamlit as st
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
+from routine_io import load_upload
 import numpy as np
 from io import BytesIO
 from fpdf import FPDF
@@ -124,10 +125,7 @@ n_cols = st.sidebar.number_input("Select number of columns", min_value=1, max_va
 if data_source == "Upload Excel/CSV":
     uploaded_file = st.sidebar.file_uploader("Upload an Excel or CSV file", type=["xlsx", "csv"])
     if uploaded_file:
-        if uploaded_file.name.endswith(".xlsx"):
-            df = pd.read_excel(uploaded_file)
-        else:
-            df = pd.read_csv(uploaded_file)
+        df = load_upload(uploaded_file)
         st.write(df)  # Display the dataframe after uploading
 else:
     # Sample data
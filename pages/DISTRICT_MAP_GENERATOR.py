@@ -1,6 +1,7 @@
 import streamlit as st
 import geopandas as gpd
 import pandas as pd
+from routine_io import load_upload
 import matplotlib.pyplot as plt
 from matplotlib.patches import Patch
 from matplotlib.colors import ListedColormap, to_hex
@@ -14,7 +15,7 @@ gdf = gpd.read_file("https://raw.githubusercontent.com/mohamedsillahkanu/si/2b7f
 # File uploader for Excel file
 uploaded_file = st.file_uploader("Upload an Excel file", type=["xlsx"])
 if uploaded_file:
-    df = pd.read_excel(uploaded_file)
+    df = load_upload(uploaded_file)
 
     # Automatically select the columns "FIRST_DNAM" and "FIRST_CHIE"
     shapefile_columns = ["FIRST_DNAM", "FIRST_CHIE"]
@@ -1,5 +1,14 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
+from expressions import evaluate_expressions, parse_definitions
+from recode import bin_values, case_when, lookup, parse_literal
+from edit_history import EditHistory
+from column_stats import StatsIndex
+from routine_cube import CUBE_KEYS, AggregationCube
+from periods import DHIS2_PERIOD, infer_date_format, split_dates
+from row_filters import STALE_FILTER_ERRORS, SavedFilters, combine_specs, evaluate, query_mask
+from routine_dtypes import compact_routine_frame, format_memory_report
 import numpy as np
 import io
 import matplotlib.pyplot as plt
@@ -18,27 +27,52 @@ if 'df' not in st.session_state:
     st.session_state.df = None
 if 'saved_df' not in st.session_state:
     st.session_state.saved_df = None
-if 'history' not in st.session_state:
-    st.session_state.history = []
+if 'edit_history' not in st.session_state:
+    st.session_state.edit_history = EditHistory()
 if 'dfs' not in st.session_state:
     st.session_state.dfs = []
 
 def save_data():
     if st.session_state.df is not None:
-        st.session_state.history.append(st.session_state.df.copy())
-        if len(st.session_state.history) > 5:
-            st.session_state.history.pop(0)
-        st.session_state.saved_df = st.session_state.df.copy()
+        # Record the edit as a delta against the previous version
+        st.session_state.edit_history.record(st.session_state.df)
+        st.session_state.saved_df = st.session_state.df.copy(deep=False)
     else:
         st.warning("No data available to save.")
 
 def undo_last_action():
-    if st.session_state.history:
-        st.session_state.df = st.session_state.history.pop()
+    previous = st.session_state.edit_history.undo()
+    if previous is not None:
+        st.session_state.df = previous
+        st.session_state.saved_df = previous.copy(deep=False)
         st.success("Last action undone.")
     else:
         st.warning("No more actions to undo.")
 
+def redo_last_action():
+    following = st.session_state.edit_history.redo()
+    if following is not None:
+        st.session_state.df = following
+        st.session_state.saved_df = following.copy(deep=False)
+        st.success("Last action redone.")
+    else:
+        st.warning("No more actions to redo.")
+
+def column_stats():
+    """Column statistics of the current DataFrame, rebuilt only when its version changes."""
+    if 'column_stats' not in st.session_state:
+        st.session_state.column_stats = StatsIndex()
+    return st.session_state.column_stats.refresh(st.session_state.df, st.session_state.edit_history.version)
+
+def aggregation_cube():
+    """Aggregation cube of the current DataFrame, built once per version. None without admin/period keys."""
+    version = st.session_state.edit_history.version
+    if st.session_state.get('cube_version') != version:
+        has_keys = any(key in st.session_state.df.columns for key in CUBE_KEYS)
+        st.session_state.cube = AggregationCube(st.session_state.df) if has_keys else None
+        st.session_state.cube_version = version
+    return st.session_state.cube
+
 # Main App
 st.title("Data Processing App")
 
@@ -48,10 +82,8 @@ if data_management_option == "Import Dataset":
     if files:
         st.session_state.dfs = []
         for file in files:
-            if file.name.endswith(".csv"):
-                st.session_state.dfs.append(pd.read_csv(file))
-            elif file.name.endswith(".xlsx") or file.name.endswith(".xls"):
-                st.session_state.dfs.append(pd.read_excel(file))
+            if file.name.endswith((".csv", ".xlsx", ".xls")):
+                st.session_state.dfs.append(load_upload(file))
             else:
                 st.error(f"Unsupported file format: {file.name}")
         st.success("Datasets uploaded successfully!")
@@ -67,7 +99,8 @@ elif data_management_option == "Sanity Checks":
         if len(set(column_lengths)) == 1 and len(set(frozenset(names) for names in column_names)) == 1:
             st.success("All datasets have consistent columns. Ready to merge!")
             if st.button("Merge Datasets"):
-                st.session_state.df = pd.concat(st.session_state.dfs, ignore_index=True)
+                st.session_state.df, memory_report = compact_routine_frame(pd.concat(st.session_state.dfs, ignore_index=True))
+                st.info(format_memory_report(memory_report))
                 st.write("Merged Data:")
                 st.dataframe(st.session_state.df)
                 save_data()
@@ -93,18 +126,19 @@ elif data_management_option == "Data Cleaning":
             option = st.radio("Choose analysis type:", ["Summary Statistics", "Variable Info", "Null Values Chart"])
             if option == "Summary Statistics":
                 st.write("Summary Statistics:")
-                st.write(st.session_state.df.describe())
+                st.write(column_stats().describe())
             elif option == "Variable Info":
                 st.write("Variable Info:")
-                buffer = io.StringIO()
-                st.session_state.df.info(buf=buffer)
-                info_str = buffer.getvalue()
-                st.text(info_str)
+                stats = column_stats()
+                st.text(f"{len(st.session_state.df)} rows, {len(stats.columns)} columns, "
+                        f"{sum(s.nbytes for s in stats.columns.values()) / 1024 ** 2:,.1f} MB")
+                st.dataframe(stats.info())
             elif option == "Null Values Chart":
                 st.write("Null Values Chart:")
+                stats = column_stats()
                 for column in st.session_state.df.columns:
-                    null_count = st.session_state.df[column].isnull().sum()
-                    non_null_count = st.session_state.df[column].notnull().sum()
+                    null_count = stats[column].null_count
+                    non_null_count = stats[column].count
                     fig, ax = plt.subplots()
                     ax.bar(['Missing Values', 'Non-missing Values'], [null_count, non_null_count], color=['red', 'green'])
                     ax.set_title(f'Null vs Non-null Values for {column}')
@@ -134,9 +168,13 @@ elif data_management_option == "Data Cleaning":
                         # Create aggregation dictionary
                         agg_dict = {col: operations for col in agg_columns}
                         
-                        # Apply groupby
+                        # Apply groupby, answered from the aggregation cube when it can be
                         try:
-                            grouped_df = st.session_state.df.groupby(group_columns).agg(agg_dict)
+                            cube = aggregation_cube()
+                            if cube is not None and cube.supports(group_columns, agg_dict):
+                                grouped_df = cube.aggregate(group_columns, agg_dict)
+                            else:
+                                grouped_df = st.session_state.df.groupby(group_columns, observed=True).agg(agg_dict)
                             st.write("Grouped Data:")
                             st.dataframe(grouped_df)
                             
@@ -170,58 +208,64 @@ elif data_management_option == "Data Cleaning":
         if st.session_state.df is not None:
             st.subheader("Filter Data")
             
-            # Initialize saved filters dictionary if it doesn't exist
-            if 'saved_filters' not in st.session_state:
-                st.session_state.saved_filters = {}
+            # Saved filters keep their definition and a row bitmap, not a copy of the rows
+            if not isinstance(st.session_state.get('saved_filters'), SavedFilters):
+                st.session_state.saved_filters = SavedFilters()
+            saved_filters = st.session_state.saved_filters
+            version = st.session_state.edit_history.version
             
             filter_method = st.radio("Choose filter method:", ["Multiple Column Filter", "Advanced Filter (Query)"])
             
+            filter_specs = []
+            active_filters = {}
+            mask = np.ones(len(st.session_state.df), dtype=bool)
+            
             if filter_method == "Multiple Column Filter":
                 # Allow selecting multiple columns to filter
                 filter_columns = st.multiselect("Select columns to filter by:", st.session_state.df.columns)
                 
-                filtered_df = st.session_state.df.copy()
-                active_filters = {}
-                
+                stats = column_stats()
                 for filter_column in filter_columns:
                     st.subheader(f"Filter by {filter_column}")
                     
-                    # Display unique values for the column
-                    unique_values = st.session_state.df[filter_column].unique()
+                    # Widgets are built from the column statistics index, not the full column
+                    col_stats = stats[filter_column]
                     
                     # Handle different data types
-                    col_type = st.session_state.df[filter_column].dtype
-                    if np.issubdtype(col_type, np.number):
+                    if col_stats.numeric and col_stats.count:
                         # Numeric filter
-                        min_val = float(st.session_state.df[filter_column].min())
-                        max_val = float(st.session_state.df[filter_column].max())
+                        min_val = float(col_stats.min)
+                        max_val = float(col_stats.max)
                         
                         filter_type = st.radio(f"Filter type for {filter_column}:", ["Range", "Equal to", "Greater than", "Less than"], key=f"filter_type_{filter_column}")
                         
                         if filter_type == "Range":
                             range_min, range_max = st.slider(f"Select range for {filter_column}:", min_val, max_val, (min_val, max_val), key=f"range_{filter_column}")
-                            filtered_df = filtered_df[(filtered_df[filter_column] >= range_min) & (filtered_df[filter_column] <= range_max)]
+                            filter_specs.append(('cond', filter_column, 'between', (range_min, range_max)))
                             active_filters[filter_column] = f"Between {range_min} and {range_max}"
                         elif filter_type == "Equal to":
                             value = st.number_input(f"Enter value for {filter_column}:", min_val, max_val, key=f"equal_{filter_column}")
-                            filtered_df = filtered_df[filtered_df[filter_column] == value]
+                            filter_specs.append(('cond', filter_column, '==', value))
                             active_filters[filter_column] = f"= {value}"
                         elif filter_type == "Greater than":
                             value = st.number_input(f"Enter minimum value for {filter_column}:", min_val, max_val, key=f"gt_{filter_column}")
-                            filtered_df = filtered_df[filtered_df[filter_column] > value]
+                            filter_specs.append(('cond', filter_column, '>', value))
                             active_filters[filter_column] = f"> {value}"
                         else:  # Less than
                             value = st.number_input(f"Enter maximum value for {filter_column}:", min_val, max_val, key=f"lt_{filter_column}")
-                            filtered_df = filtered_df[filtered_df[filter_column] < value]
+                            filter_specs.append(('cond', filter_column, '<', value))
                             active_filters[filter_column] = f"< {value}"
                     else:
                         # Categorical filter with multiselect
-                        if len(unique_values) > 100:
-                            st.warning(f"Column has {len(unique_values)} unique values. Consider using a different filtering method.")
+                        if col_stats.n_distinct > 100:
+                            st.warning(f"Column has {col_stats.n_distinct} unique values. Consider using a different filtering method.")
                         
+                        unique_values = col_stats.distinct()
+                        if unique_values is None:
+                            unique_values = st.session_state.df[filter_column].dropna().unique()
                         selected_values = st.multiselect(f"Select values to include for {filter_column}:", unique_values, key=f"multiselect_{filter_column}")
                         if selected_values:
-                            filtered_df = filtered_df[filtered_df[filter_column].isin(selected_values)]
+                            filter_specs.append(('cond', filter_column, 'isin', list(selected_values)))
                             active_filters[filter_column] = f"is in {selected_values}"
             
             else:  # Advanced Filter (Query)
@@ -230,25 +274,29 @@ elif data_management_option == "Data Cleaning":
                 
                 if query:
                     try:
-                        filtered_df = st.session_state.df.query(query)
+                        mask = query_mask(st.session_state.df, query)
+                        filter_specs.append(('query', query))
                         active_filters = {"Query": query}
                     except Exception as e:
                         st.error(f"Error in query: {e}")
-                        filtered_df = st.session_state.df.copy()
-                        active_filters = {}
                 else:
-                    filtered_df = st.session_state.df.copy()
-                    active_filters = {}
                     st.warning("No filter applied. Enter a query to filter data.")
             
+            filter_spec = combine_specs('and', filter_specs) if filter_specs else None
+            if filter_method == "Multiple Column Filter" and filter_spec is not None:
+                mask = evaluate(filter_spec, st.session_state.df)
+            
             # Display summary of active filters
             if active_filters:
                 st.subheader("Active Filters")
                 for col, filter_desc in active_filters.items():
                     st.write(f"- {col}: {filter_desc}")
             
+            # Rows are only materialized here, for display and export
+            filtered_df = st.session_state.df[mask] if active_filters else st.session_state.df
+            
             # Display filtered data
-            st.subheader(f"Filtered Data ({len(filtered_df)} rows out of {len(st.session_state.df)} total)")
+            st.subheader(f"Filtered Data ({int(mask.sum())} rows out of {len(st.session_state.df)} total)")
             st.dataframe(filtered_df)
             
             # Option to save the filter with a name
@@ -257,16 +305,16 @@ elif data_management_option == "Data Cleaning":
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("Save Filter") and filter_name:
-                    # Save filter but preserve the original dataframe
-                    st.session_state.saved_filters[filter_name] = {
-                        "filtered_df": filtered_df.copy(),
-                        "active_filters": active_filters.copy()
-                    }
-                    st.success(f"Filter '{filter_name}' saved successfully. Original data preserved.")
+                    if filter_spec is None:
+                        st.warning("No filter to save.")
+                    else:
+                        # Save the filter definition; the original dataframe is untouched
+                        saved_filters.save(filter_name, filter_spec, active_filters, st.session_state.df, version, mask=mask)
+                        st.success(f"Filter '{filter_name}' saved successfully. Original data preserved.")
             
             with col2:
                 if st.button("Apply Filter as Current DataFrame") and active_filters:
-                    st.session_state.df = filtered_df.copy()
+                    st.session_state.df = filtered_df
                     st.success("Filtered data applied as the current DataFrame.")
                     save_data()
             
@@ -281,39 +329,76 @@ elif data_management_option == "Data Cleaning":
                 )
             
             # Display saved filters
-            if st.session_state.saved_filters:
+            if len(saved_filters):
                 st.subheader("Saved Filters")
-                selected_filter = st.selectbox("Select a saved filter to view or apply:", 
-                                             list(st.session_state.saved_filters.keys()))
+                st.caption(f"{len(saved_filters)} saved filters using {saved_filters.nbytes() / 1024:,.1f} KB")
+                selected_filter = st.selectbox("Select a saved filter to view or apply:", saved_filters.names())
                 
                 if selected_filter:
-                    saved_filter = st.session_state.saved_filters[selected_filter]
                     st.write("Filter criteria:")
-                    for col, filter_desc in saved_filter["active_filters"].items():
+                    for col, filter_desc in saved_filters.description(selected_filter).items():
                         st.write(f"- {col}: {filter_desc}")
                     
-                    st.write(f"Filtered data ({len(saved_filter['filtered_df'])} rows):")
-                    st.dataframe(saved_filter["filtered_df"])
+                    try:
+                        saved_mask = saved_filters.mask(selected_filter, st.session_state.df, version)
+                    except STALE_FILTER_ERRORS as e:
+                        # The filter names a column that has since been renamed, dropped or retyped
+                        saved_mask = None
+                        st.warning(f"Filter '{selected_filter}' no longer applies to the current data ({e}). "
+                                   "You can delete it below.")
+                    if saved_mask is not None:
+                        st.write(f"Filtered data ({int(saved_mask.sum())} rows):")
+                        st.dataframe(st.session_state.df[saved_mask])
                     
-                    col1, col2, col3 = st.columns(3)
+                    col1, col2 = st.columns(2)
                     with col1:
-                        if st.button("Apply This Saved Filter"):
-                            filtered_df = saved_filter["filtered_df"].copy()
-                            active_filters = saved_filter["active_filters"].copy()
-                            st.experimental_rerun()
-                    
-                    with col2:
-                        if st.button("Set As Current DataFrame"):
-                            st.session_state.df = saved_filter["filtered_df"].copy()
+                        if saved_mask is not None and st.button("Set As Current DataFrame"):
+                            st.session_state.df = st.session_state.df[saved_mask]
                             st.success(f"Filter '{selected_filter}' applied as current DataFrame.")
                             save_data()
                     
-                    with col3:
+                    with col2:
                         if st.button("Delete This Filter"):
-                            del st.session_state.saved_filters[selected_filter]
+                            saved_filters.delete(selected_filter)
                             st.success(f"Filter '{selected_filter}' deleted.")
-                            if st.session_state.saved_filters:
+                            if len(saved_filters):
                                 st.experimental_rerun()
+                
+                # Combine saved filters on their bitmaps without building intermediate frames
+                if len(saved_filters) > 1:
+                    st.subheader("Combine Saved Filters")
+                    combine_names = st.multiselect("Select saved filters to combine:", saved_filters.names())
+                    combine_op = st.radio("Combine with:", ["AND", "OR"], horizontal=True)
+                    negate = st.checkbox("Exclude matching rows (NOT)")
+                    
+                    try:
+                        combined_mask, combined_spec = saved_filters.combine(
+                            combine_names, combine_op.lower(), st.session_state.df, version, negate=negate
+                        ) if combine_names else (None, None)
+                    except STALE_FILTER_ERRORS as e:
+                        combined_mask = None
+                        st.warning(f"These filters cannot be combined on the current data ({e}). "
+                                   "Delete the filters that no longer apply.")
+
+                    if combined_mask is not None:
+                        combined_desc = f"{'NOT ' if negate else ''}({f' {combine_op} '.join(combine_names)})"
+                        st.write(f"{combined_desc}: {int(combined_mask.sum())} rows out of {len(st.session_state.df)} total")
+                        
+                        if st.checkbox("Show combined data"):
+                            st.dataframe(st.session_state.df[combined_mask])
+                        
+                        combined_name = st.text_input("Enter a name for the combined filter:")
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            if st.button("Save Combined Filter") and combined_name:
+                                saved_filters.save(combined_name, combined_spec, {"Combined": combined_desc},
+                                                   st.session_state.df, version, mask=combined_mask)
+                                st.success(f"Filter '{combined_name}' saved successfully.")
+                        with col2:
+                            if st.button("Set Combined Filter As Current DataFrame"):
+                                st.session_state.df = st.session_state.df[combined_mask]
+                                st.success("Combined filter applied as current DataFrame.")
+                                save_data()
 
     elif cleaning_option == "Compute or Create New Variable":
         st.header("Compute or Create New Variable")
@@ -323,12 +408,17 @@ elif data_management_option == "Data Cleaning":
 
             expression = st.text_input("Write your expression using column names (e.g., A + B - (C * D)):")
 
-            if st.checkbox("Add conditional logic?"):
-                condition = st.text_input("Enter the condition (e.g., A > B):", key="condition")
-                true_value = st.text_input("Enter the value when condition is true (number or text):", key="true_value")
-                false_value = st.text_input("Enter the value when condition is false (number or text):", key="false_value")
-                if condition and true_value and false_value:
-                    expression = f"np.where({condition}, {true_value}, {false_value})"
+            branches = []
+            conditional = st.checkbox("Add conditional logic?")
+            if conditional:
+                # Ordered CASE WHEN branches: the first true condition gives the value
+                num_branches = st.number_input("Number of conditions:", min_value=1, value=1)
+                for i in range(num_branches):
+                    condition = st.text_input(f"Condition {i+1} (e.g., A > B):", key=f"condition_{i}")
+                    value = st.text_input(f"Value when condition {i+1} is true (number or text):", key=f"true_value_{i}")
+                    if condition and value:
+                        branches.append((condition, parse_literal(value)))
+                false_value = st.text_input("Value when no condition is true (number or text):", key="false_value")
 
             new_var_name = st.text_input("Enter the name for the new variable:", key="new_var_name")
 
@@ -336,21 +426,52 @@ elif data_management_option == "Data Cleaning":
                 try:
                     if not new_var_name:
                         st.error("Please enter a name for the new variable.")
+                    elif conditional:
+                        if not branches:
+                            st.error("Please enter at least one condition and its value.")
+                        else:
+                            default = parse_literal(false_value) if false_value else None
+                            st.session_state.df[new_var_name] = case_when(st.session_state.df, branches, default)
+                            st.success(f"Computed new variable '{new_var_name}':")
+                            st.dataframe(st.session_state.df)
+                            save_data()
                     elif not expression:
                         st.error("Please enter a valid expression.")
                     else:
-                        st.session_state.df[new_var_name] = st.session_state.df.eval(expression, engine='python')
+                        results = evaluate_expressions(st.session_state.df, {new_var_name: expression})
+                        st.session_state.df[new_var_name] = results[new_var_name]
                         st.success(f"Computed new variable '{new_var_name}':")
                         st.dataframe(st.session_state.df)
                         save_data()
                 except Exception as e:
                     st.error(f"Error computing new variable: {e}")
+
+            # Several variables in one pass; later lines may use earlier names
+            st.subheader("Compute Several Variables")
+            definitions_text = st.text_area(
+                "One variable per line as name = expression (e.g., pos_rate = conf / test * 100):",
+                key="batch_definitions"
+            )
+            if st.button("Compute All Variables"):
+                try:
+                    definitions = parse_definitions(definitions_text)
+                    if not definitions:
+                        st.error("Please enter at least one definition.")
+                    else:
+                        results = evaluate_expressions(st.session_state.df, definitions)
+                        for name, values in results.items():
+                            st.session_state.df[name] = values
+                        st.success(f"Computed {len(results)} variables: {', '.join(results)}")
+                        st.dataframe(st.session_state.df)
+                        save_data()
+                except Exception as e:
+                    st.error(f"Error computing new variables: {e}")
         else:
             st.warning("No dataset available. Please import and merge datasets first.")
 
     elif cleaning_option == "Recode Variables":
         if st.session_state.df is not None:
-            recode_option = st.selectbox("Choose recoding option:", ["Recode a Column", "Recode Values in a Column"])
+            recode_option = st.selectbox("Choose recoding option:", ["Recode a Column", "Recode Values in a Column", "Bin a Numeric Column"])
             if recode_option == "Recode a Column":
                 column = st.selectbox("Select column to recode", st.session_state.df.columns)
                 new_name = st.text_input("New name for the selected column")
@@ -368,17 +489,36 @@ elif data_management_option == "Data Cleaning":
                 old_values = st.text_input(f"Old values for {column} (comma-separated)")
                 new_values = st.text_input(f"New values for {column} (comma-separated)")
                 if old_values and new_values:
-                    old_values_list = old_values.split(",")
-                    new_values_list = new_values.split(",")
+                    old_values_list = [value.strip() for value in old_values.split(",")]
+                    new_values_list = [parse_literal(value) for value in new_values.split(",")]
                     recode_map = dict(zip(old_values_list, new_values_list))
                     if st.button("Recode"):
-                        st.session_state.df[column] = st.session_state.df[column].replace(recode_map)
+                        # One lookup per distinct value instead of a row-wise replace
+                        st.session_state.df[column] = lookup(st.session_state.df[column], recode_map)
                         st.success("Recoded Data:")
                         st.dataframe(st.session_state.df)
                         save_data()
                 else:
                     st.error("Ensure you provide both old and new values.")
 
+            elif recode_option == "Bin a Numeric Column":
+                numeric_columns = st.session_state.df.select_dtypes(include=['number']).columns
+                column = st.selectbox("Select column to bin", numeric_columns)
+                edges = st.text_input("Bin edges (comma-separated, e.g., 0,5,15,200):")
+                labels = st.text_input("Labels for each bin (comma-separated, e.g., u5,5-14,15+):")
+                new_name = st.text_input("Name for the binned column", value=f"{column}_group" if column else "")
+                st.write("Bins include their lower edge and exclude their upper edge.")
+                if st.button("Bin"):
+                    try:
+                        edge_values = [float(edge) for edge in edges.split(",")]
+                        label_values = [label.strip() for label in labels.split(",")] if labels else None
+                        st.session_state.df[new_name] = bin_values(st.session_state.df[column], edge_values, label_values)
+                        st.success(f"Created binned column '{new_name}':")
+                        st.dataframe(st.session_state.df)
+                        save_data()
+                    except Exception as e:
+                        st.error(f"Error binning column: {e}")
+
     elif cleaning_option == "Change Data Type":
         if st.session_state.df is not None:
             col = st.selectbox("Select column to change data type:", st.session_state.df.columns)
@@ -624,72 +764,29 @@ elif data_management_option == "Data Cleaning":
                 # Preview conversion
                 if components:
                     try:
-                        # Get sample data
-                        sample_rows = st.session_state.df[column_to_split].dropna().head(5)
-                        
-                        preview_data = {"Original": sample_rows.tolist()}
-                        component_cols = {}
-                        
-                        # Initialize component columns
-                        for comp in components:
-                            component_cols[comp] = []
+                        column_values = st.session_state.df[column_to_split]
                         
-                        # Process each sample
-                        for val in sample_rows:
-                            # Try to parse the date
-                            try:
-                                if date_format == "Auto-detect":
-                                    # Try common formats
-                                    try:
-                                        # For 'January 2015' type formats
-                                        date_val = pd.to_datetime(val)
-                                    except:
-                                        try:
-                                            # For '201501' type formats
-                                            date_val = pd.to_datetime(val, format='%Y%m')
-                                        except:
-                                            # Last resort
-                                            date_val = pd.to_datetime(val, errors='coerce')
-                                
-                                elif date_format == "Month Year (e.g., 'January 2015')":
-                                    date_val = pd.to_datetime(val)
-                                
-                                elif date_format == "Year-Month (e.g., '2015-01')":
-                                    date_val = pd.to_datetime(val)
-                                
-                                elif date_format == "Day-Month-Year (e.g., '15-Jan-2020')":
-                                    date_val = pd.to_datetime(val)
-                                
-                                elif date_format == "Custom format" and custom_format:
-                                    date_val = pd.to_datetime(val, format=custom_format)
-                                
-                                # Extract components
-                                for comp in components:
-                                    if comp == "Year":
-                                        component_cols[comp].append(date_val.year)
-                                    elif comp == "Month (numeric)":
-                                        component_cols[comp].append(date_val.month)
-                                    elif comp == "Month (name)":
-                                        component_cols[comp].append(date_val.strftime("%B"))
-                                    elif comp == "Day":
-                                        component_cols[comp].append(date_val.day)
-                                    elif comp == "Quarter":
-                                        component_cols[comp].append(date_val.quarter)
-                                    elif comp == "Week of year":
-                                        component_cols[comp].append(date_val.isocalendar()[1])
-                            
-                            except Exception as e:
-                                # If parsing fails, add placeholders
-                                for comp in components:
-                                    component_cols[comp].append(f"Error: {str(e)[:20]}...")
+                        # Resolve the format once for the whole column
+                        if date_format == "Auto-detect":
+                            resolved_format = infer_date_format(column_values)
+                            st.write(f"Detected format: {resolved_format or 'none'}")
+                        elif date_format == "Month Year (e.g., 'January 2015')":
+                            resolved_format = DHIS2_PERIOD
+                        elif date_format == "Year-Month (e.g., '2015-01')":
+                            resolved_format = '%Y-%m'
+                        elif date_format == "Day-Month-Year (e.g., '15-Jan-2020')":
+                            resolved_format = '%d-%b-%Y'
+                        else:
+                            resolved_format = custom_format or None
                         
-                        # Create preview dataframe
-                        for comp, values in component_cols.items():
-                            preview_data[comp] = values
+                        # Get sample data
+                        sample_rows = column_values.dropna().head(5)
+                        preview, _, _ = split_dates(sample_rows, components, resolved_format)
+                        preview.insert(0, "Original", sample_rows)
                         
                         # Display preview
                         st.subheader("Preview of date components")
-                        st.table(pd.DataFrame(preview_data))
+                        st.table(preview.astype(object).where(preview.notna(), "Unparsed"))
                         
                         # Get column names for the new components
                         new_col_names = {}
@@ -700,29 +797,13 @@ elif data_management_option == "Data Cleaning":
                         # Apply the extraction
                         if st.button("Apply Date Extraction"):
                             try:
-                                # Try to parse all dates
-                                if date_format == "Auto-detect":
-                                    date_series = pd.to_datetime(st.session_state.df[column_to_split], errors='coerce')
-                                elif date_format == "Custom format" and custom_format:
-                                    date_series = pd.to_datetime(st.session_state.df[column_to_split], format=custom_format, errors='coerce')
-                                else:
-                                    date_series = pd.to_datetime(st.session_state.df[column_to_split], errors='coerce')
-                                
-                                # Extract and add each component
+                                extracted, unparsed, _ = split_dates(column_values, components, resolved_format)
                                 for comp, new_name in new_col_names.items():
-                                    if comp == "Year":
-                                        st.session_state.df[new_name] = date_series.dt.year
-                                    elif comp == "Month (numeric)":
-                                        st.session_state.df[new_name] = date_series.dt.month
-                                    elif comp == "Month (name)":
-                                        st.session_state.df[new_name] = date_series.dt.strftime("%B")
-                                    elif comp == "Day":
-                                        st.session_state.df[new_name] = date_series.dt.day
-                                    elif comp == "Quarter":
-                                        st.session_state.df[new_name] = date_series.dt.quarter
-                                    elif comp == "Week of year":
-                                        st.session_state.df[new_name] = date_series.dt.isocalendar().week
+                                    st.session_state.df[new_name] = extracted[comp]
                                 
+                                if unparsed.any():
+                                    st.warning(f"{int(unparsed.sum())} rows could not be parsed and were left empty. "
+                                               f"Examples: {column_values[unparsed].unique()[:5].tolist()}")
                                 st.success("Date components extracted successfully")
                                 st.dataframe(st.session_state.df)
                                 save_data()
@@ -756,6 +837,9 @@ if st.session_state.df is not None:
     if st.button("Undo Last Action"):
         undo_last_action()
         st.dataframe(st.session_state.df)
+    if st.button("Redo Last Action"):
+        redo_last_action()
+        st.dataframe(st.session_state.df)
     if st.button("Save"):
         save_data()
         st.success("Data saved successfully.")
@@ -1,5 +1,7 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload_keyed
+from routine_cube import CUBE_KEYS, AggregationCube
 import matplotlib.pyplot as plt
 from docx import Document
 from docx.shared import Inches
@@ -42,10 +44,14 @@ elif section == "Test Illustration":
     if uploaded_file is not None:
         # Load the dataset based on file type
         try:
-            if uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-            elif uploaded_file.name.endswith('.xlsx'):
-                df = pd.read_excel(uploaded_file)
+            df, file_key = load_upload_keyed(uploaded_file)
+
+            # Admin-level summaries are rolled up from a cube built once per uploaded file
+            if st.session_state.get('dummy_cube_key') != file_key:
+                has_keys = any(key in df.columns for key in CUBE_KEYS)
+                st.session_state.dummy_cube = AggregationCube(df) if has_keys else None
+                st.session_state.dummy_cube_key = file_key
+            cube = st.session_state.dummy_cube
                 
             st.write("Here is a preview of your data:")
             st.write(df.head())
@@ -62,7 +68,11 @@ elif section == "Test Illustration":
 
             for num_col in num_columns:
                 # Generate the summary table for the current numeric column
-                summary_table = df.groupby(cat_column)[num_col].agg(['count', 'mean', 'sum', 'std']).reset_index()
+                agg_dict = {num_col: ['count', 'mean', 'sum', 'std']}
+                if cube is not None and cube.supports([cat_column], agg_dict):
+                    summary_table = cube.aggregate([cat_column], agg_dict)[num_col].reset_index()
+                else:
+                    summary_table = df.groupby(cat_column)[num_col].agg(['count', 'mean', 'sum', 'std']).reset_index()
                 summary_table.columns = [cat_column, 'Count', 'Mean', 'Total', 'Std Dev']
 
                 # Format Mean and Std Dev to one decimal place
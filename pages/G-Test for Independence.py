@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
 import numpy as np
 from scipy.stats import chi2
 
@@ -26,10 +27,7 @@ uploaded_file = st.file_uploader("Choose a CSV or XLSX file", type=["csv", "xlsx
 
 if uploaded_file is not None:
     try:
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
-        elif uploaded_file.name.endswith('.xlsx'):
-            df = pd.read_excel(uploaded_file)
+        df = load_upload(uploaded_file)
         
         st.write("Here is a preview of your data:")
         st.write(df.head())
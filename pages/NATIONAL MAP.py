@@ -1,6 +1,7 @@
 import streamlit as st
 import geopandas as gpd
 import pandas as pd
+from routine_io import load_upload
 import matplotlib.pyplot as plt
 from matplotlib.patches import Patch
 from matplotlib.colors import ListedColormap, to_hex
@@ -17,10 +18,7 @@ gdf = gpd.read_file("https://raw.githubusercontent.com/mohamedsillahkanu/si/2b7f
 uploaded_file = st.file_uploader("Upload Excel or CSV file", type=["xlsx", "csv"])
 if uploaded_file is not None:
     # Read the uploaded file (Excel or CSV)
-    if uploaded_file.name.endswith('.xlsx'):
-        df = pd.read_excel(uploaded_file)
-    else:
-        df = pd.read_csv(uploaded_file)
+    df = load_upload(uploaded_file)
 
     # Exclude certain columns from being selectable for the map
     excluded_columns = ['FIRST_DNAM', 'FIRST_CHIE', 'adm3']
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
 from statsmodels.stats.multicomp import pairwise_tukeyhsd
 
 # Streamlit app layout
@@ -10,10 +11,7 @@ uploaded_file = st.file_uploader("Upload your CSV or Excel file", type=["csv", "
 
 if uploaded_file:
     # Read the uploaded file
-    if uploaded_file.name.endswith(".csv"):
-        df = pd.read_csv(uploaded_file)
-    else:
-        df = pd.read_excel(uploaded_file)
+    df = load_upload(uploaded_file)
     
     # Display the dataframe
     st.write("Here is a preview of your dataset:")
@@ -1,74 +1,12 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
+from outlier_pool import correct_parallel
+import os
 import numpy as np
 from scipy.stats import iqr
 from io import BytesIO
 
-# Helper functions
-def detect_outliers_scatterplot(series, threshold=1.5):
-    Q1 = series.quantile(0.25)
-    Q3 = series.quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - threshold * IQR
-    upper_bound = Q3 + threshold * IQR
-    return lower_bound, upper_bound
-
-def calculate_moving_avg(series, window):
-    filled_series = series.fillna(method='bfill').fillna(method='ffill')
-    moving_avg = filled_series.rolling(window=window, min_periods=1).mean()
-    return moving_avg.where(series.notna(), np.nan)
-
-def calculate_moving_avg_excluding_outliers(series, window, threshold=1.5):
-    Q1 = series.quantile(0.25)
-    Q3 = series.quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - threshold * IQR
-    upper_bound = Q3 + threshold * IQR
-
-    clean_series = series[(series >= lower_bound) & (series <= upper_bound)]
-    filled_series = clean_series.fillna(method='bfill').fillna(method='ffill')
-    moving_avg = filled_series.rolling(window=window, min_periods=1).mean()
-    return moving_avg.where(series.notna(), np.nan)
-
-def winsorize_series(series, threshold=1.5):
-    Q1 = series.quantile(0.25)
-    Q3 = series.quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - threshold * IQR
-    upper_bound = Q3 + threshold * IQR
-    return series.clip(lower=lower_bound, upper=upper_bound)
-
-def process_group(group, columns, threshold=1.5, window=3):
-    for column in columns:
-        lower_bound, upper_bound = detect_outliers_scatterplot(group[column], threshold)
-        group[f"{column}_lower_bound"] = lower_bound
-        group[f"{column}_upper_bound"] = upper_bound
-
-        group[f"{column}_category"] = np.where(
-            (group[column] < lower_bound) | (group[column] > upper_bound),
-            "Outlier", "Non-Outlier"
-        )
-
-        non_outliers = group[column][(group[column] >= lower_bound) & (group[column] <= upper_bound)]
-
-        group[f"{column}_corrected_mean_include"] = np.where(
-            group[f"{column}_category"] == "Outlier", group[column].mean(), group[column]
-        )
-        group[f"{column}_corrected_mean_exclude"] = np.where(
-            group[f"{column}_category"] == "Outlier", non_outliers.mean(), group[column]
-        )
-        group[f"{column}_corrected_median_include"] = np.where(
-            group[f"{column}_category"] == "Outlier", group[column].median(), group[column]
-        )
-        group[f"{column}_corrected_median_exclude"] = np.where(
-            group[f"{column}_category"] == "Outlier", non_outliers.median(), group[column]
-        )
-        group[f"{column}_corrected_moving_avg_include"] = calculate_moving_avg(group[column], window)
-        group[f"{column}_corrected_moving_avg_exclude"] = calculate_moving_avg_excluding_outliers(group[column], window, threshold)
-        group[f"{column}_corrected_winsorized"] = winsorize_series(group[column], threshold)
-
-    return group
-
 @st.cache_data
 def convert_df_to_excel(df):
     output = BytesIO()
@@ -82,11 +20,7 @@ st.title("Outlier Detection and Correction Tool")
 
 uploaded_file = st.file_uploader("Upload your dataset (CSV, XLSX, or XLS):", type=["csv", "xlsx", "xls"])
 if uploaded_file:
-    file_type = uploaded_file.name.split('.')[-1]
-    if file_type == "csv":
-        df = pd.read_csv(uploaded_file)
-    else:
-        df = pd.read_excel(uploaded_file)
+    df = load_upload(uploaded_file)
 
     st.write("### Dataset Preview")
     st.dataframe(df.head())
@@ -106,11 +40,20 @@ if uploaded_file:
             "Select window size for moving average:", min_value=2, max_value=10, step=1, value=3
         )
 
+        workers = st.slider(
+            "Worker processes (large datasets are split by facility across them):",
+            min_value=1, max_value=os.cpu_count() or 1, value=os.cpu_count() or 1
+        )
+
         # Add button to apply all methods
         if st.button("Apply All Methods"):
-            with st.spinner("Processing data..."):
-                grouped_df = df.groupby(['hf_uid', 'Year'])
-                df = grouped_df.apply(lambda group: process_group(group, columns_to_process, threshold, window)).reset_index(drop=True)
+            progress_bar = st.progress(0.0, text="Processing data...")
+
+            def show_progress(done, total):
+                progress_bar.progress(done / total, text=f"Processed {done} of {total} facility shards")
+
+            df = correct_parallel(df, columns_to_process, by=('hf_uid', 'Year'), k=threshold, window=window,
+                                  workers=workers, progress=show_progress)
 
             st.success("All methods applied successfully!")
 
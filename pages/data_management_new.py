@@ -1,5 +1,7 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
+from edit_history import EditHistory
 import numpy as np
 import io
 import matplotlib.pyplot as plt
@@ -18,27 +20,37 @@ if 'df' not in st.session_state:
     st.session_state.df = None
 if 'saved_df' not in st.session_state:
     st.session_state.saved_df = None
-if 'history' not in st.session_state:
-    st.session_state.history = []
+if 'edit_history' not in st.session_state:
+    st.session_state.edit_history = EditHistory()
 if 'dfs' not in st.session_state:
     st.session_state.dfs = []
 
 def save_data():
     if st.session_state.df is not None:
-        st.session_state.history.append(st.session_state.df.copy())
-        if len(st.session_state.history) > 5:
-            st.session_state.history.pop(0)
-        st.session_state.saved_df = st.session_state.df.copy()
+        # Record the edit as a delta against the previous version
+        st.session_state.edit_history.record(st.session_state.df)
+        st.session_state.saved_df = st.session_state.df.copy(deep=False)
     else:
         st.warning("No data available to save.")
 
 def undo_last_action():
-    if st.session_state.history:
-        st.session_state.df = st.session_state.history.pop()
+    previous = st.session_state.edit_history.undo()
+    if previous is not None:
+        st.session_state.df = previous
+        st.session_state.saved_df = previous.copy(deep=False)
         st.success("Last action undone.")
     else:
         st.warning("No more actions to undo.")
 
+def redo_last_action():
+    following = st.session_state.edit_history.redo()
+    if following is not None:
+        st.session_state.df = following
+        st.session_state.saved_df = following.copy(deep=False)
+        st.success("Last action redone.")
+    else:
+        st.warning("No more actions to redo.")
+
 # Main App
 st.title("Data Processing App")
 
@@ -48,10 +60,8 @@ if data_management_option == "Import Dataset":
     if files:
         st.session_state.dfs = []
         for file in files:
-            if file.name.endswith(".csv"):
-                st.session_state.dfs.append(pd.read_csv(file))
-            elif file.name.endswith(".xlsx") or file.name.endswith(".xls"):
-                st.session_state.dfs.append(pd.read_excel(file))
+            if file.name.endswith((".csv", ".xlsx", ".xls")):
+                st.session_state.dfs.append(load_upload(file))
             else:
                 st.error(f"Unsupported file format: {file.name}")
         st.success("Datasets uploaded successfully!")
@@ -244,6 +254,9 @@ if st.session_state.df is not None:
     if st.button("Undo Last Action"):
         undo_last_action()
         st.dataframe(st.session_state.df)
+    if st.button("Redo Last Action"):
+        redo_last_action()
+        st.dataframe(st.session_state.df)
     if st.button("Save"):
         save_data()
         st.success("Data saved successfully.")
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
 import re
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,7 +13,7 @@ uploaded_file = st.file_uploader("Upload an Excel file", type=["xlsx"])
 
 if uploaded_file:
     # Read the uploaded Excel file
-    df_original = pd.read_excel(uploaded_file)
+    df_original = load_upload(uploaded_file)
     
     # Create empty lists to store extracted data
     districts, chiefdoms, phu_names, community_names, school_names = [], [], [], [], []
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
 import plotly.express as px
 import io
 
@@ -42,7 +43,7 @@ def main():
     
     if uploaded_file is not None:
         # Read the uploaded file
-        df = pd.read_excel(uploaded_file)
+        df = load_upload(uploaded_file)
         
         # Process the data
         classified_results, summary_table = process_health_facility_data(df)
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
 import numpy as np
 import io
 
@@ -15,10 +16,8 @@ if uploaded_file is not None:
     # Load the data based on file type
     file_extension = uploaded_file.name.split('.')[-1].lower()
     
-    if file_extension == 'csv':
-        df = pd.read_csv(uploaded_file)
-    elif file_extension in ['xlsx', 'xls']:
-        df = pd.read_excel(uploaded_file)
+    if file_extension in ['csv', 'xlsx', 'xls']:
+        df = load_upload(uploaded_file)
     
     # Display original dataframe
     st.subheader("Original DataFrame")
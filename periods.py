@@ -0,0 +1,195 @@
+import datetime
+import re
+
+import numpy as np
+import pandas as pd
+
+MONTHS = {
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
+    'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12,
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'jun': 6, 'jul': 7, 'aug': 8,
+    'sep': 9, 'sept': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+
+# Each DHIS2 period form: (regex, pandas frequency, function building a Period from the match)
+PERIOD_FORMS = [
+    (re.compile(r'^([A-Za-z]+)\.?\s+(\d{4})$'), 'M',
+     lambda m: pd.Period(year=int(m[2]), month=MONTHS[m[1].lower()], freq='M')),
+    (re.compile(r'^(\d{4})(0[1-9]|1[0-2])$'), 'M',
+     lambda m: pd.Period(year=int(m[1]), month=int(m[2]), freq='M')),
+    (re.compile(r'^(\d{4})-(0?[1-9]|1[0-2])$'), 'M',
+     lambda m: pd.Period(year=int(m[1]), month=int(m[2]), freq='M')),
+    (re.compile(r'^(\d{4})-?W(\d{1,2})$', re.I), 'W',
+     lambda m: pd.Period(datetime.date.fromisocalendar(int(m[1]), int(m[2]), 1), freq='W-SUN')),
+    (re.compile(r'^(\d{4})-?Q([1-4])$', re.I), 'Q',
+     lambda m: pd.Period(year=int(m[1]), quarter=int(m[2]), freq='Q')),
+    (re.compile(r'^Q([1-4])\s+(\d{4})$', re.I), 'Q',
+     lambda m: pd.Period(year=int(m[2]), quarter=int(m[1]), freq='Q')),
+]
+
+
+def parse_period_label(label):
+    """Parse one DHIS2 period label into (frequency, pd.Period), or (None, NaT)."""
+    text = str(label).strip()
+    for pattern, freq, build in PERIOD_FORMS:
+        match = pattern.match(text)
+        if match:
+            try:
+                return freq, build(match)
+            except (KeyError, ValueError):
+                break
+    return None, pd.NaT
+
+
+def factorize_periods(values):
+    """Parse the distinct labels of `values` once.
+
+    Returns (codes, unique_periods): integer codes into the parsed
+    PeriodIndex of distinct labels, with -1 for missing labels.
+    """
+    codes, uniques = pd.factorize(pd.Series(values, copy=False), use_na_sentinel=True)
+    parsed = [parse_period_label(label) for label in uniques]
+
+    freqs = {freq for freq, _ in parsed if freq is not None}
+    if len(freqs) > 1:
+        raise ValueError(f"Mixed period frequencies in column: {sorted(freqs)}")
+    freq = freqs.pop() if freqs else 'M'
+    pandas_freq = 'W-SUN' if freq == 'W' else freq
+    return codes, pd.PeriodIndex([p for _, p in parsed], freq=pandas_freq)
+
+
+def broadcast(unique_values, codes, index, dtype):
+    """Expand values computed per distinct label back to one value per row."""
+    unique_values = pd.array(unique_values, dtype=dtype)
+    return pd.Series(unique_values.take(codes, allow_fill=True), index=index)
+
+
+def parse_periods(values):
+    """Parse DHIS2 period labels into a PeriodIndex aligned with `values`.
+
+    Supports monthly ("January 2023", "202301", "2023-01"), ISO weekly
+    ("2024W05") and quarterly ("2024Q1", "Q1 2024") labels. Only the
+    distinct labels are parsed; rows are filled from them through their
+    categorical codes. Unparseable labels become NaT. Raises ValueError
+    when the column mixes frequencies.
+    """
+    codes, unique_periods = factorize_periods(values)
+    return unique_periods.take(codes, allow_fill=True, fill_value=pd.NaT)
+
+
+def add_period_columns(df, column='periodname'):
+    """Add typed period columns derived from a DHIS2 period label column.
+
+    Monthly data gets `month` ('01'..'12'), `year` and `Date` ('YYYY-MM'),
+    the same columns the merge page has always produced, plus `period`.
+    Weekly and quarterly data get `year`, `week`/`quarter` and `period`.
+    Every component is computed on the distinct labels only.
+    """
+    codes, periods = factorize_periods(df[column])
+    valid = periods.notna()
+    year = np.where(valid, periods.year, None)
+    if periods.freqstr.startswith('M'):
+        month = np.where(valid, periods.month, None)
+        df['month'] = broadcast([f'{m:02d}' if m is not None else None for m in month], codes, df.index, 'string')
+        df['year'] = broadcast(year, codes, df.index, 'Int64')
+        df['Date'] = broadcast(np.where(valid, periods.strftime('%Y-%m'), None), codes, df.index, 'string')
+    elif periods.freqstr.startswith('W'):
+        iso = periods.start_time.isocalendar()
+        df['year'] = broadcast(iso['year'].to_numpy(), codes, df.index, 'Int64')
+        df['week'] = broadcast(iso['week'].to_numpy(), codes, df.index, 'Int64')
+    else:
+        df['year'] = broadcast(year, codes, df.index, 'Int64')
+        df['quarter'] = broadcast(np.where(valid, periods.quarter, None), codes, df.index, 'Int64')
+    df['period'] = pd.Series(periods.take(codes, allow_fill=True, fill_value=pd.NaT), index=df.index)
+    return df
+
+
+def month_start_dates(year, month):
+    """Build month-start timestamps from numeric year and month columns.
+
+    Uses integer month arithmetic instead of concatenating strings and
+    re-parsing them with pd.to_datetime.
+    """
+    year = pd.to_numeric(pd.Series(year), errors='coerce')
+    month = pd.to_numeric(pd.Series(month), errors='coerce')
+    months = ((year - 1970) * 12 + (month - 1)).to_numpy(dtype='float64')
+    valid = np.isfinite(months)
+    out = np.full(len(months), np.datetime64('NaT'), dtype='datetime64[M]')
+    out[valid] = months[valid].astype('int64').astype('datetime64[M]')
+    return pd.Series(out.astype('datetime64[ns]'), index=year.index)
+
+
+# Candidate formats for date columns that are not DHIS2 period labels
+DATE_FORMATS = [
+    '%Y-%m-%d', '%d-%b-%Y', '%d/%m/%Y', '%m/%d/%Y', '%Y/%m/%d', '%d-%m-%Y',
+    '%Y%m%d', '%B %Y', '%b %Y', '%Y-%m', '%Y%m', '%Y'
+]
+DHIS2_PERIOD = 'DHIS2 period'
+
+# Date components offered by the split tool, computed from a DatetimeIndex
+DATE_COMPONENTS = {
+    'Year': lambda d: (d.year, 'Int32'),
+    'Month (numeric)': lambda d: (d.month, 'Int32'),
+    'Month (name)': lambda d: (d.strftime('%B'), 'string'),
+    'Day': lambda d: (d.day, 'Int32'),
+    'Quarter': lambda d: (d.quarter, 'Int32'),
+    'Week of year': lambda d: (d.isocalendar()['week'].to_numpy(dtype='float64'), 'Int32'),
+}
+
+
+def infer_date_format(values, sample_size=200):
+    """Pick the format that parses the most of a sample of distinct labels.
+
+    DHIS2 period labels win ties. Returns None when nothing parses.
+    """
+    labels = pd.Series(pd.unique(pd.Series(values, copy=False).dropna().astype(str)))[:sample_size]
+    best, best_count = None, 0
+    period_count = sum(parse_period_label(label)[0] is not None for label in labels)
+    if period_count:
+        best, best_count = DHIS2_PERIOD, period_count
+    for date_format in DATE_FORMATS:
+        count = pd.to_datetime(labels, format=date_format, errors='coerce').notna().sum()
+        if count > best_count:
+            best, best_count = date_format, count
+    return best
+
+
+def parse_dates(values, date_format=None):
+    """Parse a date/period label column, parsing each distinct label once.
+
+    Returns (codes, unique_dates, date_format): integer codes into a
+    DatetimeIndex of the distinct labels (-1 for missing), and the format
+    used, inferred from a sample when not given.
+    """
+    values = pd.Series(values, copy=False)
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return codes, pd.DatetimeIndex(uniques), 'datetime'
+    if date_format is None:
+        date_format = infer_date_format(values)
+    labels = pd.Index(uniques).astype(str)
+    if date_format == DHIS2_PERIOD:
+        dates = pd.DatetimeIndex([p.start_time if freq else pd.NaT for freq, p in map(parse_period_label, labels)])
+    elif date_format:
+        dates = pd.DatetimeIndex(pd.to_datetime(labels, format=date_format, errors='coerce'))
+    else:
+        dates = pd.DatetimeIndex([pd.NaT] * len(labels))
+    return codes, dates, date_format
+
+
+def split_dates(values, components, date_format=None):
+    """Extract date components of a column as typed columns.
+
+    Labels are parsed once per distinct value and every component is
+    computed on the distinct dates before being broadcast to the rows.
+    Returns (components_df, unparsed, date_format) where `unparsed` is a
+    boolean mask of non-missing values that could not be parsed.
+    """
+    values = pd.Series(values, copy=False)
+    codes, dates, date_format = parse_dates(values, date_format)
+    out = pd.DataFrame(index=values.index)
+    for component in components:
+        unique_values, dtype = DATE_COMPONENTS[component](dates)
+        out[component] = broadcast(np.where(dates.isna(), None, unique_values), codes, values.index, dtype)
+    unparsed = (codes >= 0) & dates.isna()[np.maximum(codes, 0)] if len(dates) else np.zeros(len(values), dtype=bool)
+    return out, pd.Series(unparsed, index=values.index), date_format
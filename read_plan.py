@@ -0,0 +1,94 @@
+import pandas as pd
+
+from routine_io import load_upload, read_header
+
+# Registry of DHIS2 export columns and the short codes used by the routine pages.
+# It doubles as a read plan: only these columns and the period keys are parsed.
+
+ORGUNIT_RENAME = {
+    'orgunitlevel1': 'adm0',
+    'orgunitlevel2': 'adm1',
+    'orgunitlevel3': 'adm2',
+    'orgunitlevel4': 'adm3',
+    'organisationunitname': 'hf'
+}
+
+COLUMN_RENAME = {
+    "OPD (New and follow-up curative) 0-59m_X": "allout_u5",
+    "OPD (New and follow-up curative) 5+y_X": "allout_ov5",
+    "Admission - Child with malaria 0-59 months_X": "maladm_u5",
+    "Admission - Child with malaria 5-14 years_X": "maladm_5_14",
+    "Admission - Malaria 15+ years_X": "maladm_ov15",
+    "Child death - Malaria 1-59m_X": "maldth_1_59m",
+    "Child death - Malaria 10-14y_X": "maldth_10_14",
+    "Child death - Malaria 5-9y_X": "maldth_5_9",
+    "Death malaria 15+ years Female": "maldth_fem_ov15",
+    "Death malaria 15+ years Male": "maldth_mal_ov15",
+    "Separation - Child with malaria 0-59 months_X Death": "maldth_u5",
+    "Separation - Child with malaria 5-14 years_X Death": "maldth_5_14",
+    "Separation - Malaria 15+ years_X Death": "maldth_ov15",
+    "Fever case - suspected Malaria 0-59m_X": "susp_u5_hf",
+    "Fever case - suspected Malaria 5-14y_X": "susp_5_14_hf",
+    "Fever case - suspected Malaria 15+y_X": "susp_ov15_hf",
+    "Fever case in community (Suspected Malaria) 0-59m_X": "susp_u5_com",
+    "Fever case in community (Suspected Malaria) 5-14y_X": "susp_5_14_com",
+    "Fever case in community (Suspected Malaria) 15+y_X": "susp_ov15_com",
+    "Fever case in community tested for Malaria (RDT) - Negative 0-59m_X": "tes_neg_rdt_u5_com",
+    "Fever case in community tested for Malaria (RDT) - Positive 0-59m_X": "tes_pos_rdt_u5_com",
+    "Fever case in community tested for Malaria (RDT) - Negative 5-14y_X": "tes_neg_rdt_5_14_com",
+    "Fever case in community tested for Malaria (RDT) - Positive 5-14y_X": "tes_pos_rdt_5_14_com",
+    "Fever case in community tested for Malaria (RDT) - Negative 15+y_X": "tes_neg_rdt_ov15_com",
+    "Fever case in community tested for Malaria (RDT) - Positive 15+y_X": "tes_pos_rdt_ov15_com",
+    "Fever case tested for Malaria (Microscopy) - Negative 0-59m_X": "test_neg_mic_u5_hf",
+    "Fever case tested for Malaria (Microscopy) - Positive 0-59m_X": "test_pos_mic_u5_hf",
+    "Fever case tested for Malaria (Microscopy) - Negative 5-14y_X": "test_neg_mic_5_14_hf",
+    "Fever case tested for Malaria (Microscopy) - Positive 5-14y_X": "test_pos_mic_5_14_hf",
+    "Fever case tested for Malaria (Microscopy) - Negative 15+y_X": "test_neg_mic_ov15_hf",
+    "Fever case tested for Malaria (Microscopy) - Positive 15+y_X": "test_pos_mic_ov15_hf",
+    "Fever case tested for Malaria (RDT) - Negative 0-59m_X": "tes_neg_rdt_u5_hf",
+    "Fever case tested for Malaria (RDT) - Positive 0-59m_X": "tes_pos_rdt_u5_hf",
+    "Fever case tested for Malaria (RDT) - Negative 5-14y_X": "tes_neg_rdt_5_14_hf",
+    "Fever case tested for Malaria (RDT) - Positive 5-14y_X": "tes_pos_rdt_5_14_hf",
+    "Fever case tested for Malaria (RDT) - Negative 15+y_X": "tes_neg_rdt_ov15_hf",
+    "Fever case tested for Malaria (RDT) - Positive 15+y_X": "tes_pos_rdt_ov15_hf",
+    "Malaria treated in community with ACT <24 hours 0-59m_X": "maltreat_u24_u5_com",
+    "Malaria treated in community with ACT >24 hours 0-59m_X": "maltreat_ov24_u5_com",
+    "Malaria treated in community with ACT <24 hours 5-14y_X": "maltreat_u24_5_14_com",
+    "Malaria treated in community with ACT >24 hours 5-14y_X": "maltreat_ov24_5_14_com",
+    "Malaria treated in community with ACT <24 hours 15+y_X": "maltreat_u24_ov15_com",
+    "Malaria treated in community with ACT >24 hours 15+y_X": "maltreat_ov24_ov15_com",
+    "Malaria treated with ACT <24 hours 0-59m_X": "maltreat_u24_u5_hf",
+    "Malaria treated with ACT >24 hours 0-59m_X": "maltreat_ov24_u5_hf",
+    "Malaria treated with ACT <24 hours 5-14y_X": "maltreat_u24_5_14_hf",
+    "Malaria treated with ACT >24 hours 5-14y_X": "maltreat_ov24_5_14_hf",
+    "Malaria treated with ACT <24 hours 15+y_X": "maltreat_u24_ov15_hf",
+    "Malaria treated with ACT >24 hours 15+y_X": "maltreat_ov24_ov15_hf"
+}
+
+RENAME_MAP = {**ORGUNIT_RENAME, **COLUMN_RENAME}
+
+# Period columns of the merged export, kept as they are
+PERIOD_KEYS = ['periodname', 'month', 'year', 'Date']
+
+
+def build_read_plan(header, rename_map=RENAME_MAP, keys=PERIOD_KEYS):
+    """Return (usecols, categorical, numeric) for reading only the mapped columns of an export."""
+    usecols = [c for c in header if c in rename_map or c in keys]
+    categorical = [c for c in usecols if c in ORGUNIT_RENAME]
+    numeric = [c for c in usecols if c in COLUMN_RENAME]
+    return usecols, categorical, numeric
+
+
+def read_planned(file, rename_map=RENAME_MAP):
+    """Read an uploaded CSV/XLSX/XLS export through the read plan and rename it.
+
+    Unmapped columns are skipped by the parser. Admin/facility names are
+    read as categoricals and data elements end up float64, the same numeric
+    dtype the streaming merge writes.
+    """
+    usecols, categorical, numeric = build_read_plan(read_header(file), rename_map)
+    df = load_upload(file, usecols=usecols, dtype={column: 'category' for column in categorical})
+    for column in numeric:
+        if df[column].dtype != 'float64':
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    return df.rename(columns=rename_map)
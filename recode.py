@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from expressions import ExpressionBatch
+
+
+def parse_literal(text):
+    """Turn a value typed in a text box into a number when it looks like one."""
+    text = str(text).strip()
+    try:
+        number = float(text)
+    except ValueError:
+        return text.strip('"\'')
+    return int(number) if number.is_integer() and '.' not in text else number
+
+
+def is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def take_labels(labels, codes, index):
+    """Build the recoded column from one label per code without a per-row Python loop.
+
+    All-numeric labels stay numeric: int64 when every label is a whole
+    integer, float64 otherwise (None becomes NaN). Any text label gives an
+    object column in which each label keeps its own type, so 1 stays 1
+    next to 'High', as Series.replace would leave it.
+    """
+    if all(is_number(label) or label is None for label in labels):
+        if all(isinstance(label, (int, np.integer)) for label in labels):
+            return pd.Series(np.array(labels, dtype='int64')[codes], index=index)
+        values = np.array([np.nan if label is None else label for label in labels], dtype='float64')
+        return pd.Series(values[codes], index=index)
+    values = np.empty(len(labels), dtype=object)
+    values[:] = [np.nan if label is None else label for label in labels]
+    return pd.Series(values[codes], index=index, dtype=object)
+
+
+def case_when(df, branches, default=None):
+    """Recode rows with ordered (condition, value) branches, like SQL CASE WHEN.
+
+    Conditions use DataFrame.eval syntax and are evaluated together as one
+    ExpressionBatch, so a comparison shared by several branches (age >= 5
+    in "age >= 5 and age < 15" and "age >= 5") is computed once. The first
+    matching branch wins; rows matching none get `default`.
+    """
+    if not branches:
+        raise ValueError("At least one condition is needed.")
+    conditions = {f"branch_{i}": condition for i, (condition, _) in enumerate(branches)}
+    masks = ExpressionBatch(df, conditions).evaluate()
+    branch = np.select([masks[name].to_numpy(dtype=bool) for name in conditions],
+                       np.arange(len(branches)), default=len(branches))
+    return take_labels([value for _, value in branches] + [default], branch, df.index)
+
+
+def bin_values(series, edges, labels=None, right=False):
+    """Assign each value to a range; [low, high) bins by default. Returns a categorical."""
+    edges = sorted(float(edge) for edge in edges)
+    if labels is not None and len(labels) != len(edges) - 1:
+        raise ValueError(f"{len(edges) - 1} labels are needed for {len(edges)} bin edges.")
+    values = pd.to_numeric(series, errors='coerce')
+    return pd.cut(values, bins=edges, labels=labels, right=right, include_lowest=True)
+
+
+def lookup(series, table, default=None, keep_unmatched=True):
+    """Map values through a lookup table, touching each distinct value once.
+
+    Keys typed as text are matched against numeric columns as numbers.
+    Unmatched values are kept (like Series.replace) unless keep_unmatched
+    is False, in which case they get `default`.
+    """
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        table = {parse_literal(key) if isinstance(key, str) else key: value for key, value in table.items()}
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    labels = [table.get(value, value if keep_unmatched else default) for value in uniques]
+    if (codes == -1).any():
+        # Missing values (code -1) pick the last label
+        labels.append(None if keep_unmatched else default)
+    return take_labels(labels, codes, series.index)
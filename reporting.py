@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from facility_activity import CLOSURE_MONTHS, GAP_MONTHS, FacilityActivity
+
+# A facility-month counts as reported when any of these is non-zero
+KEY_VARIABLES = ['susp', 'test', 'conf', 'maltreat']
+
+WARDS = ['Inpatient', 'Outpatient']
+
+
+def ward_types(hf):
+    """'Inpatient' for facilities whose name ends in 'Hospital', else 'Outpatient'.
+
+    The rule is applied once per distinct name, not once per row.
+    """
+    codes, names = pd.factorize(hf)
+    inpatient = np.array([str(name).split()[-1:] == ['Hospital'] for name in names] + [False])
+    return pd.Categorical.from_codes(np.where(inpatient[codes], 0, 1), WARDS)
+
+
+def reporting_status(df0, key_variables=KEY_VARIABLES, facility='hf_uid', period='YM',
+                     gap_months=GAP_MONTHS, closure_months=CLOSURE_MONTHS):
+    """Add the reporting-status columns of every facility-month to df0, in one pass.
+
+    Adds `key_variables` (sum of the key variables, 0 when all are missing),
+    `reported` (1 when that sum is non-zero), `first_month_reported`,
+    `reported_detail` (0.5 for a month not reported after the facility's
+    first report), `hf_activity` (see FacilityActivity), `hf_active`
+    (True for 'Active' months, so long gaps and closures leave the
+    denominators) and `hf_wards`. Returns df0 and the FacilityActivity
+    summary of every facility (first and last report, gaps, closure).
+    """
+    key = df0[key_variables].sum(axis=1, skipna=True, min_count=1).fillna(0)
+    df0.insert(len(df0.columns), 'key_variables', key)
+    reported = np.where(key.to_numpy() == 0, 0, 1)
+    df0.insert(len(df0.columns), 'reported', reported)
+
+    # Reported months only; the grouped min gives each facility's first report
+    first = df0[period].where(reported == 1).groupby(df0[facility], observed=True).transform('min')
+    df0.insert(len(df0.columns), 'first_month_reported', first)
+
+    after_first = (df0[period] > first).to_numpy(dtype=bool, na_value=False)
+    df0.insert(len(df0.columns), 'reported_detail', np.where((reported == 0) & after_first, 0.5, reported))
+
+    activity = FacilityActivity.from_frame(df0, reported == 1, facility, period,
+                                           gap_months=gap_months, closure_months=closure_months)
+    states = activity.row_states()
+    df0.insert(len(df0.columns), 'hf_activity', states)
+    df0.insert(len(df0.columns), 'hf_active', states == 'Active')
+    df0.insert(len(df0.columns), 'hf_wards', ward_types(df0['hf']))
+    return df0, activity.summary()
+
+
+def active_denominators(df0, period='YM'):
+    """Active facilities per month for each ward type, from one grouped sum.
+
+    'Outpatient' counts every facility and 'Inpatient' hospitals only, as
+    {ward: frame of (period, denominator)}. Months without any hospital row
+    are left out of the Inpatient frame.
+    """
+    active = df0['hf_active'].to_numpy(dtype=bool)
+    inpatient = (df0['hf_wards'] == 'Inpatient').to_numpy()
+    counts = pd.DataFrame({
+        'Outpatient': active,
+        'Inpatient': active & inpatient,
+        'hospital_rows': inpatient,
+    }, index=df0.index).groupby(df0[period], observed=True).sum()
+    return {
+        'Inpatient': counts.loc[counts['hospital_rows'] > 0, ['Inpatient']]
+                           .rename(columns={'Inpatient': 'denominator'}).reset_index(),
+        'Outpatient': counts[['Outpatient']].rename(columns={'Outpatient': 'denominator'}).reset_index(),
+    }
+
+
+def area_denominators(df0, area='adm3_uid', period='YM', facility='hf_uid'):
+    """Facility denominators of every (area, month) in one grouped table.
+
+    `active` is the number of active facilities of the area that month;
+    `all` is the number of distinct facilities the area ever had. Indexed
+    by (area, period), ready to be joined onto any per-area-month table.
+    """
+    grouped = df0.groupby([area, period], observed=True)
+    table = grouped['hf_active'].sum().to_frame('active')
+    totals = df0.groupby(area, observed=True)[facility].nunique()
+    table['all'] = totals.reindex(table.index.get_level_values(area)).to_numpy()
+    return table
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from outliers import OUTLIER_LABELS
+
+# Scales a median absolute deviation to a standard deviation for normal data
+MAD_SCALE = 1.4826
+
+ROBUST_METHODS = ['hampel', 'seasonal']
+
+
+def nan_median(values, axis=-1):
+    """Median along one axis ignoring NaN, by one sort instead of a Python loop.
+
+    NaN sorts last, so the median of the n valid values sits at positions
+    (n - 1) // 2 and n // 2. All-NaN slices give NaN.
+    """
+    ordered = np.sort(np.moveaxis(values, axis, -1), axis=-1)
+    valid = (~np.isnan(ordered)).sum(axis=-1)
+    low = np.take_along_axis(ordered, np.maximum((valid - 1) // 2, 0)[..., None], axis=-1)[..., 0]
+    high = np.take_along_axis(ordered, (valid // 2)[..., None], axis=-1)[..., 0]
+    return np.where(valid > 0, (low + high) / 2, np.nan)
+
+
+def rolling_nan_median(matrix, window):
+    """Centered rolling median of every row of a (series x months) matrix, ignoring NaN."""
+    before = window // 2
+    padded = np.pad(matrix, ((0, 0), (before, window - 1 - before)), constant_values=np.nan)
+    return nan_median(sliding_window_view(padded, window, axis=1))
+
+
+def facility_month_matrix(df, column, facility='hf_uid', year='year', month='month'):
+    """Lay one column out as a (facility x month) matrix over the full calendar range.
+
+    Months a facility did not report are NaN; several rows for the same
+    facility and month are averaged. Returns the matrix, the facility
+    labels, the year of the first column and the (row, column) cell of
+    every row of df (-1 for rows with a missing or non-numeric key).
+    """
+    rows, facilities = pd.factorize(df[facility])
+    years = pd.to_numeric(df[year], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    months = pd.to_numeric(df[month], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    stamps = years * 12 + months - 1
+    # Keys are checked after coercion, so a year or month such as 'Jan' counts as missing
+    valid = (rows >= 0) & ~np.isnan(stamps)
+    first = np.nanmin(stamps[valid]) if valid.any() else 0
+    # Start on a January so that column j is calendar month j % 12
+    first = first - first % 12
+    cols = np.where(valid, stamps - first, -1).astype('int64')
+    rows = np.where(valid, rows, -1)
+    width = int(cols.max()) + 1 if valid.any() else 0
+    width += -width % 12
+
+    values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    present = valid & ~np.isnan(values)
+    totals = np.zeros((len(facilities), width))
+    counts = np.zeros((len(facilities), width))
+    np.add.at(totals, (rows[present], cols[present]), values[present])
+    np.add.at(counts, (rows[present], cols[present]), 1)
+    with np.errstate(invalid='ignore'):
+        matrix = totals / counts
+    return matrix, facilities, int(first // 12), (rows, cols)
+
+
+def robust_scale(deviations, min_scale):
+    """MAD-based standard deviation of each row, floored at min_scale."""
+    scale = MAD_SCALE * nan_median(np.abs(deviations - nan_median(deviations)[:, None]))
+    return np.fmax(scale, min_scale)
+
+
+def hampel_matrix(matrix, window=7, k=3.0, min_scale=1.0, min_periods=3):
+    """Hampel filter of every series at once.
+
+    Each value is compared with the median of the centered window around
+    it and flagged when it is more than k scaled MADs away. The scale is
+    floored at min_scale so that sparse count series with a MAD of zero
+    do not flag every non-zero month. Returns (expected, score, flag).
+    """
+    if matrix.shape[1] == 0:
+        return matrix, matrix, np.zeros(matrix.shape, dtype=bool)
+    before = window // 2
+    padded = np.pad(matrix, ((0, 0), (before, window - 1 - before)), constant_values=np.nan)
+    windows = sliding_window_view(padded, window, axis=1)
+    median = nan_median(windows)
+    mad = nan_median(np.abs(windows - median[..., None]))
+    enough = (~np.isnan(windows)).sum(axis=-1) >= min_periods
+    scale = np.fmax(MAD_SCALE * mad, min_scale)
+    score = (matrix - median) / scale
+    flag = enough & (np.abs(score) > k)
+    return median, score, flag
+
+
+def level_trend(matrix, window=13):
+    """Rolling median of every row, with windows shifted inward at both ends.
+
+    Truncated windows at the first and last months would hold only part of
+    the seasonal cycle; shifting them keeps a whole year in every window.
+    """
+    window = min(window, matrix.shape[1])
+    medians = nan_median(sliding_window_view(matrix, window, axis=1))
+    start = np.clip(np.arange(matrix.shape[1]) - window // 2, 0, matrix.shape[1] - window)
+    return medians[:, start]
+
+
+def seasonal_matrix(matrix, k=3.5, trend_window=13, min_scale=1.0, stabilize=True):
+    """Seasonal-residual detector of every series at once.
+
+    The trend is a rolling median over a year; the seasonal component is
+    the median, per facility and calendar month, of the detrended values
+    over all years. Residuals left after removing both are flagged when
+    they are more than k scaled MADs of the facility's residuals away from
+    zero. With `stabilize`, counts go through the Anscombe transform
+    2 * sqrt(x + 3/8), under which Poisson noise has unit variance whatever
+    the season, so min_scale is one noise unit. Columns must start on a
+    January and span whole years, as facility_month_matrix lays them out.
+    Returns (expected, score, flag).
+    """
+    values = 2 * np.sqrt(np.clip(matrix, 0, None) + 3 / 8) if stabilize else matrix
+    series, width = values.shape
+    if width == 0:
+        return values, values, np.zeros(values.shape, dtype=bool)
+    trend = level_trend(values, trend_window)
+    by_month = (values - trend).reshape(series, width // 12, 12)
+    expected = trend + np.tile(nan_median(by_month, axis=1), width // 12)
+    residual = values - expected
+    score = residual / robust_scale(residual, min_scale)[:, None]
+    flag = np.abs(score) > k
+    if stabilize:
+        expected = np.fmax(np.clip(expected / 2, 0, None) ** 2 - 3 / 8, 0)
+    return expected, score, flag
+
+
+def robust_outliers(df, column, method='hampel', facility='hf_uid', year='year', month='month', **options):
+    """Flag outliers of one column with a robust detector over all facility series.
+
+    Returns a frame aligned with df holding `<col>_expected` (the robust
+    reference value), `<col>_score` (distance from it in scaled MADs) and
+    `<col>_category` ('Outlier'/'Non-Outlier'). Rows with a missing key or
+    value are never flagged.
+    """
+    if method not in ROBUST_METHODS:
+        raise ValueError(f"Unknown robust method '{method}'; use one of {ROBUST_METHODS}.")
+    matrix, _, _, (rows, cols) = facility_month_matrix(df, column, facility, year, month)
+    detector = hampel_matrix if method == 'hampel' else seasonal_matrix
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected, score, flag = detector(matrix, **options)
+
+    placed = rows >= 0
+    out_expected = np.full(len(df), np.nan)
+    out_score = np.full(len(df), np.nan)
+    out_flag = np.zeros(len(df), dtype=bool)
+    out_expected[placed] = expected[rows[placed], cols[placed]]
+    out_score[placed] = score[rows[placed], cols[placed]]
+    out_flag[placed] = flag[rows[placed], cols[placed]]
+    out_flag &= pd.to_numeric(df[column], errors='coerce').notna().to_numpy()
+    return pd.DataFrame({
+        f'{column}_expected': out_expected,
+        f'{column}_score': out_score,
+        f'{column}_category': pd.Categorical.from_codes(out_flag.astype('int8'), OUTLIER_LABELS),
+    }, index=df.index)
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+# Finest grain of the routine HMIS data
+CUBE_KEYS = ['adm1', 'adm2', 'adm3', 'hf_uid', 'year', 'month']
+
+# Aggregations that can be rolled up from the per-cell measures
+CUBE_OPERATIONS = {'count', 'sum', 'mean', 'std', 'var', 'min', 'max'}
+
+
+class AggregationCube:
+    """Additive measures of a routine frame precomputed per (adm1, ..., month) cell.
+
+    Each cell keeps, per numeric column, the non-null count, sum, sum of
+    squared deviations from the cell mean, min and max. Any coarser level
+    (national, district, chiefdom, facility, year...) is rolled up from the
+    cells on demand and cached, so it never scans the raw rows again.
+    """
+
+    def __init__(self, df, keys=CUBE_KEYS, measures=None):
+        self.keys = [key for key in keys if key in df.columns]
+        if not self.keys:
+            raise ValueError(f"None of the cube keys {keys} are in the data.")
+        if measures is None:
+            measures = [c for c in df.select_dtypes(include='number').columns
+                        if c not in self.keys and not pd.api.types.is_bool_dtype(df[c])]
+        self.measures = list(measures)
+
+        values = df[self.measures].astype('float64')
+        grouped = values.groupby([df[key] for key in self.keys], observed=True, dropna=False, sort=False)
+        n = grouped.count()
+        self.cells = {
+            'n': n,
+            'sum': grouped.sum(),
+            'm2': (grouped.var(ddof=0) * n).fillna(0),
+            'min': grouped.min(),
+            'max': grouped.max(),
+        }
+        self.rows = len(df)
+        self._rollups = {}
+
+    def supports(self, by, agg_dict):
+        """True if the aggregation can be answered from the cube."""
+        return (bool(by) and set(by) <= set(self.keys)
+                and all(column in self.measures for column in agg_dict)
+                and all(set(ops) <= CUBE_OPERATIONS for ops in agg_dict.values()))
+
+    def rollup(self, by):
+        """Per-group n, sum, m2, min and max at the level `by`, cached per level."""
+        by = tuple(by)
+        if by not in self._rollups:
+            cells = self.cells
+            grouped = lambda frame: frame.groupby(level=list(by), observed=True)
+            n = grouped(cells['n']).sum()
+            total = grouped(cells['sum']).sum()
+            # Combine cell variances: within-cell m2 plus n * (cell mean - group mean)^2
+            group_mean = grouped(cells['sum']).transform('sum') / grouped(cells['n']).transform('sum')
+            cell_mean = cells['sum'] / cells['n']
+            spread = (cells['n'] * (cell_mean - group_mean) ** 2).fillna(0)
+            self._rollups[by] = {
+                'n': n,
+                'sum': total,
+                'm2': grouped(cells['m2'] + spread).sum(),
+                'min': grouped(cells['min']).min(),
+                'max': grouped(cells['max']).max(),
+            }
+        return self._rollups[by]
+
+    def aggregate(self, by, agg_dict):
+        """Same result as df.groupby(by, observed=True).agg(agg_dict) for cube operations."""
+        level = self.rollup(by)
+        n = level['n']
+        results = {}
+        for column, operations in agg_dict.items():
+            for op in operations:
+                if op == 'count':
+                    values = n[column].astype('int64')
+                elif op == 'sum':
+                    values = level['sum'][column]
+                elif op == 'mean':
+                    values = level['sum'][column] / n[column].where(n[column] > 0)
+                elif op in ('std', 'var'):
+                    values = level['m2'][column] / (n[column] - 1).where(n[column] > 1)
+                    values = np.sqrt(values) if op == 'std' else values
+                elif op in ('min', 'max'):
+                    values = level[op][column]
+                else:
+                    raise ValueError(f"Operation '{op}' cannot be computed from the cube.")
+                results[(column, op)] = values
+        return pd.DataFrame(results)
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from periods import factorize_periods
+
+# Admin and facility identifiers of the routine HMIS frame
+ID_COLUMNS = [
+    'adm0', 'adm1', 'adm2', 'adm3', 'hf', 'hf_uid', 'adm3_uid',
+    'orgunitlevel1', 'orgunitlevel2', 'orgunitlevel3', 'orgunitlevel4', 'orgunitlevel5',
+    'organisationunitname'
+]
+
+# Period label columns turned into period[M]
+PERIOD_COLUMNS = ['Date', 'YM']
+
+INT32 = np.iinfo(np.int32)
+
+
+def integer_dtype(series):
+    """Return 'Int32' (or 'Int64' for very large values) for an integral numeric column.
+
+    Columns with fractional values return None and are left alone. Counts
+    are not packed below 32 bits so that sums and user expressions on them
+    cannot silently overflow.
+    """
+    values = series.to_numpy(dtype='float64', na_value=np.nan)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return 'Int32'
+    if not np.array_equal(values, np.floor(values)):
+        return None
+    if INT32.min <= values.min() and values.max() <= INT32.max:
+        return 'Int32'
+    return 'Int64'
+
+
+def to_period_column(series):
+    """Convert a 'YYYY-MM' label column to period[M], or return None if it does not parse."""
+    if series.dtype.kind == 'M':
+        return series.dt.to_period('M')
+    try:
+        codes, periods = factorize_periods(series)
+    except ValueError:
+        return None
+    if periods.freqstr[0] != 'M' or periods.isna().any():
+        return None
+    return pd.Series(periods.take(codes, allow_fill=True, fill_value=pd.NaT), index=series.index)
+
+
+def compact_routine_frame(df):
+    """Downcast a routine HMIS frame to a compact dtype profile.
+
+    Admin/facility identifiers become categoricals, integral count columns
+    become nullable Int32, and `Date`/`YM` labels become period[M]. Every
+    groupby, pivot_table or crosstab on the categorical ids must pass
+    observed=True: pandas 2.1+ defaults to observed=False, which would add a
+    row for every unseen combination of categories. Returns
+    (compact_df, report) where report holds the memory use in bytes before
+    and after and the new dtype of each changed column.
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    df = df.copy(deep=False)
+    changes = {}
+
+    for column in df.columns:
+        series = df[column]
+        if column in ID_COLUMNS:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                df[column] = series.astype('category')
+        elif column in PERIOD_COLUMNS:
+            if not isinstance(series.dtype, pd.PeriodDtype):
+                converted = to_period_column(series)
+                if converted is not None:
+                    df[column] = converted
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            dtype = integer_dtype(series)
+            if dtype is not None and dtype != str(series.dtype):
+                df[column] = series.astype(dtype)
+        else:
+            continue
+        if df[column].dtype != series.dtype:
+            changes[column] = str(df[column].dtype)
+
+    after = int(df.memory_usage(deep=True).sum())
+    return df, {'before': before, 'after': after, 'changes': changes}
+
+
+def format_memory_report(report):
+    """One-line human readable summary of a compact_routine_frame report."""
+    before_mb = report['before'] / 1024 ** 2
+    after_mb = report['after'] / 1024 ** 2
+    saved = 100 * (1 - report['after'] / report['before']) if report['before'] else 0
+    return (f"Memory: {before_mb:,.1f} MB → {after_mb:,.1f} MB ({saved:.0f}% smaller, "
+            f"{len(report['changes'])} columns downcast)")
@@ -0,0 +1,383 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from periods import add_period_columns
+
+# Columns dropped once the period has been split into month/year/Date
+DROP_AFTER_MERGE = ['periodname', 'orgunitlevel5']
+
+DEFAULT_CHUNKSIZE = 50_000
+
+# Parsed uploads are kept here as uncompressed Feather files, keyed by content hash
+CACHE_DIR = os.environ.get('ROUTINE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'routine_parse_cache'))
+CACHE_MAX_BYTES = int(os.environ.get('ROUTINE_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+
+def file_type(name):
+    """Return the lower-case extension of an uploaded file name."""
+    return name.split('.')[-1].lower()
+
+
+def read_header(file, name=None):
+    """Read only the column names of a CSV/XLSX/XLS file."""
+    name = name or file.name
+    kind = file_type(name)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    if kind == 'csv':
+        columns = list(pd.read_csv(file, nrows=0).columns)
+    elif kind == 'xlsx':
+        from openpyxl import load_workbook
+        wb = load_workbook(file, read_only=True, data_only=True)
+        try:
+            first_row = next(wb.active.iter_rows(max_row=1, values_only=True), ())
+            columns = [c for c in first_row if c is not None]
+        finally:
+            wb.close()
+    elif kind == 'xls':
+        columns = list(pd.read_excel(file, engine='xlrd', nrows=0).columns)
+    else:
+        raise ValueError(f"Unsupported file type: {kind}")
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return columns
+
+
+def check_schemas(files):
+    """Compare the headers of every file against the first one.
+
+    Returns the reference column list and a dict of
+    {file name: set of mismatched columns} for files that differ.
+    """
+    reference_columns = None
+    mismatches = {}
+    for file in files:
+        columns = read_header(file)
+        if reference_columns is None:
+            reference_columns = columns
+        elif columns != reference_columns:
+            mismatches[file.name] = set(columns).symmetric_difference(reference_columns)
+    return reference_columns, mismatches
+
+
+def column_profile(df, columns):
+    """{column: [non-blank values, numeric values, whole numbers, blanks]} of one text chunk.
+
+    Profiles of chunks and files add up, so the type of a column can be
+    decided once every row has been seen (profile_kinds).
+    """
+    profile = {}
+    for column in columns:
+        if column not in df.columns:
+            continue
+        values = df[column].dropna()
+        numbers = pd.to_numeric(values, errors='coerce')
+        profile[column] = [len(values), int(numbers.notna().sum()), int((numbers % 1 == 0).sum()),
+                           len(df) - len(values)]
+    return profile
+
+
+def add_profiles(total, profile):
+    for column, counts in profile.items():
+        total[column] = [a + b for a, b in zip(total.get(column, [0, 0, 0, 0]), counts)]
+    return total
+
+
+def profile_kinds(profile):
+    """{column: 'text' | 'integer' | 'float'} from the profile of every row of every file.
+
+    A column is numeric only when every value parses as a number, so names,
+    codes and period descriptions stay text whatever they are called, and
+    no value is ever coerced away. Whole numbers without blanks (period ids)
+    stay integers, as pandas would read them in memory.
+    """
+    kinds = {}
+    for column, (values, numbers, whole, blanks) in profile.items():
+        if numbers < values:
+            kinds[column] = 'text'
+        elif values and whole == values and not blanks:
+            kinds[column] = 'integer'
+        else:
+            kinds[column] = 'float'
+    return kinds
+
+
+def split_periodname(df):
+    """Add month/year/Date from a DHIS2 'January 2023' periodname column."""
+    df = add_period_columns(df, 'periodname').drop(columns=['period'])
+    df['month'] = df['month'].astype('string')
+    df['Date'] = df['Date'].astype('string')
+    return df
+
+
+def normalize_chunk(df, columns):
+    """Give a raw chunk an all-text schema so every chunk can share one Parquet part file.
+
+    Blank cells become missing. Types are only given once every part is
+    written (cast_chunk).
+    """
+    df = df.reindex(columns=columns)
+    for column in columns:
+        text = df[column].astype('string').str.strip()
+        df[column] = text.where(text != '')
+    if 'periodname' in df.columns:
+        df = split_periodname(df)
+    return df.drop(columns=DROP_AFTER_MERGE, errors='ignore')
+
+
+def cast_chunk(df, kinds):
+    """Cast the text columns of a merged chunk to the types of profile_kinds."""
+    for column, kind in kinds.items():
+        if kind != 'text' and column in df.columns:
+            df[column] = pd.to_numeric(df[column]).astype('Int64' if kind == 'integer' else 'float64')
+    return df
+
+
+def iter_chunks(path, name, chunksize):
+    """Yield raw DataFrame chunks from a CSV/XLSX/XLS file on disk."""
+    kind = file_type(name)
+    if kind == 'csv':
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=str)
+    elif kind == 'xlsx':
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            buffer = []
+            for row in rows:
+                buffer.append(row)
+                if len(buffer) >= chunksize:
+                    yield pd.DataFrame(buffer, columns=header)
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=header)
+        finally:
+            wb.close()
+    elif kind == 'xls':
+        df = pd.read_excel(path, engine='xlrd')
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+    else:
+        raise ValueError(f"Unsupported file type: {kind}")
+
+
+def parse_file_to_parquet(path, name, columns, out_path, chunksize=DEFAULT_CHUNKSIZE):
+    """Worker: stream one export as text into its own Parquet part file.
+
+    Only one chunk is held in memory at a time. Returns (name, rows,
+    column profile).
+    """
+    writer = None
+    rows = 0
+    profile = {}
+    try:
+        for chunk in iter_chunks(path, name, chunksize):
+            chunk = normalize_chunk(chunk, columns)
+            add_profiles(profile, column_profile(chunk, columns))
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out_path, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return name, rows, profile
+
+
+def spool_uploads(files, directory):
+    """Write uploaded files to disk so worker processes can read them by path."""
+    paths = []
+    for i, file in enumerate(files):
+        path = os.path.join(directory, f"{i:04d}_{os.path.basename(file.name)}")
+        file.seek(0)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(file, f)
+        file.seek(0)
+        paths.append(path)
+    return paths
+
+
+def merge_routine_files(files, out_path, chunksize=DEFAULT_CHUNKSIZE, max_workers=None, progress=None):
+    """Merge DHIS2 exports into one Parquet file without loading them all at once.
+
+    Headers are validated before any file is parsed. Files are then parsed
+    as text in a process pool, each streaming its chunks into a part file
+    and profiling its columns. The profiles of all rows decide the type of
+    each column (profile_kinds), and the parts are concatenated and cast
+    row-group by row-group in upload order.
+    `progress(done, total, name)` is called as each file finishes.
+    Returns the total number of rows written.
+    """
+    if not files:
+        raise ValueError("No files to merge.")
+
+    reference_columns, mismatches = check_schemas(files)
+    if mismatches:
+        details = "; ".join(f"{name}: {sorted(map(str, cols))}" for name, cols in mismatches.items())
+        raise ValueError(f"Column mismatch in {details}")
+
+    work_dir = tempfile.mkdtemp(prefix='routine_merge_')
+    try:
+        paths = spool_uploads(files, work_dir)
+        parts = [f"{path}.parquet" for path in paths]
+        # Spawned, not forked: forking the threaded Streamlit server can copy locks held by other threads
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context('spawn')) as executor:
+            futures = {
+                executor.submit(parse_file_to_parquet, path, file.name, reference_columns, part, chunksize): file.name
+                for path, part, file in zip(paths, parts, files)
+            }
+            profile = {}
+            for done, future in enumerate(as_completed(futures), start=1):
+                name = futures[future]
+                try:
+                    add_profiles(profile, future.result()[2])
+                except Exception as e:
+                    raise ValueError(f"Error reading file {name}: {e}") from e
+                if progress is not None:
+                    progress(done, len(files), name)
+
+        kinds = profile_kinds(profile)
+        writer = None
+        total = 0
+        try:
+            for part in parts:
+                if not os.path.exists(part):
+                    continue
+                parquet_file = pq.ParquetFile(part)
+                for i in range(parquet_file.num_row_groups):
+                    chunk = cast_chunk(parquet_file.read_row_group(i).to_pandas(), kinds)
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(out_path, table.schema)
+                    writer.write_table(table.cast(writer.schema))
+                    total += table.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        return total
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def parquet_to_csv(parquet_path, csv_path, batch_size=DEFAULT_CHUNKSIZE):
+    """Stream a Parquet file into CSV one batch at a time."""
+    parquet_file = pq.ParquetFile(parquet_path)
+    header = True
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            batch.to_pandas().to_csv(f, index=False, header=header)
+            header = False
+
+
+def preview_parquet(parquet_path, rows=1000):
+    """Return the first rows of a Parquet file without reading the rest."""
+    parquet_file = pq.ParquetFile(parquet_path)
+    batch = next(parquet_file.iter_batches(batch_size=rows), None)
+    if batch is None:
+        return pd.DataFrame(columns=parquet_file.schema_arrow.names)
+    return batch.to_pandas()
+
+
+def fingerprint(file, block_size=1 << 20):
+    """Hash the bytes of an uploaded file (or any binary file object)."""
+    digest = hashlib.blake2b(digest_size=20)
+    file.seek(0)
+    for block in iter(lambda: file.read(block_size), b''):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def read_upload(file, **read_kwargs):
+    """Parse an uploaded CSV/XLSX/XLS/Parquet file with pandas."""
+    kind = file_type(file.name)
+    file.seek(0)
+    if kind == 'csv':
+        return pd.read_csv(file, **read_kwargs)
+    elif kind in ['xlsx', 'xls']:
+        read_kwargs.setdefault('engine', 'openpyxl' if kind == 'xlsx' else 'xlrd')
+        return pd.read_excel(file, **read_kwargs)
+    elif kind == 'parquet':
+        return pd.read_parquet(file, **read_kwargs)
+    else:
+        raise ValueError(f"Unsupported file type: {kind}")
+
+
+def cache_key(file, read_kwargs):
+    """Combine the content hash with the read options that shape the result."""
+    options = repr(sorted((k, repr(v)) for k, v in read_kwargs.items()))
+    return hashlib.blake2b(f"{fingerprint(file)}|{options}".encode(), digest_size=20).hexdigest()
+
+
+def evict_cache(max_bytes=CACHE_MAX_BYTES, directory=CACHE_DIR, suffix='.feather'):
+    """Delete least recently used cache files (by suffix) until the cache fits in max_bytes."""
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(suffix):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def load_upload(file, **read_kwargs):
+    """Load an uploaded file, parsing each distinct file only once.
+
+    The parsed frame is stored on disk as Feather under a hash of the file
+    bytes and read options. Reruns, page switches and other sessions that
+    upload the same bytes get a memory-mapped load instead of a re-parse.
+    Least recently used entries are evicted beyond CACHE_MAX_BYTES.
+    """
+    return load_upload_keyed(file, **read_kwargs)[0]
+
+
+def load_upload_keyed(file, **read_kwargs):
+    """load_upload that also returns the cache key of the file and read options.
+
+    Pages that key results derived from the upload (session caches, saved
+    cubes) use this key instead of hashing the file a second time.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    key = cache_key(file, read_kwargs)
+    path = os.path.join(CACHE_DIR, f"{key}.feather")
+
+    if os.path.exists(path):
+        try:
+            df = feather.read_table(path, memory_map=True).to_pandas()
+            os.utime(path)
+            return df, key
+        except (OSError, pa.ArrowException):
+            os.remove(path)
+
+    df = read_upload(file, **read_kwargs)
+
+    # Frames Arrow cannot represent (mixed-type or non-string headers) are just not cached
+    # One temporary file per writer; sessions are threads of one process and may cache the same upload at once
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=f"{key}.", suffix='.tmp')
+    os.close(fd)
+    try:
+        feather.write_feather(df, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+        evict_cache()
+    except (ValueError, TypeError, OSError, pa.ArrowException):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return df, key
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+# Filter specs are small nested tuples, so a saved filter never holds rows:
+#   ('cond', column, op, value)   op in 'between', '==', '>', '<', 'isin'
+#   ('query', expression)         a DataFrame.query expression
+#   ('and', [specs]), ('or', [specs]), ('not', spec)
+
+# Raised when a saved spec meets data whose columns were renamed, dropped or retyped since
+STALE_FILTER_ERRORS = (KeyError, NameError, ValueError, TypeError)
+
+
+def condition_mask(df, column, op, value):
+    """Boolean row mask of one column condition; missing values never match."""
+    series = df[column]
+    if op == 'between':
+        low, high = value
+        mask = (series >= low) & (series <= high)
+    elif op == '==':
+        mask = series == value
+    elif op == '>':
+        mask = series > value
+    elif op == '<':
+        mask = series < value
+    elif op == 'isin':
+        mask = series.isin(value)
+    else:
+        raise ValueError(f"Unknown filter operator: {op}")
+    return pd.Series(mask, index=df.index).fillna(False).to_numpy(dtype=bool)
+
+
+def query_mask(df, expression):
+    """Boolean row mask of a DataFrame.query expression, without building the filtered frame."""
+    result = df.eval(expression)
+    if not (isinstance(result, pd.Series) and pd.api.types.is_bool_dtype(result.dtype)):
+        raise ValueError("Query must evaluate to True/False for each row.")
+    return result.fillna(False).to_numpy(dtype=bool)
+
+
+def evaluate(spec, df):
+    """Evaluate a filter spec to a boolean numpy mask over the rows of df."""
+    kind = spec[0]
+    if kind == 'cond':
+        return condition_mask(df, *spec[1:])
+    if kind == 'query':
+        return query_mask(df, spec[1])
+    if kind == 'not':
+        return ~evaluate(spec[1], df)
+    if kind in ('and', 'or'):
+        combine = np.logical_and if kind == 'and' else np.logical_or
+        mask = np.full(len(df), kind == 'and')
+        for part in spec[1]:
+            mask = combine(mask, evaluate(part, df))
+        return mask
+    raise ValueError(f"Unknown filter spec: {kind}")
+
+
+def combine_specs(op, specs):
+    """Build an 'and'/'or' spec of several specs, flattening a single spec."""
+    specs = list(specs)
+    if len(specs) == 1:
+        return specs[0]
+    return (op, specs)
+
+
+class SavedFilters:
+    """Named filters stored as specs plus a packed row bitmap.
+
+    The bitmap (one bit per row) is valid for the dataset version it was
+    built on. When the dataset changes the spec is evaluated again on first
+    use, so a filter costs a few kilobytes however many rows it selects.
+    """
+
+    def __init__(self):
+        self.filters = {}
+
+    def __contains__(self, name):
+        return name in self.filters
+
+    def __len__(self):
+        return len(self.filters)
+
+    def names(self):
+        return list(self.filters)
+
+    def description(self, name):
+        return self.filters[name]['description']
+
+    def save(self, name, spec, description, df, version, mask=None):
+        """Save a filter, reusing an already computed mask for this version."""
+        if mask is None:
+            mask = evaluate(spec, df)
+        self.filters[name] = {
+            'spec': spec,
+            'description': dict(description),
+            'version': version,
+            'rows': len(mask),
+            'bits': np.packbits(mask),
+        }
+
+    def delete(self, name):
+        del self.filters[name]
+
+    def mask(self, name, df, version):
+        """Boolean mask of a saved filter for the current dataset version."""
+        entry = self.filters[name]
+        if entry['version'] != version or entry['rows'] != len(df):
+            mask = evaluate(entry['spec'], df)
+            entry.update(version=version, rows=len(mask), bits=np.packbits(mask))
+            return mask
+        return np.unpackbits(entry['bits'], count=entry['rows']).astype(bool)
+
+    def combine(self, names, op, df, version, negate=False):
+        """Combine saved filters with AND/OR (and optionally NOT) on their bitmaps.
+
+        Returns (mask, spec); the spec can be saved as a new filter.
+        """
+        combine = np.logical_and if op == 'and' else np.logical_or
+        mask = np.full(len(df), op == 'and')
+        for name in names:
+            mask = combine(mask, self.mask(name, df, version))
+        spec = combine_specs(op, [self.filters[name]['spec'] for name in names])
+        if negate:
+            mask, spec = ~mask, ('not', spec)
+        return mask, spec
+
+    def nbytes(self):
+        return sum(entry['bits'].nbytes for entry in self.filters.values())
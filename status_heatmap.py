@@ -0,0 +1,104 @@
+from io import BytesIO
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.colors import to_rgb
+from matplotlib.patches import Patch
+
+# Facilities drawn on one page before the heatmap is split into several
+ROWS_PER_PAGE = 400
+
+# Month labels shown on the x axis at most
+MAX_X_LABELS = 48
+
+MISSING_COLOR = 'white'
+
+
+def status_image(values, levels, colors):
+    """Turn a (rows x months) status matrix into an RGB image in one lookup.
+
+    Each value takes the color of the nearest of `levels`; NaN cells are
+    white.
+    """
+    values = np.asarray(values, dtype='float64')
+    levels = np.asarray(levels, dtype='float64')
+    palette = np.array([to_rgb(c) for c in colors] + [to_rgb(MISSING_COLOR)])
+    # Midpoints between levels split the value range into one bin per level
+    index = np.searchsorted((levels[1:] + levels[:-1]) / 2, values)
+    index[np.isnan(values)] = len(levels)
+    return palette[index]
+
+
+def group_runs(labels):
+    """(label, first row, end row) of each run of equal consecutive labels."""
+    labels = np.asarray(labels, dtype=object)
+    if not len(labels):
+        return []
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    ends = np.r_[starts[1:], len(labels)]
+    return [(labels[s], int(s), int(e)) for s, e in zip(starts, ends)]
+
+
+def page_bounds(groups, rows_per_page=ROWS_PER_PAGE):
+    """Row ranges of at most rows_per_page rows, cut between groups where possible.
+
+    A group larger than a page is split across pages.
+    """
+    pages, start = [], 0
+    for _, group_start, group_end in group_runs(groups):
+        if group_end - start > rows_per_page and group_start > start:
+            pages.append((start, group_start))
+            start = group_start
+        while group_end - start > rows_per_page:
+            pages.append((start, start + rows_per_page))
+            start += rows_per_page
+    total = len(groups)
+    if start < total or not pages:
+        pages.append((start, total))
+    return pages
+
+
+def render_status_heatmap(values, groups, columns, levels, colors, labels=None, title='',
+                          ylabel='HEALTH FACILITY', rows_per_page=ROWS_PER_PAGE, dpi=100):
+    """Draw a status matrix as raster heatmap pages and return them as PNG bytes.
+
+    `values` is (rows x months), ordered so that the rows of each group
+    (district) are contiguous; `groups` labels each row with its group.
+    Each page is one imshow call with group separators and group labels at
+    the middle of their rows; pages hold at most rows_per_page rows. With
+    `labels` (one per level), a legend is added.
+    """
+    values = np.asarray(values, dtype='float64')
+    if values.size == 0:
+        return []
+    groups = np.asarray(groups, dtype=object)
+    columns = [str(c) for c in columns]
+    step = max(1, int(np.ceil(len(columns) / MAX_X_LABELS)))
+    legend = [Patch(color=c, label=l) for c, l in zip(colors, labels)] if labels else None
+
+    pages = page_bounds(groups, rows_per_page)
+    images = []
+    for number, (start, stop) in enumerate(pages, start=1):
+        rows = stop - start
+        fig, ax = plt.subplots(figsize=(16, min(4 + rows * 0.025, 24)))
+        ax.imshow(status_image(values[start:stop], levels, colors), aspect='auto', interpolation='nearest')
+
+        runs = group_runs(groups[start:stop])
+        ax.hlines([end - 0.5 for _, _, end in runs[:-1]], -0.5, len(columns) - 0.5, color='grey', linewidth=1.5)
+        ax.set_yticks([(first + end - 1) / 2 for _, first, end in runs])
+        ax.set_yticklabels([str(label) for label, _, _ in runs], fontsize=9)
+        ax.set_xticks(range(0, len(columns), step))
+        ax.set_xticklabels(columns[::step], rotation=90, fontsize=8)
+        ax.set_ylabel(ylabel)
+        page_title = title if len(pages) == 1 else f'{title} (page {number} of {len(pages)})'
+        ax.set_title(page_title)
+        if legend:
+            fig.legend(handles=legend, loc='upper right', ncol=len(legend))
+        # Leave room above the axes for the legend
+        fig.tight_layout(rect=[0, 0, 1, 0.97 if legend else 1])
+
+        buffer = BytesIO()
+        fig.savefig(buffer, format='png', dpi=dpi)
+        plt.close(fig)
+        images.append(buffer.getvalue())
+    return images
@@ -1,5 +1,11 @@
 import streamlit as st
 import pandas as pd
+from routine_io import load_upload
+from expressions import evaluate_expressions
+from recode import lookup, parse_literal
+from outliers import segmented_rolling
+from robust_outliers import robust_outliers
+from edit_history import EditHistory
 import matplotlib.pyplot as plt
 import io
 import seaborn as sns
@@ -22,8 +28,8 @@ if 'saved_df' not in st.session_state:
 if 'dfs' not in st.session_state:
     st.session_state.dfs = []
 
-if 'history' not in st.session_state:
-    st.session_state.history = []
+if 'edit_history' not in st.session_state:
+    st.session_state.edit_history = EditHistory()
 
 # Function to save updated data to session state
 #def #save_data():
@@ -32,32 +38,35 @@ if 'history' not in st.session_state:
     #else:
         #st.warning("No data available to save.")
 
-# Function to save updated data to session state and keep history for undo
+# Function to save updated data to session state and record it for undo/redo
 def save_data():
     if st.session_state.df is not None:
-        if 'history' not in st.session_state:
-            st.session_state.history = []
-
-        # Save the current state before making any changes
-        st.session_state.history.append(st.session_state.df.copy())
-
-        # Limit the history to the last 5 changes
-        if len(st.session_state.history) > 5:
-            st.session_state.history.pop(0)
-
-        st.session_state.saved_df = st.session_state.df.copy()
+        # Record the edit as a delta against the previous version
+        st.session_state.edit_history.record(st.session_state.df)
+        st.session_state.saved_df = st.session_state.df.copy(deep=False)
     else:
         st.warning("No data available to save.")
 
 
 def undo_last_action():
-    """Undo the last action by reverting to the previous state."""
-    if st.session_state.history:
-        st.session_state.df = st.session_state.history.pop()
+    previous = st.session_state.edit_history.undo()
+    if previous is not None:
+        st.session_state.df = previous
+        st.session_state.saved_df = previous.copy(deep=False)
         st.success("Last action undone.")
     else:
         st.warning("No more actions to undo.")
 
+
+def redo_last_action():
+    following = st.session_state.edit_history.redo()
+    if following is not None:
+        st.session_state.df = following
+        st.session_state.saved_df = following.copy(deep=False)
+        st.success("Last action redone.")
+    else:
+        st.warning("No more actions to redo.")
+
 # Function to check for column consistency
 def sanity_check(dfs):
     column_lengths = [len(df.columns) for df in dfs]
@@ -95,7 +104,7 @@ def correct_outliers(df, col, method):
 
     # Calculate the moving average including outliers
         window_size = st.slider("Select window size:", min_value=3, max_value=12, value=3)
-        df[f'{col}_Moving_Avg'] = df[col].rolling(window=window_size, min_periods=1, center=True).mean()
+        df[f'{col}_Moving_Avg'] = segmented_rolling(df[col], window=window_size, center=True)
 
     # Replace outliers with the moving average value
         df[f'{col}_corrected_Moving_Avg_Included_Outliers'] = df[col].where(
@@ -119,12 +128,9 @@ def correct_outliers(df, col, method):
 
         window_size = st.slider("Select window size:", min_value=3, max_value=12, value=3)
 
-        def calculate_moving_avg_excluding_outliers(series, window, lower_bound, upper_bound):
-            return series.rolling(window=window, min_periods=1, center=True).apply(
-                lambda x: np.mean(x[(x >= outlier_lower_bound) & (x <= outlier_upper_bound)])
-            )
-
-        df[f'{col}_Moving_Avg_Excluded_Outliers'] = calculate_moving_avg_excluding_outliers(df[col], window_size, lower_bound, upper_bound)
+        # Outliers are masked out of each centered window rather than filtered per window in Python
+        in_bounds = (df[col] >= outlier_lower_bound) & (df[col] <= outlier_upper_bound)
+        df[f'{col}_Moving_Avg_Excluded_Outliers'] = segmented_rolling(df[col], window=window_size, center=True, mask=in_bounds)
         df[f'{col}_corrected_Moving_Avg_Excluded_Outliers'] = np.where(
             (df[col] < outlier_lower_bound) | (df[col] > outlier_upper_bound),
             df[f'{col}_Moving_Avg_Excluded_Outliers'],
@@ -255,10 +261,7 @@ if data_management_option == "Import Dataset":
     if files:
         st.session_state.dfs = []
         for file in files:
-            if file.name.endswith(".csv"):
-                st.session_state.dfs.append(pd.read_csv(file))
-            else:
-                st.session_state.dfs.append(pd.read_excel(file))
+            st.session_state.dfs.append(load_upload(file))
         st.success("Datasets uploaded successfully!")
 
 elif data_management_option == "Sanity Checks":
@@ -336,12 +339,13 @@ elif data_management_option == "Data Cleaning":
                 new_values = st.text_input(f"New values for {column} (comma-separated)", "")
 
                 if old_values and new_values:
-                    old_values_list = old_values.split(",")
-                    new_values_list = new_values.split(",")
+                    old_values_list = [value.strip() for value in old_values.split(",")]
+                    new_values_list = [parse_literal(value) for value in new_values.split(",")]
                     recode_map = dict(zip(old_values_list, new_values_list))
 
                     if st.button("Recode"):
-                        st.session_state.df[column] = st.session_state.df[column].replace(recode_map)
+                        # One lookup per distinct value instead of a row-wise replace
+                        st.session_state.df[column] = lookup(st.session_state.df[column], recode_map)
                         st.write("Recoded Data:")
                         st.dataframe(st.session_state.df)
                         save_data()
@@ -423,13 +427,35 @@ elif data_management_option == "Data Cleaning":
                         elif not new_col_name:
                             st.error(f"Please enter a name for the new column {i+1}.")
                         else:
-                            # Safely evaluate the expression
-                            st.session_state.df[new_col_name] = st.session_state.df.eval(expression)
+                            # Column names and types are checked before anything is computed
+                            results = evaluate_expressions(st.session_state.df, {new_col_name: expression})
+                            st.session_state.df[new_col_name] = results[new_col_name]
                             st.write(f"Computed variable {i+1}:")
                             st.dataframe(st.session_state.df)
                             save_data()
                     except Exception as e:
                         st.error(f"Error computing new variable {i+1}: {e}")
+
+            # Evaluate every filled-in variable together, sharing common subexpressions
+            if num_variables > 1 and st.button("Compute All Variables"):
+                definitions = []
+                for i in range(num_variables):
+                    name = st.session_state.get(f"new_col_name_{i}")
+                    expression = st.session_state.get(f"expression_{i}")
+                    if name and expression:
+                        definitions.append((name, expression))
+                if not definitions:
+                    st.error("Please enter a name and an expression for at least one variable.")
+                else:
+                    try:
+                        results = evaluate_expressions(st.session_state.df, definitions)
+                        for name, values in results.items():
+                            st.session_state.df[name] = values
+                        st.write(f"Computed {len(results)} variables: {', '.join(results)}")
+                        st.dataframe(st.session_state.df)
+                        save_data()
+                    except Exception as e:
+                        st.error(f"Error computing new variables: {e}")
         else:
             st.warning("No dataset available. Please import and merge datasets first.")
 
@@ -514,7 +540,7 @@ elif data_management_option == "Quality Control/Checks":
 
             if column:
                 st.write("Outlier Detection Methods:")
-                method = st.selectbox("Choose method:", ["","Z-Score", "IQR", "Boxplot", "Scatterplot with Q1=25th percentile and Q3=75th percentile Lines"])
+                method = st.selectbox("Choose method:", ["","Z-Score", "IQR", "Boxplot", "Scatterplot with Q1=25th percentile and Q3=75th percentile Lines", "Hampel Filter (rolling median and MAD per facility)", "Seasonal Residual (per facility, seasonality removed)"])
 
                 def detect_outliers_z_score(df, col):
                     return df[(df[col] - df[col].mean()) / df[col].std() > 3]
@@ -542,6 +568,20 @@ elif data_management_option == "Quality Control/Checks":
                     ax.set_title(f'Boxplot for {column}')
                     st.pyplot(fig)
 
+                elif method in ("Hampel Filter (rolling median and MAD per facility)", "Seasonal Residual (per facility, seasonality removed)"):
+                    # Every facility series is laid out in one facility x month matrix and checked at once,
+                    # so seasonal peaks are judged against the facility's own months rather than a pooled IQR
+                    missing = [c for c in ['hf_uid', 'year', 'month'] if c not in st.session_state.df.columns]
+                    if missing:
+                        st.error(f"These methods need the columns: {', '.join(missing)}")
+                    else:
+                        robust_method = 'hampel' if method.startswith("Hampel") else 'seasonal'
+                        k = st.slider("Flag values more than this many scaled MADs away:", min_value=2.0, max_value=8.0, value=3.0 if robust_method == 'hampel' else 3.5, step=0.5)
+                        flags = robust_outliers(st.session_state.df, column, robust_method, k=k)
+                        outliers = pd.concat([st.session_state.df, flags], axis=1)[flags[f'{column}_category'] == 'Outlier']
+                        st.write(f"{len(outliers)} outliers detected in {outliers['hf_uid'].nunique()} facilities:")
+                        st.dataframe(outliers)
+
                 elif method == "Scatterplot with Q1=25th percentile and Q3=75th percentile Lines":
                     st.write("Scatterplot with Q1=25th percentile and Q3=75th percentile Lines:")
                     Q1 = st.session_state.df[column].quantile(0.25)
@@ -588,6 +628,9 @@ if st.session_state.df is not None:
     if st.button("Undo Last Action"):
         undo_last_action()
         st.dataframe(st.session_state.df)
+    if st.button("Redo Last Action"):
+        redo_last_action()
+        st.dataframe(st.session_state.df)
 
 
 # Always show Save and Download buttons
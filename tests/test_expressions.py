@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from expressions import evaluate_expressions, parse_definitions
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({'conf': [1.0, 2.0, 3.0], 'test': [4.0, 5.0, 9.0], 'tested cases': [2.0, 0.0, 6.0]})
+
+
+@pytest.mark.parametrize('definitions', [
+    {'conf': 'conf*2', 'y': 'conf*2'},
+    {'conf': 'conf*2', 'y': 'conf*2 + (test - conf)', 'z': 'test - conf'},
+    {'conf': 'test - conf', 'x': 'test - conf', 'y': '(test - conf) * x'},
+    {'conf': 'conf + 1', 'test': 'test - conf', 'y': 'test - conf'},
+    {'a': '`tested cases` * 2', 'b': '`tested cases` * 2 + a'},
+    {'x': 'conf*2', 'conf': 'x + 1'},
+    [('conf', 'conf*2'), ('y', 'conf + 1'), ('conf', 'conf + 1'), ('z', 'conf + 1')],
+    [('x', 'test - conf'), ('conf', 'x * 2'), ('x', 'test - conf'), ('y', 'x + conf')],
+])
+def test_reassignment_chain_matches_eval(df, definitions):
+    pairs = list(definitions.items() if isinstance(definitions, dict) else definitions)
+    results = evaluate_expressions(df, definitions)
+    expected = df.eval('\n'.join(f'{name} = {expression}' for name, expression in pairs))
+    for name, _ in pairs:
+        np.testing.assert_allclose(results[name].to_numpy(dtype='float64'), expected[name].to_numpy(dtype='float64'))
+
+
+def test_parse_definitions_keeps_redefinitions(df):
+    definitions = parse_definitions("x = conf*2\n\nconf = x + 1\nx = conf*2\n")
+    assert definitions == [('x', 'conf*2'), ('conf', 'x + 1'), ('x', 'conf*2')]
+    results = evaluate_expressions(df, definitions)
+    np.testing.assert_allclose(results['x'].to_numpy(), (df['conf'] * 2 + 1) * 2)